@@ -0,0 +1,47 @@
+import json
+import os
+
+
+def load_baseline(path):
+    if not path or not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_baseline(path, results):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def check_baseline(results, path, tolerance, higher_is_better=()):
+    """Regressions against the baseline at ``path``; a missing baseline is a failure too"""
+    baseline = load_baseline(path)
+    if baseline is None:
+        return [f"no baseline at {path}; record one with --update-baseline"]
+    return compare(results, baseline, tolerance, higher_is_better)
+
+
+def compare(results, baseline, tolerance, higher_is_better=()):
+    """Return a list of human readable regressions against the baseline.
+
+    Metrics are "lower is better" unless listed in ``higher_is_better``; a
+    metric regresses when it is worse than the baseline by more than
+    ``tolerance`` (a fraction, e.g. 0.25 for 25%).
+    """
+    regressions = []
+    for name, base in (baseline or {}).items():
+        value = results.get(name)
+        if isinstance(base, bool) or not isinstance(base, (int, float)) or not base:
+            continue
+        if not isinstance(value, (int, float)):
+            continue
+        if name in higher_is_better:
+            worse = value < base * (1 - tolerance)
+        else:
+            worse = value > base * (1 + tolerance)
+        if worse:
+            regressions.append(f"{name}: {value:.4g} vs baseline {base:.4g}")
+    return regressions
@@ -0,0 +1,236 @@
+"""End-to-end download benchmark that runs entirely offline.
+
+Starts a local media server, registers a stub yt-dlp extractor for it and
+drives DownloaderThread through ``get_video_info`` and ``run`` for a
+progressive video and a DASH video/audio pair that needs merging. Prints a
+JSON object with median extraction latency, time to first byte,
+throughput, progress signal rate and merge time per scenario plus the peak
+RSS of the process, and fails if a metric regresses against the stored
+baseline or progress signals exceed the coalescer's rate limit. Each
+scenario runs ``--warmup`` times first without being measured, so cold
+caches and imports don't count against the baseline. Without a baseline
+there is nothing to compare against and only the rate limit is checked.
+
+Needs an ffmpeg that can encode the test media: the bundled one, --ffmpeg
+or one on PATH. Results from a stand-in ffmpeg (``synthetic_media``) are
+neither compared nor recorded as the baseline.
+
+    python -m benchmarks.download [--repeat 3] [--warmup 1] [--size 64] [--baseline FILE] [--update-baseline]
+"""
+import argparse
+import json
+import os
+import re
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+from benchmarks.baseline import check_baseline, load_baseline, save_baseline
+from benchmarks.media_server import MIB, MediaServer, generate_dash_media
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BASELINE = os.path.join(ROOT, 'benchmarks', 'baselines', 'download.json')
+HIGHER_IS_BETTER = ('progressive.throughput_mib_s', 'dash.throughput_mib_s')
+# DownloaderThread's coalescer default
+MAX_SIGNAL_RATE = 4.0
+
+
+def register_stub_extractor(base_url):
+    """Make yt-dlp extract ``<base_url>/watch/<id>`` from the media server's JSON API"""
+    import yt_dlp.globals
+    from yt_dlp.extractor import import_extractors
+    from yt_dlp.extractor.common import InfoExtractor
+
+    class BenchmarkIE(InfoExtractor):
+        IE_NAME = 'benchmark'
+        _VALID_URL = re.escape(base_url) + r'/watch/(?P<id>[\w-]+)'
+
+        def _real_extract(self, url):
+            video_id = self._match_id(url)
+            data = self._download_json(f'{base_url}/api/{video_id}', video_id)
+            formats = []
+            for fmt in data['formats']:
+                fmt = dict(fmt)
+                name = fmt.pop('name')
+                segments = fmt.pop('segments', None)
+                if segments is None:
+                    fmt['url'] = f'{base_url}/media/{name}'
+                else:
+                    fmt['url'] = fmt['fragment_base_url'] = f'{base_url}/media/{name}/'
+                    fmt['fragments'] = [{'path': f'{i}.m4s'} for i in range(segments)]
+                formats.append(fmt)
+            return {'id': video_id, 'title': f'benchmark {video_id}', 'duration': 10,
+                    'formats': formats}
+
+    # Ahead of the generic extractor, which would otherwise claim the URL
+    import_extractors()
+    yt_dlp.globals.extractors.value = {'BenchmarkIE': BenchmarkIE,
+                                       **yt_dlp.globals.extractors.value}
+
+
+def run_scenario(app, url, save_path, merged):
+    """Download ``url`` once through DownloaderThread and return its metrics"""
+    from src.core.downloader import DownloaderThread
+
+    thread = DownloaderThread(url, save_path)
+    messages = []
+    thread.finished.connect(lambda ok, message: messages.append(message))
+    started = time.perf_counter()
+    thread.get_video_info()
+    extract_seconds = time.perf_counter() - started
+    if thread.info is None:
+        raise RuntimeError(f"extraction failed: {messages[-1] if messages else 'no info'}")
+
+    hooks = []
+    signals = []
+    outcome = []
+    original_hook = thread.progress_hook
+
+    def progress_hook(d):
+        hooks.append((time.perf_counter(), d))
+        original_hook(d)
+
+    def finished(ok, message):
+        outcome.append((time.perf_counter(), ok, message))
+        app.quit()
+
+    thread.progress_hook = progress_hook
+    thread.progress.connect(lambda event: signals.append(time.perf_counter()))
+    thread.finished.connect(finished)
+    started = time.perf_counter()
+    thread.start()
+    app.exec()
+    thread.wait()
+
+    ended, ok, message = outcome[-1]
+    if not ok:
+        raise RuntimeError(message)
+    first_byte = next(t for t, d in hooks if d.get('downloaded_bytes'))
+    done = [(t, d) for t, d in hooks if d['status'] == 'finished']
+    download_end = done[-1][0]
+    downloaded = sum(d.get('total_bytes') or d.get('downloaded_bytes') or 0 for _, d in done)
+    # A phase change is always delivered, after the last event of the previous phase
+    statuses = [d['status'] for _, d in hooks]
+    phases = 1 + sum(a != b for a, b in zip(statuses, statuses[1:]))
+    allowed = (ended - started) * MAX_SIGNAL_RATE + 2 * phases
+    results = {
+        'extract_seconds': extract_seconds,
+        'ttfb_seconds': first_byte - started,
+        'throughput_mib_s': downloaded / MIB / max(download_end - first_byte, 1e-6),
+        'progress_signals_per_s': len(signals) / (ended - started),
+        'progress_signals_excess': max(0, len(signals) - allowed),
+    }
+    if merged:
+        # yt-dlp merges right after the last stream finishes
+        results['merge_seconds'] = ended - download_end
+    return results
+
+
+def peak_rss_mib():
+    try:
+        import resource
+    except ImportError:
+        return None  # Windows
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / MIB if sys.platform == 'darwin' else peak / 1024
+
+
+def find_ffmpeg(path=None):
+    """Point the app at an ffmpeg for this process; returns its path or None"""
+    from src.core.engine import check_ffmpeg
+    from src.core.utils import get_ffmpeg_path
+    if path:
+        os.environ['YOUTUBE_DOWNLOADER_FFMPEG'] = path
+    elif not os.environ.get('YOUTUBE_DOWNLOADER_FFMPEG') and not os.path.exists(get_ffmpeg_path()):
+        os.environ['YOUTUBE_DOWNLOADER_FFMPEG'] = shutil.which('ffmpeg') or ''
+    get_ffmpeg_path.cache_clear()
+    try:
+        return check_ffmpeg()
+    except RuntimeError:
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--warmup', type=int, default=1,
+                        help='unmeasured runs of each scenario before the measured ones')
+    parser.add_argument('--size', type=int, default=64, help='progressive video size in MiB')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='milliseconds added to every response of the media server')
+    parser.add_argument('--ffmpeg', help='ffmpeg to use instead of the bundled one')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--tolerance', type=float, default=0.5,
+                        help='allowed slowdown as a fraction of the baseline')
+    parser.add_argument('--update-baseline', action='store_true',
+                        help='store the results as the new baseline instead of comparing')
+    parser.add_argument('--save-baseline', metavar='FILE',
+                        help='store the results in FILE instead of comparing')
+    args = parser.parse_args(argv)
+
+    ffmpeg_location = find_ffmpeg(args.ffmpeg)
+    if ffmpeg_location is None:
+        print("error: no ffmpeg found; pass --ffmpeg or install one on PATH", file=sys.stderr)
+        return 1
+
+    from PyQt6.QtCore import QCoreApplication
+    app = QCoreApplication.instance() or QCoreApplication([])
+
+    server = MediaServer(latency=args.latency / 1000)
+    server.add_progressive('prog', args.size * MIB)
+    video, audio, synthetic = generate_dash_media(ffmpeg_location)
+    server.add_dash('dash', video, audio)
+    server.start()
+    register_stub_extractor(server.base_url)
+
+    samples = {}
+    failures = []
+    try:
+        for name, merged in (('progressive', False), ('dash', True)):
+            video_id = 'prog' if name == 'progressive' else 'dash'
+            for run in range(args.warmup + args.repeat):
+                with tempfile.TemporaryDirectory() as save_path:
+                    try:
+                        metrics = run_scenario(app, f'{server.base_url}/watch/{video_id}',
+                                               save_path, merged)
+                    except Exception as e:
+                        failures.append(f"{name}: download failed: {e}")
+                        break
+                if run < args.warmup:
+                    continue
+                for metric, value in metrics.items():
+                    samples.setdefault(f'{name}.{metric}', []).append(value)
+    finally:
+        server.stop()
+
+    results = {metric: statistics.median(values) for metric, values in samples.items()}
+    results['peak_rss_mib'] = peak_rss_mib()
+    results['synthetic_media'] = synthetic
+    for metric in [m for m in results if m.endswith('.progress_signals_excess')]:
+        if results.pop(metric):
+            failures.append(f"{metric.split('.')[0]}: more than {MAX_SIGNAL_RATE:g} "
+                            f"progress signals per second reached the GUI")
+
+    print(json.dumps(results, indent=2, sort_keys=True))
+    if synthetic:
+        # Random bytes merge far faster than real streams; the numbers mean nothing
+        print("note: ffmpeg couldn't encode test media, so the DASH media is synthetic; "
+              "not comparing against or recording a baseline", file=sys.stderr)
+    elif args.save_baseline or args.update_baseline:
+        save_baseline(args.save_baseline or args.baseline, results)
+    elif load_baseline(args.baseline) is None:
+        print(f"note: no baseline at {args.baseline}; not comparing "
+              f"(record one with --update-baseline)", file=sys.stderr)
+    else:
+        failures.extend(check_baseline(results, args.baseline, args.tolerance, HIGHER_IS_BETTER))
+
+    for failure in failures:
+        print(f"REGRESSION {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
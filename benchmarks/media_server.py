@@ -0,0 +1,170 @@
+"""Local HTTP server with synthetic media for the offline benchmarks.
+
+Serves a progressive (single file) video and a DASH video/audio pair split
+into segments, plus a JSON description of each that the stub extractor in
+``benchmarks.download`` turns into a yt-dlp info dict. Nothing leaves the
+machine.
+"""
+import json
+import os
+import re
+import subprocess
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+RANGE_RE = re.compile(r'bytes=(\d*)-(\d*)')
+CHUNK_SIZE = 64 * 1024
+MIB = 1024 * 1024
+
+
+def random_payload(size):
+    """Incompressible bytes; fine for anything that isn't merged"""
+    block = os.urandom(MIB)
+    return (block * (size // MIB + 1))[:size]
+
+
+def generate_dash_media(ffmpeg_location, duration=10):
+    """Encode a video-only mp4 and an audio-only m4a with ffmpeg's test sources.
+
+    Returns ``(video, audio, synthetic)``. ``synthetic`` is True when ffmpeg
+    couldn't encode them and random bytes were used instead, in which case
+    only a stream-copying fake ffmpeg can merge them.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        video_path = os.path.join(tmp, 'video.mp4')
+        audio_path = os.path.join(tmp, 'audio.m4a')
+        commands = [
+            [ffmpeg_location, '-y', '-loglevel', 'error', '-f', 'lavfi',
+             '-i', f'testsrc2=size=1280x720:rate=30:duration={duration}',
+             '-c:v', 'mpeg4', '-q:v', '2', '-an', video_path],
+            [ffmpeg_location, '-y', '-loglevel', 'error', '-f', 'lavfi',
+             '-i', f'sine=frequency=440:duration={duration}',
+             '-c:a', 'aac', '-b:a', '128k', '-vn', audio_path],
+        ]
+        try:
+            for cmd in commands:
+                subprocess.run(cmd, stdin=subprocess.DEVNULL, capture_output=True,
+                               check=True, timeout=300)
+            if os.path.getsize(video_path) and os.path.getsize(audio_path):
+                with open(video_path, 'rb') as f:
+                    video = f.read()
+                with open(audio_path, 'rb') as f:
+                    audio = f.read()
+                return video, audio, False
+        except (OSError, subprocess.SubprocessError):
+            pass
+    return random_payload(8 * MIB), random_payload(MIB), True
+
+
+class MediaServer:
+    """ThreadingHTTPServer on 127.0.0.1 serving byte ranges of in-memory files.
+
+    ``/media/<name>`` serves a file (with Range support), ``/api/<video id>``
+    the JSON the stub extractor reads. ``latency`` delays every response
+    to emulate a round trip.
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.files = {}
+        self.videos = {}
+        self.requests = 0
+        self._httpd = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+        self._httpd.daemon_threads = True
+        self._httpd.media_server = self
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        return f'http://127.0.0.1:{self._httpd.server_address[1]}'
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def add_progressive(self, video_id, size, height=720):
+        """A single muxed file, like YouTube's format 18/22"""
+        self.files[f'{video_id}.mp4'] = random_payload(size)
+        self.videos[video_id] = [{
+            'format_id': f'{height}p', 'name': f'{video_id}.mp4', 'ext': 'mp4',
+            'vcodec': 'avc1.64001F', 'acodec': 'mp4a.40.2', 'height': height,
+            'width': height * 16 // 9, 'fps': 30, 'protocol': 'http', 'tbr': 2500,
+        }]
+
+    def add_dash(self, video_id, video, audio, height=720, segment_size=MIB):
+        """Separate video and audio streams fetched segment by segment"""
+        formats = []
+        for kind, payload in (('video', video), ('audio', audio)):
+            name = f'{video_id}-{kind}'
+            count = (len(payload) + segment_size - 1) // segment_size
+            for index in range(count):
+                self.files[f'{name}/{index}.m4s'] = payload[index * segment_size:
+                                                            (index + 1) * segment_size]
+            fmt = {'format_id': f'dash-{kind}', 'name': name, 'segments': count,
+                   'filesize': len(payload), 'protocol': 'http_dash_segments'}
+            if kind == 'video':
+                fmt.update(ext='mp4', vcodec='avc1.64001F', acodec='none', height=height,
+                           width=height * 16 // 9, fps=30, tbr=2000)
+            else:
+                fmt.update(ext='m4a', vcodec='none', acodec='mp4a.40.2', abr=128, tbr=128)
+            formats.append(fmt)
+        self.videos[video_id] = formats
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server.media_server
+        server.requests += 1
+        if server.latency:
+            time.sleep(server.latency)
+        if self.path.startswith('/api/'):
+            formats = server.videos.get(self.path[len('/api/'):])
+            if formats is None:
+                return self.send_error(404)
+            return self._send(json.dumps({'formats': formats}).encode('utf-8'),
+                              'application/json')
+        payload = server.files.get(self.path[len('/media/'):])
+        if not self.path.startswith('/media/') or payload is None:
+            return self.send_error(404)
+        match = RANGE_RE.match(self.headers.get('Range') or '')
+        if not match or match.groups() == ('', ''):
+            return self._send(payload, 'application/octet-stream')
+        first, last = match.groups()
+        if first:
+            start, end = int(first), min(int(last or len(payload) - 1), len(payload) - 1)
+        else:
+            start, end = max(len(payload) - int(last), 0), len(payload) - 1
+        if start >= len(payload) or start > end:
+            self.send_response(416)
+            self.send_header('Content-Range', f'bytes */{len(payload)}')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self._send(payload, 'application/octet-stream', 206, start, end)
+
+    def _send(self, payload, content_type, status=200, start=0, end=None):
+        end = len(payload) - 1 if end is None else end
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(end - start + 1))
+        self.send_header('Accept-Ranges', 'bytes')
+        if status == 206:
+            self.send_header('Content-Range', f'bytes {start}-{end}/{len(payload)}')
+        self.end_headers()
+        view = memoryview(payload)
+        try:
+            for offset in range(start, end + 1, CHUNK_SIZE):
+                self.wfile.write(view[offset:min(offset + CHUNK_SIZE, end + 1)])
+        except (BrokenPipeError, ConnectionResetError):
+            pass
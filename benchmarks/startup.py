@@ -0,0 +1,117 @@
+"""Import-time and time-to-window benchmark.
+
+Each measurement runs in a fresh interpreter so module caches don't hide
+regressions. Prints a JSON object with median timings in seconds and fails
+if yt_dlp gets imported on the startup path or a timing regresses against
+the stored baseline.
+
+    python -m benchmarks.startup [--repeat 5] [--baseline FILE] [--update-baseline]
+"""
+import argparse
+import json
+import os
+import site
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.baseline import check_baseline, save_baseline
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BASELINE = os.path.join(ROOT, 'benchmarks', 'baselines', 'startup.json')
+
+# Each snippet prints "<seconds> <comma separated heavy modules that got loaded>"
+PROBES = {
+    'import_cli': '''
+import time, sys
+t = time.perf_counter()
+import src.cli
+elapsed = time.perf_counter() - t
+''',
+    'import_gui': '''
+import time, sys
+t = time.perf_counter()
+import src.gui.main_window
+elapsed = time.perf_counter() - t
+''',
+    'time_to_window': '''
+import time, sys
+t = time.perf_counter()
+from PyQt6.QtWidgets import QApplication
+from src.gui.main_window import MainWindow
+app = QApplication([])
+# Resuming downloads isn't part of showing the window
+window = MainWindow(resume=False)
+window.show()
+app.processEvents()
+elapsed = time.perf_counter() - t
+''',
+}
+REPORT = '''
+heavy = [m for m in ('yt_dlp', 'PyQt6') if m in sys.modules]
+print(elapsed, ','.join(heavy))
+'''
+# Modules that must not be loaded by each probe
+FORBIDDEN = {
+    'import_cli': {'yt_dlp', 'PyQt6'},
+    'import_gui': {'yt_dlp'},
+    'time_to_window': {'yt_dlp'},
+}
+
+
+def run_probe(name, repeat):
+    timings = []
+    loaded = set()
+    for _ in range(repeat):
+        # A throwaway home, so the window's archive and journal don't touch the user's;
+        # packages installed with pip --user stay importable
+        with tempfile.TemporaryDirectory() as home:
+            env = dict(os.environ, HOME=home, USERPROFILE=home,
+                       PYTHONUSERBASE=site.getuserbase(),
+                       QT_QPA_PLATFORM=os.environ.get('QT_QPA_PLATFORM', 'offscreen'))
+            out = subprocess.run([sys.executable, '-c', PROBES[name] + REPORT], cwd=ROOT,
+                                 env=env, capture_output=True, text=True,
+                                 check=True).stdout.split()
+        timings.append(float(out[0]))
+        if len(out) > 1:
+            loaded.update(out[1].split(','))
+    return statistics.median(timings), loaded & FORBIDDEN[name]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--tolerance', type=float, default=0.5,
+                        help='allowed slowdown as a fraction of the baseline')
+    parser.add_argument('--update-baseline', action='store_true',
+                        help='store the results as the new baseline instead of comparing')
+    parser.add_argument('--save-baseline', metavar='FILE',
+                        help='store the results in FILE instead of comparing')
+    args = parser.parse_args(argv)
+
+    results = {}
+    failures = []
+    for name in PROBES:
+        try:
+            results[name], forbidden = run_probe(name, args.repeat)
+        except subprocess.CalledProcessError as e:
+            failures.append(f"{name}: probe failed\n{e.stderr}")
+            continue
+        if forbidden:
+            failures.append(f"{name}: imported {', '.join(sorted(forbidden))} on the startup path")
+
+    print(json.dumps(results, indent=2, sort_keys=True))
+    if args.save_baseline or args.update_baseline:
+        save_baseline(args.save_baseline or args.baseline, results)
+    else:
+        failures.extend(check_baseline(results, args.baseline, args.tolerance))
+
+    for failure in failures:
+        print(f"REGRESSION {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
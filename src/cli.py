@@ -0,0 +1,270 @@
+"""Headless batch downloader.
+
+Takes URLs from the command line, a file or stdin, downloads them in
+parallel and writes one JSON object per line to stdout for every state
+change and progress update. Never imports Qt.
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+
+from src.core.archive import DownloadArchive
+from src.core.bandwidth import BandwidthScheduler, TimeWindow, parse_rate
+from src.core.clip import ClipRange
+from src.core.download_queue import JobState
+from src.core.engine import DownloadEngine
+from src.core.formats import CodecPolicy
+from src.core.journal import JobJournal
+from src.core.log import configure_logging
+from src.core.metrics import MetricsServer, get_metrics
+from src.core.parallel import ParallelOptions
+from src.core.playlist import is_playlist_url
+from src.core.staging import DEFAULT_MAX_JOBS, StagingArea
+from src.core.utils import clean_youtube_url, extract_video_id
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+EXIT_INTERRUPTED = 130
+
+STATE_EVENTS = {
+    JobState.QUEUED: 'queued',
+    JobState.RUNNING: 'started',
+    JobState.PAUSED: 'paused',
+    JobState.CANCELLED: 'cancelled',
+    JobState.COMPLETED: 'completed',
+    JobState.FAILED: 'failed',
+    JobState.SKIPPED: 'skipped',
+}
+
+
+class JsonLinesWriter:
+    """Serializes events from worker threads onto a single output stream"""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.finished = {state: 0 for state in JobState.FINAL}
+        self._lock = threading.Lock()
+
+    def write(self, event):
+        line = json.dumps(event, ensure_ascii=False)
+        with self._lock:
+            self.stream.write(line + '\n')
+            self.stream.flush()
+
+    def job_updated(self, job, state):
+        if state in JobState.FINAL:
+            with self._lock:
+                self.finished[state] += 1
+        event = {'event': STATE_EVENTS[state], 'job': job.id, 'url': job.url}
+        if state in JobState.FINAL and job.message:
+            event['message'] = job.message
+        if state == JobState.COMPLETED and job.merge_seconds is not None:
+            event['merge_seconds'] = round(job.merge_seconds, 3)
+            event['merge_cpu_seconds'] = round(job.merge_cpu_seconds, 3)
+        if state in JobState.FINAL and job.spans:
+            event['spans'] = {name: round(seconds, 3) for name, seconds in job.spans.items()}
+        self.write(event)
+
+    def job_selected(self, job, selection):
+        self.write({
+            'event': 'selected',
+            'job': job.id,
+            'format': selection.format_spec,
+            'description': selection.describe(),
+            'projected_bytes': selection.total_bytes,
+            'needs_merge': selection.needs_merge,
+            'merge_seconds_estimate': round(selection.merge_seconds, 2),
+        })
+
+    def playlist_listed(self, expansion):
+        event = {'event': 'playlist', 'url': expansion.url, 'entries': expansion.count}
+        if expansion.error is not None:
+            event['message'] = f"Error: {expansion.error}"
+        self.write(event)
+
+    def job_progress(self, job, progress):
+        event = progress.as_dict()
+        event['job'] = event.pop('job_id')
+        self.write(dict(event='progress', **event))
+
+
+def read_urls(args, stdin):
+    urls = list(args.urls)
+    if args.batch_file:
+        if args.batch_file == '-':
+            lines = stdin.read().splitlines()
+        else:
+            with open(args.batch_file, encoding='utf-8') as f:
+                lines = f.read().splitlines()
+        urls.extend(lines)
+    elif not urls and not stdin.isatty():
+        urls.extend(stdin.read().splitlines())
+    # Skip blank lines and comments in batch files
+    return [u.strip() for u in urls if u.strip() and not u.strip().startswith('#')]
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='youtube-downloader',
+        description='Download YouTube videos without the GUI, reporting progress as JSON lines.')
+    parser.add_argument('urls', nargs='*', help='video URLs (read from stdin if omitted)')
+    parser.add_argument('-a', '--batch-file', help="file with one URL per line, '-' for stdin")
+    parser.add_argument('-o', '--output', default=os.getcwd(), help='download directory')
+    parser.add_argument('--height', type=int, help='video height to download, e.g. 1080')
+    parser.add_argument('--codec', choices=sorted(CodecPolicy.LABELS), default=CodecPolicy.COMPATIBLE,
+                        help="'compatible' downloads H.264/AAC only; 'efficient' picks the smallest "
+                             "streams (e.g. VP9/AV1) that can be remuxed into mp4 without re-encoding")
+    parser.add_argument('--title', help='output file name (single URL only)')
+    parser.add_argument('--clip', type=ClipRange.parse, metavar='START-END',
+                        help='download only this section, e.g. 1:02:00-1:02:30; only the parts of '
+                             'the streams around it are fetched')
+    parser.add_argument('--precise-cuts', action='store_true',
+                        help='re-encode the clip to cut exactly at START and END instead of on '
+                             'the nearest keyframes')
+    parser.add_argument('--playlist', action='store_true',
+                        help='download the whole playlist when a video URL has a list= parameter '
+                             '(playlist and channel URLs are always expanded)')
+    parser.add_argument('-j', '--jobs', type=int, default=3, help='parallel downloads')
+    parser.add_argument('--per-host', type=int, default=2,
+                        help='maximum parallel downloads from the same host')
+    parser.add_argument('--connections', type=int, default=1,
+                        help='initial connections per large progressive stream (1 disables '
+                             'parallel mode; more are added while throughput improves)')
+    parser.add_argument('--max-connections', type=int, default=8,
+                        help='upper bound for adaptive connection scaling')
+    parser.add_argument('--fragments', type=int, default=1,
+                        help='DASH/HLS fragments to fetch concurrently')
+    parser.add_argument('-r', '--limit-rate', type=parse_rate,
+                        help='total bandwidth for all downloads, e.g. 500K or 2M (bytes per second)')
+    parser.add_argument('--rate-window', type=TimeWindow.parse, action='append', default=[],
+                        metavar='HH:MM-HH:MM=RATE',
+                        help="different limit during a daily time window, e.g. 09:00-18:00=1M or "
+                             "22:00-07:00=unlimited; may be repeated, the first match wins")
+    parser.add_argument('--merge-workers', type=int, default=2,
+                        help='processes merging video and audio while the next downloads run '
+                             '(0 merges inside the download worker)')
+    parser.add_argument('--staging-dir', nargs='?', const='', metavar='DIR',
+                        help='download and merge on local disk, then move finished files to '
+                             '--output (default DIR: ~/.youtube_downloader/staging)')
+    parser.add_argument('--staging-jobs', type=int, default=DEFAULT_MAX_JOBS,
+                        help='jobs staged at once; further jobs write to --output directly')
+    parser.add_argument('--archive', nargs='?', const='', metavar='FILE',
+                        help='skip videos already downloaded in the same format and record new ones '
+                             '(default file: ~/.youtube_downloader/archive.sqlite3)')
+    parser.add_argument('--rebuild-archive', metavar='DIR',
+                        help='add the videos found in DIR to the archive, then download as usual')
+    parser.add_argument('--resume', action='store_true',
+                        help='also re-run unfinished jobs from the job journal')
+    parser.add_argument('--journal', help='job journal file (default: ~/.youtube_downloader/jobs.sqlite3)')
+    parser.add_argument('--no-journal', action='store_true', help="don't record jobs in the journal")
+    parser.add_argument('--progress-rate', type=float, default=2.0,
+                        help='maximum progress events per second per download')
+    parser.add_argument('--log-level', default='warning',
+                        choices=['debug', 'info', 'warning', 'error'],
+                        help='log messages at this level and above go to stderr')
+    parser.add_argument('--log-json', action='store_true', help='write log messages as JSON lines')
+    parser.add_argument('--metrics-file', metavar='FILE',
+                        help='keep counters, gauges and timing spans up to date in this JSON file')
+    parser.add_argument('--metrics-port', type=int, metavar='PORT',
+                        help='serve metrics in Prometheus text format at '
+                             'http://127.0.0.1:PORT/metrics while running')
+    return parser
+
+
+def main(argv=None, stdin=None, stdout=None):
+    stdin = stdin or sys.stdin
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    writer = JsonLinesWriter(stdout or sys.stdout)
+    configure_logging(args.log_level, args.log_json)
+
+    staging = None
+    if args.staging_dir is not None:
+        staging = StagingArea(args.staging_dir or None, args.staging_jobs)
+    archive = None
+    if args.archive is not None or args.rebuild_archive:
+        archive = DownloadArchive(args.archive or None)
+    if args.rebuild_archive:
+        journal = None if args.no_journal else JobJournal(args.journal)
+        found = archive.rebuild(args.rebuild_archive, journal)
+        writer.write({'event': 'archive', 'directory': args.rebuild_archive, 'found': found,
+                      'entries': archive.count()})
+
+    urls = read_urls(args, stdin)
+    if args.rebuild_archive and not urls and not args.resume:
+        # Rebuilding was all that was asked for
+        return EXIT_OK
+    if not urls and not args.resume:
+        parser.print_usage(sys.stderr)
+        print('error: no URLs given', file=sys.stderr)
+        return EXIT_USAGE
+    if args.title and len(urls) > 1:
+        print('error: --title can only be used with a single URL', file=sys.stderr)
+        return EXIT_USAGE
+    clip = args.clip
+    if clip and args.precise_cuts:
+        clip = ClipRange(clip.start, clip.end, precise=True)
+    os.makedirs(args.output, exist_ok=True)
+
+    parallel = None
+    if args.connections > 1 or args.fragments > 1:
+        parallel = ParallelOptions(connections=max(1, args.connections),
+                                   max_connections=args.max_connections,
+                                   fragment_concurrency=max(1, args.fragments))
+
+    engine = DownloadEngine(max_workers=max(1, args.jobs), per_host_limit=max(1, args.per_host),
+                            on_update=writer.job_updated, on_progress=writer.job_progress,
+                            on_selection=writer.job_selected,
+                            progress_rate=args.progress_rate, parallel=parallel,
+                            merge_workers=max(0, args.merge_workers),
+                            bandwidth=BandwidthScheduler(args.limit_rate, args.rate_window),
+                            archive=archive, staging=staging,
+                            journal=None if args.no_journal else JobJournal(args.journal))
+    metrics = get_metrics()
+    metrics_server = (MetricsServer(metrics, args.metrics_port).start()
+                      if args.metrics_port is not None else None)
+    if args.resume:
+        engine.resume_unfinished()
+    playlists = []
+    for url in urls:
+        if is_playlist_url(url) and (args.playlist or not extract_video_id(url)):
+            # Entries are queued while the playlist is still being listed
+            playlists.append(engine.submit_playlist(url, args.output, args.height,
+                                                    codec_policy=args.codec))
+        else:
+            engine.submit(clean_youtube_url(url), args.output, args.height, args.title,
+                          codec_policy=args.codec, clip=clip)
+
+    try:
+        # Wait in short slices so Ctrl+C is delivered promptly
+        while not engine.wait(timeout=0.5):
+            # Finished jobs aren't needed any more; keeps memory flat for huge playlists
+            engine.queue.remove_finished()
+            if args.metrics_file:
+                metrics.write_json(args.metrics_file)
+    except KeyboardInterrupt:
+        engine.shutdown()
+        engine.wait(timeout=10)
+        return EXIT_INTERRUPTED
+    finally:
+        if args.metrics_file:
+            metrics.write_json(args.metrics_file)
+        if metrics_server:
+            metrics_server.stop()
+
+    for expansion in playlists:
+        writer.playlist_listed(expansion)
+    # Skipped videos were downloaded before, which counts as success
+    completed = writer.finished[JobState.COMPLETED] + writer.finished[JobState.SKIPPED]
+    total = sum(writer.finished.values())
+    writer.write({'event': 'summary', 'total': total, 'completed': completed,
+                  'failed': total - completed})
+    listing_failed = any(expansion.error is not None for expansion in playlists)
+    return EXIT_OK if completed == total and not listing_failed else EXIT_FAILED
+
+
+if __name__ == '__main__':
+    sys.exit(main())
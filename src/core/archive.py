@@ -0,0 +1,222 @@
+import hashlib
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from src.core.clip import ClipRange
+from src.core.utils import extract_video_id, get_app_dir
+
+# Matches any format, e.g. entries rebuilt from files whose format isn't known
+ANY_FORMAT = '*'
+# Extended attribute the engine tags finished files with, so a lost archive can be rebuilt
+XATTR_NAME = 'user.youtube_downloader.archive'
+# Written by yt-dlp --xattrs and by browsers
+ORIGIN_XATTR_NAME = 'user.xdg.origin.url'
+# yt-dlp's default "Title [id].ext" naming
+BRACKETED_ID_RE = re.compile(r'\[([0-9A-Za-z_-]{11})\]\.\w+$')
+PARTIAL_SUFFIXES = ('.part', '.ytdl', '.json', '.tmp')
+
+
+def format_key(selected_height=None, codec_policy=None, clip=None):
+    """The format a job asks for, known before anything is extracted: '1080p-compatible'.
+
+    Clips are kept apart from the full video and from each other:
+    '1080p-compatible@1:00-1:30'.
+    """
+    key = f"{f'{selected_height}p' if selected_height else 'best'}-{codec_policy or 'compatible'}"
+    return f"{key}@{clip.spec()}" if clip else key
+
+
+class BloomFilter:
+    """Fixed-size set membership test with false positives but no false negatives"""
+
+    def __init__(self, capacity, error_rate=0.001):
+        self.capacity = max(capacity, 1024)
+        self.size = int(-self.capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.hashes = max(1, round(self.size / self.capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7))
+                   for position in self._positions(key))
+
+
+class DownloadArchive:
+    """Persistent index of downloaded videos keyed by extractor, video ID and format.
+
+    Lookups go through an in-memory bloom filter first, so the common case
+    of a video that was never downloaded is answered without touching the
+    database; hits are confirmed against the primary key index. The filter
+    is built on first use and doubled in size when it fills up.
+    """
+
+    def __init__(self, path=None, use_bloom=True):
+        self.path = path or os.path.join(get_app_dir(), 'archive.sqlite3')
+        self.use_bloom = use_bloom
+        self.bloom_rejects = 0
+        self._bloom = None
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS archive ('
+                ' extractor TEXT NOT NULL,'
+                ' video_id TEXT NOT NULL,'
+                ' format TEXT NOT NULL,'
+                ' path TEXT,'
+                ' size INTEGER,'
+                ' added REAL NOT NULL,'
+                ' PRIMARY KEY (extractor, video_id, format)) WITHOUT ROWID'
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=10)
+
+    def _get_bloom(self):
+        """Build the filter from the table; must be called with the lock held"""
+        if self._bloom is None or self._bloom.count > self._bloom.capacity:
+            with self._connect() as conn:
+                count = conn.execute('SELECT COUNT(*) FROM archive').fetchone()[0]
+                bloom = BloomFilter(2 * count)
+                for extractor, video_id, fmt in conn.execute(
+                        'SELECT extractor, video_id, format FROM archive'):
+                    bloom.add(f'{extractor} {video_id} {fmt}')
+            self._bloom = bloom
+        return self._bloom
+
+    def contains(self, extractor, video_id, fmt=ANY_FORMAT):
+        """True if the video was downloaded in ``fmt`` (or recorded without a known format)"""
+        extractor = extractor.lower()
+        with self._lock:
+            if self.use_bloom:
+                bloom = self._get_bloom()
+                if (f'{extractor} {video_id} {fmt}' not in bloom and
+                        f'{extractor} {video_id} {ANY_FORMAT}' not in bloom):
+                    self.bloom_rejects += 1
+                    return False
+            with self._connect() as conn:
+                row = conn.execute(
+                    'SELECT 1 FROM archive WHERE extractor = ? AND video_id = ? AND format IN (?, ?)',
+                    (extractor, video_id, fmt, ANY_FORMAT)).fetchone()
+        return row is not None
+
+    def contains_url(self, url, fmt=ANY_FORMAT):
+        """Check a YouTube URL without extracting it; None when the URL has no video ID"""
+        video_id = extract_video_id(url)
+        if video_id is None:
+            return None
+        return self.contains('youtube', video_id, fmt)
+
+    def add(self, extractor, video_id, fmt=ANY_FORMAT, path=None, size=None):
+        self.add_many([(extractor, video_id, fmt, path, size)])
+
+    def add_many(self, entries):
+        now = time.time()
+        rows = [(extractor.lower(), video_id, fmt, path, size, now)
+                for extractor, video_id, fmt, path, size in entries]
+        with self._lock, self._connect() as conn:
+            conn.executemany(
+                'INSERT OR REPLACE INTO archive (extractor, video_id, format, path, size, added)'
+                ' VALUES (?, ?, ?, ?, ?, ?)', rows)
+            if self.use_bloom and self._bloom is not None:
+                for extractor, video_id, fmt, *_ in rows:
+                    self._bloom.add(f'{extractor} {video_id} {fmt}')
+
+    def remove(self, extractor, video_id, fmt=None):
+        """Forget a video (in every format unless ``fmt`` is given) so it is downloaded again"""
+        query = 'DELETE FROM archive WHERE extractor = ? AND video_id = ?'
+        params = [extractor.lower(), video_id]
+        if fmt is not None:
+            query += ' AND format = ?'
+            params.append(fmt)
+        with self._lock, self._connect() as conn:
+            conn.execute(query, params)
+            # Bloom filters can't delete; rebuild on the next lookup
+            self._bloom = None
+
+    def count(self):
+        with self._lock, self._connect() as conn:
+            return conn.execute('SELECT COUNT(*) FROM archive').fetchone()[0]
+
+    def record(self, extractor, video_id, fmt, path):
+        """Add a finished download and tag the file so ``rebuild`` can find it again"""
+        size = None
+        if path and os.path.exists(path):
+            size = os.path.getsize(path)
+            tag_file(path, extractor, video_id, fmt)
+        self.add(extractor, video_id, fmt, path, size)
+
+    def rebuild(self, directory, journal=None):
+        """Add every downloaded video found under ``directory``; returns how many were found.
+
+        Videos are recognised by the tag ``record`` leaves on the file, an
+        origin URL attribute, a ``[video id]`` in the file name or, with a
+        JobJournal, by the output paths of completed jobs.
+        """
+        directory = os.path.abspath(directory)
+        found = {}
+        for root, _, files in os.walk(directory):
+            for name in files:
+                if name.endswith(PARTIAL_SUFFIXES) or name.startswith('.'):
+                    continue
+                path = os.path.join(root, name)
+                key = identify_file(path)
+                if key is not None:
+                    found[path] = key
+        if journal is not None:
+            for entry in journal.completed():
+                path = entry.output_path and os.path.abspath(entry.output_path)
+                video_id = extract_video_id(entry.url)
+                if (path and video_id and path not in found and os.path.exists(path) and
+                        path.startswith(directory + os.sep)):
+                    found[path] = ('youtube', video_id,
+                                   format_key(entry.selected_height, entry.codec_policy,
+                                              ClipRange.parse(entry.clip) if entry.clip else None))
+        self.add_many([(extractor, video_id, fmt, path, os.path.getsize(path))
+                       for path, (extractor, video_id, fmt) in found.items()])
+        return len(found)
+
+
+def _getxattr(path, name):
+    try:
+        return os.getxattr(path, name).decode('utf-8')
+    except (AttributeError, OSError, UnicodeDecodeError):
+        # No xattr support on this platform or file system, or not set
+        return None
+
+
+def tag_file(path, extractor, video_id, fmt):
+    try:
+        os.setxattr(path, XATTR_NAME, f'{extractor.lower()} {video_id} {fmt}'.encode('utf-8'))
+    except (AttributeError, OSError):
+        pass
+
+
+def identify_file(path):
+    """(extractor, video_id, format) of a downloaded file, or None if it can't be told"""
+    tag = _getxattr(path, XATTR_NAME)
+    if tag and len(tag.split(' ')) == 3:
+        return tuple(tag.split(' '))
+    origin = _getxattr(path, ORIGIN_XATTR_NAME)
+    video_id = origin and extract_video_id(origin)
+    if video_id:
+        return ('youtube', video_id, ANY_FORMAT)
+    match = BRACKETED_ID_RE.search(os.path.basename(path))
+    if match:
+        return ('youtube', match.group(1), ANY_FORMAT)
+    return None
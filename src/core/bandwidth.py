@@ -0,0 +1,148 @@
+import datetime
+import heapq
+import itertools
+import re
+import threading
+import time
+
+RATE_RE = re.compile(r'^\s*(\d+(?:\.\d+)?)\s*([kmg]?)i?b?\s*$', re.IGNORECASE)
+WINDOW_RE = re.compile(r'^\s*(\d{1,2}):(\d{2})\s*-\s*(\d{1,2}):(\d{2})\s*=\s*(.+)$')
+UNITS = {'': 1, 'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3}
+UNLIMITED = ('', '0', 'none', 'off', 'unlimited')
+
+
+def parse_rate(text):
+    """'500K', '2M', '1.5MiB' -> bytes per second; 'unlimited' or any zero rate -> None"""
+    if text is None or str(text).strip().lower() in UNLIMITED:
+        return None
+    match = RATE_RE.match(str(text))
+    if not match:
+        raise ValueError(f"Invalid rate: {text!r} (expected e.g. 500K or 2M)")
+    # '0K' or '0.0' too: a bucket that never refills would stall every transfer
+    return int(float(match.group(1)) * UNITS[match.group(2).lower()]) or None
+
+
+class TimeWindow:
+    """A daily time span [start, end) with its own rate; may wrap past midnight.
+
+    A window whose start equals its end covers the whole day.
+    """
+
+    def __init__(self, start, end, rate):
+        self.start = start
+        self.end = end
+        self.rate = rate
+
+    @classmethod
+    def parse(cls, text):
+        """'09:00-18:00=2M' or '22:00-07:00=unlimited'"""
+        match = WINDOW_RE.match(text)
+        if not match:
+            raise ValueError(f"Invalid time window: {text!r} (expected e.g. 09:00-18:00=2M)")
+        h1, m1, h2, m2, rate = match.groups()
+        try:
+            start, end = datetime.time(int(h1), int(m1)), datetime.time(int(h2), int(m2))
+        except ValueError:
+            raise ValueError(f"Invalid time in window: {text!r}")
+        return cls(start, end, parse_rate(rate))
+
+    def __str__(self):
+        """The form ``parse`` reads back, with the rate in bytes per second"""
+        return (f"{self.start:%H:%M}-{self.end:%H:%M}="
+                f"{'unlimited' if self.rate is None else self.rate}")
+
+    def contains(self, moment):
+        if self.start == self.end:
+            return True
+        if self.start < self.end:
+            return self.start <= moment < self.end
+        return moment >= self.start or moment < self.end
+
+
+class BandwidthScheduler:
+    """Token bucket shared by every transfer of a DownloadEngine.
+
+    Transfers call ``consume`` for each block they read. The bucket refills
+    at the current rate: the first time window containing the local time,
+    else ``rate`` (None means unlimited). When several jobs are waiting,
+    tokens go to the one with the least weighted usage (bytes / weight), so
+    backlogged jobs share the link in proportion to their weights while a
+    job on its own can use all of it. A block may overdraw the bucket; the
+    debt is paid back before the next grant, so the average never exceeds
+    the limit.
+    """
+
+    def __init__(self, rate=None, windows=(), burst=0.5):
+        self.rate = rate
+        self.windows = list(windows)
+        self.burst = burst  # seconds of traffic the bucket can save up while idle
+        self._cond = threading.Condition()
+        self._tokens = 0.0
+        self._refilled = time.monotonic()
+        self._weights = {}
+        self._usage = {}     # job id -> weighted bytes granted so far
+        self._clock = 0.0    # weighted usage of the last grant
+        self._waiting = []   # heap of (usage, seq, job id)
+        self._seq = itertools.count()
+
+    def set_limits(self, rate=None, windows=None):
+        with self._cond:
+            self.rate = rate
+            if windows is not None:
+                self.windows = list(windows)
+            self._cond.notify_all()
+
+    def set_weight(self, job_id, weight):
+        with self._cond:
+            self._weights[job_id] = max(float(weight), 0.01)
+
+    def forget(self, job_id):
+        with self._cond:
+            self._weights.pop(job_id, None)
+            self._usage.pop(job_id, None)
+
+    def current_rate(self, moment=None):
+        moment = moment or datetime.datetime.now().time()
+        for window in self.windows:
+            if window.contains(moment):
+                return window.rate
+        return self.rate
+
+    def consume(self, job_id, nbytes, check=None):
+        """Block until ``nbytes`` may be transferred for ``job_id``.
+
+        ``check`` is called while waiting and may raise to abort, e.g. the
+        job's ``check_cancelled``.
+        """
+        with self._cond:
+            if self.current_rate() is None and not self._waiting:
+                return
+            usage = max(self._usage.get(job_id, 0.0), self._clock)
+            entry = (usage, next(self._seq), job_id)
+            heapq.heappush(self._waiting, entry)
+            try:
+                while True:
+                    if check is not None:
+                        check()
+                    rate = self.current_rate()
+                    timeout = 0.25  # re-evaluate regularly so window changes apply
+                    if self._waiting[0] is entry:
+                        if rate is None:
+                            break
+                        self._refill(rate)
+                        if self._tokens > 0:
+                            self._tokens -= nbytes
+                            break
+                        timeout = min(timeout, -self._tokens / rate + 0.001)
+                    self._cond.wait(timeout)
+                self._clock = usage
+                self._usage[job_id] = usage + nbytes / self._weights.get(job_id, 1.0)
+            finally:
+                self._waiting.remove(entry)
+                heapq.heapify(self._waiting)
+                self._cond.notify_all()
+
+    def _refill(self, rate):
+        now = time.monotonic()
+        self._tokens = min(self._tokens + (now - self._refilled) * rate, rate * self.burst)
+        self._refilled = now
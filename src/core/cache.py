@@ -0,0 +1,107 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from src.core.utils import get_app_dir
+
+# YouTube signs stream URLs for roughly six hours, so cached info has to be
+# refreshed well before that or the download step gets 403s.
+DEFAULT_TTL = 60 * 60
+DEFAULT_MAX_ENTRIES = 500
+
+
+class MetadataCache:
+    """On-disk cache of extracted video info keyed by video ID, with TTL and LRU eviction"""
+
+    def __init__(self, path=None, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path or os.path.join(get_app_dir(), 'metadata_cache.sqlite3')
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.saved_seconds = 0.0
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS info ('
+                ' video_id TEXT PRIMARY KEY,'
+                ' data TEXT NOT NULL,'
+                ' created REAL NOT NULL,'
+                ' accessed REAL NOT NULL,'
+                ' extract_seconds REAL NOT NULL DEFAULT 0)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS info_accessed ON info (accessed)')
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=10)
+
+    def get(self, video_id):
+        """Return the cached info dict, or None on a miss or an expired entry"""
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            row = conn.execute(
+                'SELECT data, created, extract_seconds FROM info WHERE video_id = ?',
+                (video_id,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            data, created, extract_seconds = row
+            if now - created > self.ttl:
+                conn.execute('DELETE FROM info WHERE video_id = ?', (video_id,))
+                self.expired += 1
+                self.misses += 1
+                return None
+            conn.execute('UPDATE info SET accessed = ? WHERE video_id = ?', (now, video_id))
+            self.hits += 1
+            self.saved_seconds += extract_seconds
+        return json.loads(data)
+
+    def put(self, video_id, info, extract_seconds=0.0):
+        now = time.time()
+        data = json.dumps(info)
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO info (video_id, data, created, accessed, extract_seconds)'
+                ' VALUES (?, ?, ?, ?, ?)',
+                (video_id, data, now, now, extract_seconds))
+            conn.execute(
+                'DELETE FROM info WHERE video_id IN ('
+                ' SELECT video_id FROM info ORDER BY accessed DESC LIMIT -1 OFFSET ?)',
+                (self.max_entries,))
+
+    def invalidate(self, video_id):
+        with self._lock, self._connect() as conn:
+            conn.execute('DELETE FROM info WHERE video_id = ?', (video_id,))
+
+    def clear(self):
+        with self._lock, self._connect() as conn:
+            conn.execute('DELETE FROM info')
+
+    def stats(self):
+        with self._lock, self._connect() as conn:
+            entries = conn.execute('SELECT COUNT(*) FROM info').fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            'entries': entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'expired': self.expired,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'saved_seconds': round(self.saved_seconds, 3),
+        }
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_metadata_cache():
+    """Process-wide cache shared by the GUI, the queue workers and the CLI"""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = MetadataCache()
+        return _default_cache
@@ -0,0 +1,88 @@
+import re
+
+TIMESTAMP_RE = re.compile(r'^(?:(?:(\d+):)?(\d+):)?(\d+(?:\.\d*)?)$')
+
+
+def parse_timestamp(text):
+    """Seconds from '90', '1:30', '1:02:03' or '1:02:03.5'"""
+    match = TIMESTAMP_RE.match(str(text).strip())
+    if not match:
+        raise ValueError(f"invalid time {text!r}, expected [[HH:]MM:]SS")
+    hours, minutes, seconds = match.groups()
+    return int(hours or 0) * 3600 + int(minutes or 0) * 60 + float(seconds)
+
+
+def format_timestamp(seconds):
+    """'1:02:03', '2:03' or '2:03.5'"""
+    # Rounded first so that e.g. 59.9996 becomes 1:00 rather than 0:60
+    minutes, seconds = divmod(round(seconds, 3), 60)
+    hours, minutes = divmod(int(minutes), 60)
+    text = f'{seconds:06.3f}'.rstrip('0').rstrip('.')
+    text = text if len(text) > 1 else '0' + text
+    return f'{hours}:{minutes:02d}:{text}' if hours else f'{minutes}:{text}'
+
+
+class ClipRange:
+    """A section of a video to download instead of the whole thing.
+
+    yt-dlp hands sections to ffmpeg, which seeks in the remote streams and
+    reads only the byte ranges (or DASH fragments) around the section, so a
+    short clip of a long video costs about as much as the clip itself. By
+    default the streams are copied, cutting on the keyframes nearest the
+    requested times; ``precise`` re-encodes the clip to cut exactly there.
+    """
+    __slots__ = ('start', 'end', 'precise')
+
+    def __init__(self, start, end, precise=False):
+        if start < 0 or end <= start:
+            raise ValueError("the clip must end after it starts")
+        self.start = float(start)
+        self.end = float(end)
+        self.precise = bool(precise)
+
+    @classmethod
+    def parse(cls, text, precise=False):
+        """'START-END' with [[HH:]MM:]SS times; a trailing '!' asks for precise cuts"""
+        text = text.strip()
+        if text.endswith('!'):
+            text, precise = text[:-1], True
+        start, sep, end = text.partition('-')
+        if not sep:
+            raise ValueError(f"invalid clip {text!r}, expected START-END")
+        return cls(parse_timestamp(start), parse_timestamp(end), precise)
+
+    @property
+    def duration(self):
+        return self.end - self.start
+
+    def spec(self):
+        """Round-trips through ``parse``; stored in the journal"""
+        return f"{format_timestamp(self.start)}-{format_timestamp(self.end)}" + (
+            '!' if self.precise else '')
+
+    def file_suffix(self):
+        """Distinguishes the clip's file from the full video's: ' [1.02.03-1.02.33]'"""
+        return (f" [{format_timestamp(self.start)}-{format_timestamp(self.end)}]"
+                .replace(':', '.'))
+
+    def check(self, duration):
+        """Raise if the clip starts after a video of ``duration`` seconds has ended"""
+        if duration and self.start >= duration:
+            raise ValueError(f"the clip starts at {format_timestamp(self.start)} but the video is "
+                             f"only {format_timestamp(duration)} long")
+
+    def ydl_opts(self):
+        from yt_dlp.utils import download_range_func
+        return {
+            'download_ranges': download_range_func(None, [(self.start, self.end)]),
+            'force_keyframes_at_cuts': self.precise,
+        }
+
+    def __eq__(self, other):
+        return isinstance(other, ClipRange) and self.spec() == other.spec()
+
+    def __hash__(self):
+        return hash(self.spec())
+
+    def __repr__(self):
+        return f'ClipRange({self.spec()!r})'
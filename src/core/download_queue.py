@@ -0,0 +1,302 @@
+import collections
+import itertools
+import threading
+import time
+from urllib.parse import urlparse
+
+
+class JobCancelled(Exception):
+    """Raised from inside a running job when it has been paused or cancelled"""
+
+
+class JobSkipped(Exception):
+    """Raised by a runner when there is nothing to do, e.g. the video was already downloaded"""
+
+
+class JobState:
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    PAUSED = 'paused'
+    CANCELLED = 'cancelled'
+    COMPLETED = 'completed'
+    FAILED = 'failed'
+    SKIPPED = 'skipped'
+
+    FINAL = (CANCELLED, COMPLETED, FAILED, SKIPPED)
+
+
+class DownloadJob:
+    """A single URL waiting in (or running from) the download queue"""
+    __slots__ = ('id', 'url', 'save_path', 'selected_height', 'custom_title', 'priority',
+                 'codec_policy', 'clip', 'info', 'journal_id', 'output_path', 'merge_seconds',
+                 'merge_cpu_seconds', 'spans', 'queued_at', 'error', 'host', 'state',
+                 'progress', 'message', '_seq', '_active', '_stop')
+    _ids = itertools.count(1)
+
+    def __init__(self, url, save_path, selected_height=None, custom_title=None, priority=0,
+                 info=None, journal_id=None, codec_policy='compatible', clip=None):
+        self.id = next(self._ids)
+        self.url = url
+        self.save_path = save_path
+        self.selected_height = selected_height
+        self.custom_title = custom_title
+        self.priority = priority
+        self.codec_policy = codec_policy
+        self.clip = clip  # ClipRange, or None for the whole video
+        self.info = info  # VideoInfo once extracted; dropped when the job finishes
+        self.journal_id = journal_id
+        self.output_path = None
+        self.merge_seconds = None      # wall-clock and CPU time of the ffmpeg merge
+        self.merge_cpu_seconds = None
+        self.spans = {}  # seconds spent per stage, e.g. 'queue_wait', 'extraction', 'transfer'
+        self.queued_at = time.monotonic()
+        self.error = None  # the exception a failed job raised
+        self.host = urlparse(url).hostname or ''
+        self.state = JobState.QUEUED
+        self.progress = None  # latest ProgressEvent
+        self.message = ''
+        self._seq = self.id
+        self._active = False
+        self._stop = threading.Event()
+
+    @property
+    def title(self):
+        return self.custom_title or self.url
+
+    def check_cancelled(self):
+        """Call from the runner's progress hook to abort a paused/cancelled job"""
+        if self._stop.is_set():
+            raise JobCancelled(self.state)
+
+
+class DownloadQueue:
+    """Bounded worker pool pulling jobs by priority with per-host concurrency caps.
+
+    ``runner(job)`` performs the actual download in a worker thread and should
+    raise on failure. It may instead return a ``concurrent.futures.Future``
+    for a final stage running elsewhere (e.g. an ffmpeg merge): the worker
+    then moves on to the next job and this one completes with the future.
+    ``on_update(job, state)`` is called whenever a job changes state, in the
+    order the changes happened and with the state as of that change; it runs
+    in whichever thread made the change, so GUI consumers must marshal it to
+    their own thread.
+    """
+
+    def __init__(self, runner, max_workers=3, per_host_limit=2, on_update=None):
+        self.runner = runner
+        self.max_workers = max_workers
+        self.per_host_limit = per_host_limit
+        self.on_update = on_update
+        self._jobs = {}
+        self._running_per_host = {}
+        self._workers = []
+        self._cond = threading.Condition()
+        self._closed = False
+        self._updates = collections.deque()
+        self._undelivered = 0
+        self._deliver_lock = threading.RLock()
+
+    # Public API
+
+    def add(self, url, save_path, selected_height=None, custom_title=None, priority=0, info=None,
+            journal_id=None, codec_policy='compatible', clip=None):
+        job = DownloadJob(url, save_path, selected_height, custom_title, priority, info, journal_id,
+                          codec_policy, clip)
+        with self._cond:
+            self._jobs[job.id] = job
+            self._ensure_workers()
+            self._record_update(job)
+            self._cond.notify_all()
+        self._deliver_updates()
+        return job
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def jobs(self):
+        with self._cond:
+            return list(self._jobs.values())
+
+    def pause(self, job_id):
+        self._stop_job(job_id, JobState.PAUSED)
+
+    def cancel(self, job_id):
+        self._stop_job(job_id, JobState.CANCELLED)
+
+    def resume(self, job_id):
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if not job or job.state != JobState.PAUSED:
+                return
+            # A still-running paused job is picked up again once its runner exits
+            job.state = JobState.QUEUED
+            job.queued_at = time.monotonic()
+            self._record_update(job)
+            self._cond.notify_all()
+        self._deliver_updates()
+
+    def set_priority(self, job_id, priority):
+        """Higher priority jobs are started first; ties keep submission order"""
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job:
+                job.priority = priority
+                self._cond.notify_all()
+
+    def set_max_workers(self, max_workers):
+        with self._cond:
+            self.max_workers = max(1, max_workers)
+            self._ensure_workers()
+            self._cond.notify_all()
+
+    def remove_finished(self):
+        with self._cond:
+            for job_id in [j.id for j in self._jobs.values() if j.state in JobState.FINAL]:
+                del self._jobs[job_id]
+
+    def join(self, timeout=None):
+        """Block until every job has finished or been paused and all updates have
+        been delivered; returns False on timeout"""
+        with self._cond:
+            return self._cond.wait_for(
+                lambda: self._undelivered == 0 and all(
+                    j.state in JobState.FINAL or j.state == JobState.PAUSED and not j._active
+                    for j in self._jobs.values()),
+                timeout)
+
+    def shutdown(self, cancel_running=True):
+        with self._cond:
+            self._closed = True
+            if cancel_running:
+                for job in self._jobs.values():
+                    if job.state == JobState.RUNNING:
+                        job.state = JobState.PAUSED
+                        job._stop.set()
+            self._cond.notify_all()
+
+    # Scheduling
+
+    def _ensure_workers(self):
+        self._workers = [w for w in self._workers if w.is_alive()]
+        while len(self._workers) < self.max_workers:
+            worker = threading.Thread(target=self._worker_loop, daemon=True)
+            self._workers.append(worker)
+            worker.start()
+
+    def _running_count(self):
+        return sum(self._running_per_host.values())
+
+    def _next_job(self):
+        if self._running_count() >= self.max_workers:
+            return None
+        candidates = [
+            j for j in self._jobs.values()
+            if j.state == JobState.QUEUED and not j._active
+            and self._running_per_host.get(j.host, 0) < self.per_host_limit
+        ]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda j: (-j.priority, j._seq))
+
+    def _worker_loop(self):
+        while True:
+            with self._cond:
+                job = self._next_job()
+                while job is None:
+                    if self._closed or len(self._workers) > self.max_workers:
+                        self._workers.remove(threading.current_thread())
+                        return
+                    self._cond.wait()
+                    job = self._next_job()
+                job.state = JobState.RUNNING
+                job.message = ''
+                job._active = True
+                job._stop.clear()
+                self._running_per_host[job.host] = self._running_per_host.get(job.host, 0) + 1
+                self._record_update(job)
+            self._deliver_updates()
+            self._run(job)
+
+    def _run(self, job):
+        try:
+            pending = self.runner(job)
+        except Exception as e:
+            self._finish(job, e)
+            return
+        if pending is None:
+            self._finish(job, None)
+            return
+        # Free the worker slot for the next download; the job stays active until the stage is done
+        with self._cond:
+            self._running_per_host[job.host] -= 1
+            self._cond.notify_all()
+        pending.add_done_callback(lambda future: self._finish_stage(job, future))
+
+    def _finish_stage(self, job, future):
+        if future.cancelled() or job._stop.is_set():
+            # Cancelled or paused while the stage ran: the job keeps that state
+            error = JobCancelled(job.state)
+        else:
+            error = future.exception()
+        self._finish(job, error, holds_slot=False)
+
+    def _finish(self, job, error, holds_slot=True):
+        if error is None:
+            state, message = JobState.COMPLETED, "Download completed successfully!"
+        elif isinstance(error, JobSkipped):
+            state, message = JobState.SKIPPED, str(error)
+        elif job._stop.is_set():
+            state, message = None, ''
+        else:
+            state, message = JobState.FAILED, f"Error: {str(error)}"
+
+        with self._cond:
+            if holds_slot:
+                self._running_per_host[job.host] -= 1
+            job._active = False
+            if state is not None:
+                job.state = state
+            if job.state in JobState.FINAL:
+                # The extracted info can be large; no need to keep it around
+                job.info = None
+            job.message = message
+            job.error = error if state == JobState.FAILED else None
+            self._record_update(job)
+            self._cond.notify_all()
+        self._deliver_updates()
+
+    def _stop_job(self, job_id, state):
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if not job or job.state in JobState.FINAL:
+                return
+            if state == JobState.PAUSED and job.state not in (JobState.QUEUED, JobState.RUNNING):
+                return
+            job.state = state
+            job._stop.set()
+            self._record_update(job)
+            self._cond.notify_all()
+        self._deliver_updates()
+
+    # Update delivery
+
+    def _record_update(self, job):
+        """Snapshot a state change; must be called with the lock held"""
+        self._updates.append((job, job.state))
+        self._undelivered += 1
+
+    def _deliver_updates(self):
+        """Call on_update for recorded changes, one thread at a time and in order"""
+        with self._deliver_lock:
+            while True:
+                with self._cond:
+                    if not self._updates:
+                        return
+                    job, state = self._updates.popleft()
+                try:
+                    if self.on_update:
+                        self.on_update(job, state)
+                finally:
+                    with self._cond:
+                        self._undelivered -= 1
+                        self._cond.notify_all()
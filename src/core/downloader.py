@@ -1,14 +1,16 @@
-import os
-import re
 from PyQt6.QtCore import QThread, pyqtSignal
-import yt_dlp
-from src.core.utils import get_ffmpeg_path
+from src.core.engine import check_ffmpeg, extract_video_info, download_video
+from src.core.formats import CodecPolicy, FormatIndex
+from src.core.log import get_logger
+from src.core.progress import ProgressCoalescer, ProgressEvent
+
+log = get_logger('downloader')
 
 class DownloaderThread(QThread):
     """Thread for downloading videos without freezing the GUI"""
-    progress = pyqtSignal(str)
+    progress = pyqtSignal(object)  # ProgressEvent
     finished = pyqtSignal(bool, str)
-    info_retrieved = pyqtSignal(dict)
+    info_retrieved = pyqtSignal(str)  # video ID; the VideoInfo stays in ``info``
     formats_retrieved = pyqtSignal(list)
 
     def __init__(self, url, save_path, selected_height=None):
@@ -18,67 +20,30 @@ class DownloaderThread(QThread):
         self.selected_height = selected_height
         self.info = None
         self.custom_title = None
+        self.codec_policy = CodecPolicy.COMPATIBLE
+        self.clip = None  # ClipRange to download only part of the video
+        self.coalescer = ProgressCoalescer(self.progress.emit)
 
     def get_video_info(self):
         """Retrieve video information without downloading"""
         try:
-            print("Starting video info retrieval...")
-            ffmpeg_location = get_ffmpeg_path()
-            
-            if not os.path.exists(ffmpeg_location):
-                self.finished.emit(False, f"Error: ffmpeg not found at {ffmpeg_location}")
+            try:
+                ffmpeg_location = check_ffmpeg()
+            except RuntimeError as e:
+                self.finished.emit(False, f"Error: {str(e)}")
                 return
-                
-            if not os.access(ffmpeg_location, os.X_OK):
-                try:
-                    os.chmod(ffmpeg_location, 0o755)
-                except Exception as e:
-                    self.finished.emit(False, f"Error: Could not make ffmpeg executable: {str(e)}")
-                    return
-
-            print("Initializing yt-dlp options...")
-            ydl_opts = {
-                'quiet': False,
-                'no_warnings': False,
-                'ffmpeg_location': os.path.dirname(ffmpeg_location),
-            }
 
-            print("Creating yt-dlp instance...")
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                print("Extracting video info...")
-                info = ydl.extract_info(self.url, download=False)
-                print("Video info extracted successfully")
-                
-                # Store only necessary info
-                self.info = {
-                    'title': info.get('title', ''),
-                    'formats': info.get('formats', []),
-                    'url': self.url
-                }
-                
-                self.info_retrieved.emit(self.info)
+            info = extract_video_info(self.url, ffmpeg_location)
 
-                print("Processing available formats...")
-                available_heights = set()
-                
-                # Get all available heights from formats with h264 codec
-                for f in info['formats']:
-                    if (f.get('vcodec', '').startswith('avc1') or  # h264 codec
-                        f.get('vcodec', '').startswith('h264')):
-                        height = f.get('height', 0)
-                        if height:
-                            available_heights.add(height)
-                            print(f"Found format: {height}p - {f.get('vcodec', 'N/A')}")
+            self.info = info
+            self.info_retrieved.emit(info.id or '')
 
-                # Sort heights in descending order
-                heights = sorted(list(available_heights), reverse=True)
-                print(f"Available heights: {heights}")
-                self.formats_retrieved.emit(heights)
-                print("Format processing completed")
-                self.finished.emit(True, "Video information retrieved successfully")
+            heights = FormatIndex(info).heights(self.codec_policy)
+            self.formats_retrieved.emit(heights)
+            self.finished.emit(True, "Video information retrieved successfully")
 
         except Exception as e:
-            print(f"Error during video info retrieval: {str(e)}")
+            log.warning("extraction failed", exc_info=True, extra={'url': self.url})
             self.finished.emit(False, f"Error: {str(e)}")
 
     def run(self):
@@ -87,51 +52,14 @@ class DownloaderThread(QThread):
                 self.get_video_info()
                 return
 
-            ffmpeg_location = get_ffmpeg_path()
-            
-            if not os.path.exists(ffmpeg_location):
-                self.finished.emit(False, f"Error: ffmpeg not found at {ffmpeg_location}")
-                return
-                
-            if not os.access(ffmpeg_location, os.X_OK):
-                try:
-                    os.chmod(ffmpeg_location, 0o755)
-                except Exception as e:
-                    self.finished.emit(False, f"Error: Could not make ffmpeg executable: {str(e)}")
-                    return
-            
-            format_spec = f'bestvideo[height={self.selected_height}][vcodec^=avc]+bestaudio[ext=m4a]/best[height<={self.selected_height}][vcodec^=avc]' if self.selected_height else 'bestvideo[vcodec^=avc]+bestaudio[ext=m4a]/best[vcodec^=avc]'
-            
-            # Use custom title if available
-            output_template = os.path.join(self.save_path, '%(title)s.%(ext)s')
-            if self.custom_title:
-                output_template = os.path.join(self.save_path, f"{self.custom_title}.%(ext)s")
-            
-            ydl_opts = {
-                'format': format_spec,
-                'progress_hooks': [self.progress_hook],
-                'quiet': True,
-                'no_warnings': True,
-                'outtmpl': output_template,
-                'merge_output_format': 'mp4',
-                'ffmpeg_location': os.path.dirname(ffmpeg_location),
-            }
-
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                ydl.download([self.url])
-                
+            download_video(self.url, self.save_path, self.selected_height,
+                           self.custom_title, self.progress_hook, info=self.info,
+                           codec_policy=self.codec_policy, clip=self.clip)
+            self.coalescer.flush()
             self.finished.emit(True, "Download completed successfully!")
         except Exception as e:
+            log.warning("download failed", exc_info=True, extra={'url': self.url})
             self.finished.emit(False, f"Error: {str(e)}")
 
     def progress_hook(self, d):
-        if d['status'] == 'downloading':
-            try:
-                percent = d.get('_percent_str', '0%').replace('%', '').strip()
-                # Remove ANSI color codes if present
-                percent = re.sub(r'\x1b\[[0-9;]*m', '', percent)
-                self.progress.emit(f"Downloading: {percent}%")
-            except:
-                self.progress.emit("Downloading...")
-        elif d['status'] == 'finished':
-            self.progress.emit('Processing downloaded file...') 
\ No newline at end of file
+        self.coalescer.push(ProgressEvent.from_hook(None, d))
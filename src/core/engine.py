@@ -0,0 +1,541 @@
+import functools
+import os
+from concurrent.futures import Future, ThreadPoolExecutor
+import subprocess
+import threading
+import time
+from src.core.archive import format_key
+from src.core.bandwidth import BandwidthScheduler
+from src.core.cache import get_metadata_cache
+from src.core.clip import ClipRange
+from src.core.download_queue import DownloadQueue, JobSkipped, JobState
+from src.core.formats import CodecPolicy, FormatIndex
+from src.core.log import YtDlpLogger, get_logger
+from src.core.media import VideoInfo
+from src.core.merge import MergePool
+from src.core.metrics import get_metrics
+from src.core.parallel import ConnectionTuner
+from src.core.playlist import PlaylistExpansion
+from src.core.progress import Phase, ProgressCoalescer, ProgressEvent
+from src.core.utils import get_ffmpeg_path, extract_video_id
+
+# yt_dlp is imported inside the functions that need it: loading it pulls in
+# the whole extractor registry, which would otherwise delay the first window.
+
+log = get_logger('engine')
+
+def preload_yt_dlp():
+    """Import yt_dlp and warm up a pooled extraction instance in a background thread"""
+    def warm():
+        try:
+            ffmpeg_location = check_ffmpeg()
+        except RuntimeError:
+            __import__('yt_dlp')
+            return
+        from src.core.ydl import get_ydl_pool
+        get_ydl_pool().warm(_extraction_opts(ffmpeg_location))
+
+    thread = threading.Thread(target=warm, daemon=True)
+    thread.start()
+    return thread
+
+
+@functools.lru_cache(maxsize=None)
+def check_ffmpeg():
+    """Return the bundled ffmpeg path, making it executable if needed.
+
+    The result is cached per process; failures are not, so installing ffmpeg
+    while the app is running still works.
+    """
+    ffmpeg_location = get_ffmpeg_path()
+
+    if not os.path.exists(ffmpeg_location):
+        raise RuntimeError(f"ffmpeg not found at {ffmpeg_location}")
+
+    if not os.access(ffmpeg_location, os.X_OK):
+        try:
+            os.chmod(ffmpeg_location, 0o755)
+        except Exception as e:
+            raise RuntimeError(f"Could not make ffmpeg executable: {str(e)}")
+
+    return ffmpeg_location
+
+
+@functools.lru_cache(maxsize=None)
+def ffmpeg_capabilities():
+    """Version and encoder list of the bundled ffmpeg, probed once per process"""
+    ffmpeg_location = check_ffmpeg()
+    version = subprocess.run([ffmpeg_location, '-hide_banner', '-version'],
+                             capture_output=True, text=True).stdout
+    encoders = subprocess.run([ffmpeg_location, '-hide_banner', '-encoders'],
+                              capture_output=True, text=True).stdout
+    return {
+        'path': ffmpeg_location,
+        'version': version.split('\n', 1)[0].strip(),
+        'encoders': frozenset(line.split()[1] for line in encoders.splitlines()
+                              if len(line.split()) > 1 and line.startswith(' ') and
+                              len(line.split()[0]) == 6),
+    }
+
+
+def _extraction_opts(ffmpeg_location, ydl_opts=None):
+    opts = {
+        'quiet': True,
+        'no_warnings': True,
+        'logger': YtDlpLogger(),
+        'ffmpeg_location': os.path.dirname(ffmpeg_location),
+    }
+    opts.update(ydl_opts or {})
+    return opts
+
+
+def extract_video_info(url, ffmpeg_location, use_cache=True, ydl_opts=None):
+    """Extract a VideoInfo for url, going through the metadata cache.
+
+    Only the compact VideoInfo is cached and returned; it can be fed back to
+    ``download_video`` without another extraction.
+    """
+    cache = get_metadata_cache() if use_cache else None
+    video_id = extract_video_id(url)
+    if cache and video_id:
+        info = cache.get(video_id)
+        if info is not None:
+            return VideoInfo.from_info(info)
+
+    from src.core.ydl import get_ydl_pool
+    started = time.monotonic()
+    with get_ydl_pool().lease(_extraction_opts(ffmpeg_location, ydl_opts)) as ydl:
+        info = VideoInfo.from_info(ydl.sanitize_info(ydl.extract_info(url, download=False),
+                                                     remove_private_keys=True))
+    if cache and video_id:
+        cache.put(video_id, info.to_info(), time.monotonic() - started)
+    return info
+
+
+def download_video(url, save_path, selected_height=None, custom_title=None, progress_hook=None,
+                   info=None, parallel=None, tuner=None, codec_policy=CodecPolicy.COMPATIBLE,
+                   selection=None, deferred_merges=None, throttle=None, logger=None, clip=None,
+                   preallocate=False):
+    """Download a single video; raises on failure.
+
+    When ``info`` (a VideoInfo or info dict, or a cache entry) is available
+    the download starts from it instead of extracting again. ``parallel`` (a
+    ParallelOptions) enables multi-connection range downloads and concurrent
+    fragment fetching, with ``tuner`` carrying connection counts between
+    downloads. The formats come from ``selection`` or, when info is
+    available, from the cheapest FormatIndex combination the codec policy
+    allows. With a ``deferred_merges`` list the separately downloaded video
+    and audio streams are not merged; a MergeRequest for each is appended
+    to the list instead. ``throttle(nbytes)`` is called for every block read
+    from the network and may block to enforce a bandwidth limit. yt-dlp's
+    messages go to ``logger`` (a YtDlpLogger by default). With a ``clip``
+    (a ClipRange) only that section is downloaded, by ffmpeg, which reads
+    just the parts of the streams it needs and muxes them as it goes; clips
+    are neither split over connections, deferred to the merge pool nor
+    throttled. ``preallocate`` reserves the whole file on disk before a
+    multi-connection download starts, which is worth it on local (staging)
+    disks. The YoutubeDL instance is leased from the process-wide
+    YoutubeDLPool. Returns the path of the finished (or to be merged) file
+    when yt-dlp reports it.
+    Shared by DownloaderThread and the download queue workers, so it must not
+    touch any Qt objects.
+    """
+    ffmpeg_location = check_ffmpeg()
+
+    if info is None:
+        video_id = extract_video_id(url)
+        if video_id:
+            info = get_metadata_cache().get(video_id)
+    if info is None and clip is not None:
+        # The clip's format has to be picked from the format list
+        info = extract_video_info(url, ffmpeg_location)
+    if info is not None:
+        info = VideoInfo.from_info(info)
+        if clip is not None:
+            clip.check(info.duration)
+
+    if selection is None and info is not None:
+        selection = FormatIndex(info, seekable=clip is not None).select(selected_height,
+                                                                        codec_policy)
+    if clip is not None and selection is None:
+        raise ValueError("no format at this resolution can be clipped; DASH fragment lists "
+                         "can't be cut without downloading them whole")
+    if selection is not None:
+        format_spec = selection.format_spec
+        container = selection.container
+    else:
+        format_spec = f'bestvideo[height={selected_height}][vcodec^=avc]+bestaudio[ext=m4a]/best[height<={selected_height}][vcodec^=avc]' if selected_height else 'bestvideo[vcodec^=avc]+bestaudio[ext=m4a]/best[vcodec^=avc]'
+        container = 'mp4'
+
+    # Use custom title if available
+    name = custom_title or '%(title)s'
+    if clip is not None:
+        # Never overwrite the full video, or another clip of it
+        name += clip.file_suffix()
+    output_template = os.path.join(save_path, f"{name}.%(ext)s")
+
+    ydl_opts = {
+        'format': format_spec,
+        'progress_hooks': [progress_hook] if progress_hook else [],
+        'quiet': True,
+        'no_warnings': True,
+        # Progress goes through the hooks; yt-dlp would otherwise print its bar to stdout
+        'noprogress': True,
+        'logger': logger or YtDlpLogger(),
+        'outtmpl': output_template,
+        'merge_output_format': container,
+        'ffmpeg_location': os.path.dirname(ffmpeg_location),
+    }
+    if clip is not None:
+        ydl_opts.update(clip.ydl_opts())
+        parallel = deferred_merges = throttle = None
+
+    import yt_dlp
+    from src.core.ydl import EngineYoutubeDL, get_ydl_pool
+    if clip is not None:
+        # yt-dlp decides whether ffmpeg can download sections without looking at
+        # ffmpeg_location; its own command line sets this (per-thread) default instead
+        from yt_dlp.postprocessor.ffmpeg import FFmpegPostProcessor
+        FFmpegPostProcessor._ffmpeg_location.set(ffmpeg_location)
+    ydl_class = EngineYoutubeDL
+    job_attrs = {'deferred_merges': deferred_merges, 'throttle': throttle}
+    if parallel:
+        from src.core.ranged import ParallelYoutubeDL
+        ydl_class = ParallelYoutubeDL
+        ydl_opts['concurrent_fragment_downloads'] = parallel.fragment_concurrency
+        job_attrs.update(parallel=parallel, tuner=tuner or ConnectionTuner(),
+                         preallocate=preallocate)
+
+    # A warm instance from an earlier job with the same options, if there is one
+    with get_ydl_pool().lease(ydl_opts, ydl_class, **job_attrs) as ydl:
+        if info is None:
+            return _output_path(ydl.extract_info(url, download=True))
+        try:
+            return _output_path(ydl.process_ie_result(info.to_info(), download=True))
+        except yt_dlp.utils.DownloadError as e:
+            # Errors raised by our own hook (e.g. a cancelled queue job) must propagate
+            cause = e.exc_info[1] if e.exc_info else None
+            if cause is not None and not isinstance(cause, yt_dlp.utils.YoutubeDLError):
+                raise
+            # Most likely the signed stream URLs have expired; extract again
+            video_id = extract_video_id(url)
+            if video_id:
+                get_metadata_cache().invalidate(video_id)
+            return _output_path(ydl.extract_info(url, download=True))
+
+
+def _output_path(result):
+    downloads = (result or {}).get('requested_downloads') or [{}]
+    return downloads[-1].get('filepath')
+
+
+class DownloadEngine:
+    """Qt-free download front end shared by the GUI and the command line.
+
+    Wraps a DownloadQueue whose workers extract (through the metadata cache)
+    and download each job. ``on_update(job, state)`` fires on state changes and
+    ``on_progress(job, event)`` with a ProgressEvent, at most ``progress_rate``
+    times per second per job; ``on_selection(job, selection)`` reports the
+    chosen formats with their projected size and merge cost before the
+    transfer starts. All of them run in worker threads. Pass ``parallel``
+    (a ParallelOptions) to download each job over several connections and
+    ``journal`` (a JobJournal) to persist jobs so ``resume_unfinished`` can
+    pick them up again after a restart.
+
+    Video+audio merges run in a pool of ``merge_workers`` processes: the
+    download worker moves on to the next job as soon as the streams are on
+    disk and the job completes once its merge has finished, with the merge's
+    wall-clock and CPU time stored on the job. ``merge_workers=0`` merges
+    inline in the download worker as yt-dlp normally does.
+
+    Every byte the workers download passes through ``bandwidth`` (a
+    BandwidthScheduler, unlimited unless configured), which caps the
+    aggregate rate of all jobs and splits it by the weights given to
+    ``submit``/``set_weight``.
+
+    With ``staging`` (a StagingArea) jobs download and merge in a local
+    directory and only the finished file is moved to ``save_path``, so slow
+    (network) destinations never see partial files; jobs the staging area
+    has no room for write to ``save_path`` directly.
+
+    With an ``archive`` (a DownloadArchive) jobs for videos that were
+    already downloaded in the requested format are skipped, checked from
+    the URL before any network request where possible, and every finished
+    download is recorded in it.
+
+    Each job's time is broken down into spans (queue wait, extraction,
+    transfer, merge, rename) stored in ``job.spans`` and aggregated in the
+    process-wide Metrics along with byte, retry and failure counters and
+    gauges for active jobs, queue depth and pending merges.
+    """
+
+    def __init__(self, max_workers=3, per_host_limit=2, on_update=None, on_progress=None,
+                 quiet=True, progress_rate=4.0, parallel=None, journal=None, on_selection=None,
+                 merge_workers=2, bandwidth=None, archive=None, staging=None):
+        self.on_update = on_update
+        self.on_progress = on_progress
+        self.on_selection = on_selection
+        self.quiet = quiet
+        self.progress_rate = progress_rate
+        self.parallel = parallel
+        self.tuner = ConnectionTuner()
+        self.journal = journal
+        self.merge_pool = MergePool(merge_workers) if merge_workers else None
+        self.bandwidth = bandwidth or BandwidthScheduler()
+        self.archive = archive
+        self.staging = staging
+        self._staged = {}  # job id -> (StagingArea, key)
+        # Moves out of staging after a pooled merge; across devices they are full copies
+        self._movers = ThreadPoolExecutor(2, thread_name_prefix='staging-move')
+        self.expansions = []
+        self._closing = False
+        self.queue = DownloadQueue(self._run_job, max_workers, per_host_limit,
+                                   on_update=self._job_updated)
+        self.metrics = get_metrics()
+        self.metrics.set_gauge('active_jobs', lambda: self._count_jobs(JobState.RUNNING))
+        self.metrics.set_gauge('queue_depth', lambda: self._count_jobs(JobState.QUEUED))
+        self.metrics.set_gauge('merges_pending',
+                               lambda: self.merge_pool.pending if self.merge_pool else 0)
+
+    def _count_jobs(self, state):
+        return sum(1 for job in self.queue.jobs() if job.state == state)
+
+    def submit(self, url, save_path, selected_height=None, custom_title=None, priority=0,
+               info=None, codec_policy=CodecPolicy.COMPATIBLE, weight=1.0, clip=None):
+        journal_id = None
+        if self.journal:
+            journal_id = self.journal.add(url, save_path, selected_height, custom_title, priority,
+                                          codec_policy=codec_policy, clip=clip)
+        job = self.queue.add(url, save_path, selected_height, custom_title, priority, info,
+                             journal_id, codec_policy, clip)
+        if weight != 1.0:
+            self.bandwidth.set_weight(job.id, weight)
+        return job
+
+    def submit_playlist(self, url, save_path, selected_height=None,
+                        codec_policy=CodecPolicy.COMPATIBLE, on_entry=None):
+        """Queue every video of a playlist or channel while it is being listed.
+
+        Returns the running PlaylistExpansion; ``on_entry(expansion, job,
+        entry)`` is called from its thread for each queued video.
+        """
+        expansion = PlaylistExpansion(self, url, save_path, selected_height, codec_policy,
+                                      on_entry=on_entry)
+        self.expansions = [e for e in self.expansions if not e.finished] + [expansion]
+        return expansion.start()
+
+    def set_weight(self, job_id, weight):
+        """Share of the bandwidth limit relative to other jobs (default 1.0)"""
+        self.bandwidth.set_weight(job_id, weight)
+
+    def resume_unfinished(self):
+        """Re-queue jobs the journal says never finished; they continue from their partial files"""
+        if not self.journal:
+            return []
+        jobs = []
+        for entry in self.journal.unfinished():
+            job = self.queue.add(entry.url, entry.save_path, entry.selected_height,
+                                 entry.custom_title, entry.priority, journal_id=entry.id,
+                                 codec_policy=entry.codec_policy or CodecPolicy.COMPATIBLE,
+                                 clip=ClipRange.parse(entry.clip) if entry.clip else None)
+            if entry.state == JobState.PAUSED:
+                self.queue.pause(job.id)
+            jobs.append(job)
+        return jobs
+
+    def wait(self, timeout=None):
+        """Wait until playlists are fully listed and every job has finished"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for expansion in list(self.expansions):
+            remaining = None if deadline is None else max(deadline - time.monotonic(), 0)
+            if not expansion.wait(remaining):
+                return False
+        remaining = None if deadline is None else max(deadline - time.monotonic(), 0)
+        return self.queue.join(remaining)
+
+    def shutdown(self, cancel_running=True):
+        self._closing = True
+        for expansion in self.expansions:
+            expansion.cancel()
+        self.queue.shutdown(cancel_running)
+        if self.merge_pool:
+            # Running merges finish in the background; queued ones are redone on resume
+            self.merge_pool.shutdown(wait=False)
+        self._movers.shutdown(wait=False)
+
+    def _job_updated(self, job, state):
+        if state in JobState.FINAL:
+            self.bandwidth.forget(job.id)
+            staged = self._staged.pop(job.id, None)
+            if staged is not None:
+                # Completed jobs have been moved out already; anything left is partial
+                staged[0].release(staged[1])
+            self.metrics.inc('jobs_finished_total', state=state)
+            spans = {name: round(seconds, 3) for name, seconds in job.spans.items()}
+            if state == JobState.FAILED:
+                cause = failure_cause(job.error)
+                self.metrics.inc('job_failures_total', cause=cause)
+                log.warning("job failed", extra={'job': job.id, 'url': job.url, 'cause': cause,
+                                                 'error': job.message, 'spans': spans})
+            else:
+                log.info("job %s", state, extra={'job': job.id, 'url': job.url, 'spans': spans})
+        else:
+            log.debug("job %s", state, extra={'job': job.id, 'url': job.url})
+        for expansion in self.expansions:
+            expansion.job_updated(job, state)
+        if self.journal and job.journal_id:
+            recorded = state
+            if self._closing and state == JobState.PAUSED:
+                # Interrupted by shutdown rather than by the user: resume next time
+                recorded = JobState.QUEUED
+            self.journal.record_state(job.journal_id, recorded, job.message, job.priority)
+        if self.on_update:
+            self.on_update(job, state)
+
+    def _publish(self, job, event):
+        if self.journal and job.journal_id:
+            if job.progress is None or job.progress.phase != event.phase:
+                self.journal.record_phase(job.journal_id, event.phase)
+            if event.phase == Phase.DOWNLOADING and event.filename:
+                self.journal.record_progress(job.journal_id, event.filename,
+                                             event.downloaded_bytes)
+        job.progress = event
+        if self.on_progress:
+            self.on_progress(job, event)
+
+    def _run_job(self, job):
+        waited = time.monotonic() - job.queued_at
+        job.spans['queue_wait'] = job.spans.get('queue_wait', 0.0) + waited
+        self.metrics.observe('queue_wait', waited)
+        coalescer = ProgressCoalescer(lambda event: self._publish(job, event), self.progress_rate)
+
+        def hook(d):
+            job.check_cancelled()
+            coalescer.push(ProgressEvent.from_hook(job.id, d))
+
+        def throttle(nbytes):
+            self.metrics.inc('bytes_downloaded_total', nbytes)
+            self.bandwidth.consume(job.id, nbytes, job.check_cancelled)
+
+        fmt = format_key(job.selected_height, job.codec_policy, job.clip)
+        if self.archive and self.archive.contains_url(job.url, fmt):
+            raise JobSkipped("Already downloaded")
+
+        # ffmpeg muxes clips while it downloads them
+        merges = [] if self.merge_pool and job.clip is None else None
+        try:
+            if job.info is None:
+                coalescer.push(ProgressEvent(job.id, Phase.EXTRACTING))
+                with self.metrics.span('extraction', job):
+                    job.info = extract_video_info(job.url, check_ffmpeg(), ydl_opts={
+                        'quiet': self.quiet, 'no_warnings': self.quiet,
+                        'logger': YtDlpLogger(job.id)})
+                job.check_cancelled()
+            archive_key = None
+            if self.archive and job.info.get('id'):
+                archive_key = ((job.info.get('extractor_key') or 'generic').lower(),
+                               job.info.id, fmt)
+                if self.archive.contains(*archive_key):
+                    raise JobSkipped("Already downloaded")
+            selection = FormatIndex(job.info, seekable=job.clip is not None).select(
+                job.selected_height, job.codec_policy)
+            if selection is not None and self.on_selection:
+                self.on_selection(job, selection)
+            save_path = self._stage(job, selection)
+            with self.metrics.span('transfer', job):
+                job.output_path = download_video(job.url, save_path, job.selected_height,
+                                                 job.custom_title, hook, info=job.info,
+                                                 parallel=self.parallel, tuner=self.tuner,
+                                                 codec_policy=job.codec_policy,
+                                                 selection=selection, deferred_merges=merges,
+                                                 throttle=throttle, logger=YtDlpLogger(job.id),
+                                                 clip=job.clip,
+                                                 preallocate=save_path != job.save_path)
+        finally:
+            coalescer.flush()
+        if not merges:
+            self._unstage(job)
+            self._job_finished(job, coalescer, archive_key)
+            return None
+        coalescer.push(ProgressEvent(job.id, Phase.PROCESSING, filename=job.output_path))
+        return self._merge(job, merges, coalescer, archive_key)
+
+    def _merge(self, job, merges, coalescer, archive_key):
+        """Run the job's merges in the pool; the returned future completes the job"""
+        done = Future()
+
+        def finish():
+            try:
+                self._unstage(job)
+                self._job_finished(job, coalescer, archive_key)
+            except BaseException as e:
+                done.set_exception(e)
+            else:
+                done.set_result(job.output_path)
+
+        def merged(future):
+            try:
+                result = future.result()
+            except BaseException as e:
+                done.set_exception(e)
+                return
+            job.merge_seconds = result['seconds']
+            job.merge_cpu_seconds = result['cpu_seconds']
+            for span in ('merge', 'rename'):
+                seconds = result['seconds' if span == 'merge' else 'rename_seconds']
+                job.spans[span] = job.spans.get(span, 0.0) + seconds
+                self.metrics.observe(span, seconds)
+            if job.id in self._staged:
+                # Not on the pool's result thread, which every other merge completes through
+                self._movers.submit(finish)
+            else:
+                finish()
+
+        self.merge_pool.submit(check_ffmpeg(), merges).add_done_callback(merged)
+        return done
+
+    def _stage(self, job, selection):
+        """The directory the job writes to: its staging directory or its destination"""
+        staging = self.staging
+        if staging is None:
+            return job.save_path
+        expected = selection.total_bytes if selection is not None else None
+        if expected:
+            if selection.needs_merge:
+                # The streams and the merged file are on disk together
+                expected *= 2
+            if job.clip is not None and job.info.duration:
+                expected *= min(job.clip.duration / job.info.duration, 1.0)
+        # Journaled jobs keep their directory across restarts to resume from it
+        key = f'journal-{job.journal_id}' if job.journal_id else f'job-{os.getpid()}-{job.id}'
+        path = staging.acquire(key, int(expected) if expected else None)
+        if path is None:
+            return job.save_path
+        self._staged[job.id] = (staging, key)
+        return path
+
+    def _unstage(self, job):
+        staged = self._staged.get(job.id)
+        if staged is None:
+            return
+        with self.metrics.span('rename', job):
+            job.output_path = staged[0].finish(staged[1], job.save_path, job.output_path)
+        del self._staged[job.id]
+
+    def _job_finished(self, job, coalescer, archive_key=None):
+        if self.journal and job.journal_id:
+            self.journal.record_output(job.journal_id, job.output_path)
+        if archive_key is not None:
+            self.archive.record(*archive_key, job.output_path)
+        coalescer.push(ProgressEvent(job.id, Phase.FINISHED))
+
+
+def failure_cause(error):
+    """Short label for why a job failed: the underlying exception's class name"""
+    if error is None:
+        return 'unknown'
+    # yt-dlp wraps the real error (e.g. an HTTPError) in a DownloadError
+    exc_info = getattr(error, 'exc_info', None)
+    if exc_info and exc_info[1] is not None:
+        error = exc_info[1]
+    return type(error).__name__
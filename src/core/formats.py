@@ -0,0 +1,190 @@
+# Stream copy (remux) into the output container is assumed to run at roughly
+# this many bytes per second; it's disk bound, so this is only an estimate.
+MERGE_BYTES_PER_SECOND = 150 * 1024 * 1024
+
+CODEC_PREFIXES = (
+    ('avc1', 'h264'), ('avc3', 'h264'), ('h264', 'h264'),
+    ('hev1', 'h265'), ('hvc1', 'h265'), ('h265', 'h265'), ('hevc', 'h265'),
+    ('vp09', 'vp9'), ('vp9', 'vp9'), ('vp8', 'vp8'),
+    ('av01', 'av1'), ('av1', 'av1'),
+    ('mp4a', 'aac'), ('aac', 'aac'), ('opus', 'opus'), ('vorbis', 'vorbis'),
+    ('mp3', 'mp3'), ('ac-3', 'ac3'), ('ec-3', 'eac3'),
+)
+
+# Fragment lists yt-dlp downloads itself; ffmpeg can't seek in them, so clips skip them
+FRAGMENTED_PROTOCOLS = ('http_dash_segments', 'http_dash_segments_generator')
+
+# Codecs ffmpeg can stream-copy into each container without re-encoding
+CONTAINER_CODECS = {
+    'mp4': ({'h264', 'h265', 'vp9', 'av1'}, {'aac', 'mp3', 'opus', 'ac3', 'eac3'}),
+    'mkv': ({'h264', 'h265', 'vp8', 'vp9', 'av1'}, {'aac', 'mp3', 'opus', 'vorbis', 'ac3', 'eac3'}),
+}
+
+
+class CodecPolicy:
+    """Which codecs the selector may pick"""
+    COMPATIBLE = 'compatible'  # H.264 + AAC only, plays everywhere
+    EFFICIENT = 'efficient'    # any codec that can be remuxed into the output container
+
+    LABELS = {
+        COMPATIBLE: 'H.264 (most compatible)',
+        EFFICIENT: 'Smallest file (VP9/AV1 when it can be remuxed)',
+    }
+
+    ALLOWED = {
+        COMPATIBLE: ({'h264'}, {'aac'}),
+    }
+
+    @classmethod
+    def allowed(cls, policy, container='mp4'):
+        return cls.ALLOWED.get(policy) or CONTAINER_CODECS[container]
+
+
+def codec_family(codec):
+    if not codec or codec == 'none':
+        return None
+    codec = codec.lower()
+    for prefix, family in CODEC_PREFIXES:
+        if codec.startswith(prefix):
+            return family
+    return codec.split('.')[0]
+
+
+class FormatEntry:
+    """The parts of a yt-dlp format dict the selector cares about"""
+    __slots__ = ('format_id', 'height', 'fps', 'vcodec', 'acodec', 'ext', 'bitrate', 'size')
+
+    def __init__(self, f, duration):
+        self.format_id = f.get('format_id')
+        self.height = f.get('height') or 0
+        self.fps = f.get('fps') or 0
+        self.vcodec = codec_family(f.get('vcodec'))
+        self.acodec = codec_family(f.get('acodec'))
+        self.ext = f.get('ext')
+        self.bitrate = f.get('tbr') or f.get('vbr') or f.get('abr') or 0
+        size = f.get('filesize') or f.get('filesize_approx')
+        if not size and self.bitrate and duration:
+            size = int(self.bitrate * 125 * duration)  # kbit/s -> bytes
+        self.size = size or 0
+
+    @property
+    def is_video_only(self):
+        return self.vcodec is not None and self.acodec is None
+
+    @property
+    def is_audio_only(self):
+        return self.acodec is not None and self.vcodec is None
+
+    @property
+    def is_progressive(self):
+        return self.vcodec is not None and self.acodec is not None
+
+
+class Selection:
+    """A chosen video(+audio) combination with its projected cost"""
+
+    def __init__(self, video, audio, container):
+        self.video = video
+        self.audio = audio
+        self.container = container
+
+    @property
+    def format_spec(self):
+        if self.audio is None:
+            return self.video.format_id
+        return f'{self.video.format_id}+{self.audio.format_id}'
+
+    @property
+    def total_bytes(self):
+        return self.video.size + (self.audio.size if self.audio else 0)
+
+    @property
+    def needs_merge(self):
+        return self.audio is not None
+
+    @property
+    def merge_seconds(self):
+        """Estimated stream-copy time; the merge reads and writes every byte once"""
+        if not self.needs_merge:
+            return 0.0
+        return 2 * self.total_bytes / MERGE_BYTES_PER_SECOND
+
+    def describe(self):
+        codecs = self.video.vcodec + (f' + {self.audio.acodec}' if self.audio else '')
+        fps = f'{self.video.fps:g}' if self.video.fps and self.video.fps > 30 else ''
+        return f'{self.video.height}p{fps} {codecs} -> {self.container}'
+
+
+class FormatIndex:
+    """Formats of one video indexed by height and codec, built once per info dict.
+
+    With ``seekable`` only formats ffmpeg can seek in are indexed, as clips need.
+    """
+
+    def __init__(self, info, seekable=False):
+        duration = info.get('duration')
+        self.video = {}   # height -> [FormatEntry], video-only and progressive
+        self.audio = []   # audio-only, sorted by bitrate
+        for f in info.get('formats') or []:
+            if not f.get('format_id') or f.get('protocol') in ('mhtml',):
+                continue
+            if seekable and f.get('protocol') in FRAGMENTED_PROTOCOLS:
+                continue
+            entry = FormatEntry(f, duration)
+            if entry.is_audio_only:
+                self.audio.append(entry)
+            elif entry.vcodec is not None and entry.height:
+                self.video.setdefault(entry.height, []).append(entry)
+        self.audio.sort(key=lambda e: e.bitrate)
+        self._heights = sorted(self.video)
+
+    def heights(self, policy=CodecPolicy.COMPATIBLE, container='mp4'):
+        """Available heights (highest first) that the policy can deliver"""
+        vcodecs, _ = CodecPolicy.allowed(policy, container)
+        return [h for h in reversed(self._heights)
+                if any(e.vcodec in vcodecs for e in self.video[h])]
+
+    def _audio_for(self, acodecs, min_audio_bitrate):
+        candidates = [a for a in self.audio if a.acodec in acodecs]
+        if not candidates:
+            return None
+        # Cheapest stream that still meets the bitrate floor, else the best there is
+        good = [a for a in candidates if a.bitrate >= min_audio_bitrate]
+        return min(good, key=lambda a: a.size or a.bitrate) if good else candidates[-1]
+
+    def select(self, height=None, policy=CodecPolicy.COMPATIBLE, container='mp4',
+               max_fps=None, min_audio_bitrate=128):
+        """Cheapest combination at ``height`` (or the closest lower one) that fits the policy.
+
+        Quality is the height plus the highest frame rate available there (up
+        to ``max_fps``); among the combinations delivering it the one with
+        the smallest projected size wins.
+        """
+        vcodecs, acodecs = CodecPolicy.allowed(policy, container)
+        heights = self.heights(policy, container)
+        if not heights:
+            return None
+        if height is None:
+            target = heights[0]
+        else:
+            lower = [h for h in heights if h <= height]
+            target = lower[0] if lower else heights[-1]
+
+        videos = [e for e in self.video[target] if e.vcodec in vcodecs and
+                  (max_fps is None or e.fps <= max_fps)]
+        if not videos:
+            return None
+        best_fps = max(e.fps for e in videos)
+        videos = [e for e in videos if e.fps == best_fps]
+
+        audio = self._audio_for(acodecs, min_audio_bitrate)
+        options = []
+        for video in videos:
+            if video.is_progressive:
+                if video.acodec in acodecs:
+                    options.append(Selection(video, None, container))
+            elif audio is not None:
+                options.append(Selection(video, audio, container))
+        if not options:
+            return None
+        return min(options, key=lambda s: (s.total_bytes or float('inf'), -s.video.bitrate))
@@ -0,0 +1,134 @@
+import os
+import sqlite3
+import threading
+import time
+
+from src.core.utils import get_app_dir
+
+# States a job can be resumed from after the app was closed or crashed
+UNFINISHED_STATES = ('queued', 'running', 'paused')
+
+
+class JournalEntry:
+    """One row of the job journal"""
+
+    def __init__(self, row):
+        (self.id, self.url, self.save_path, self.selected_height, self.custom_title,
+         self.priority, self.state, self.phase, self.output_path, self.partial_path,
+         self.partial_bytes, self.message, self.created, self.updated,
+         self.codec_policy, self.clip) = row
+
+
+class JobJournal:
+    """Persistent record of every queued job so unfinished work survives a crash.
+
+    yt-dlp resumes ``.part`` files and fragment downloads (``.ytdl`` state)
+    on its own as long as the job is retried with the same output name, and
+    the ranged downloader keeps its own chunk map next to its temp file, so
+    the journal only has to remember what was asked for and how far it got.
+    """
+
+    COLUMNS = ('id, url, save_path, selected_height, custom_title, priority, state, phase, '
+               'output_path, partial_path, partial_bytes, message, created, updated, codec_policy, '
+               'clip')
+
+    def __init__(self, path=None, progress_interval=2.0):
+        self.path = path or os.path.join(get_app_dir(), 'jobs.sqlite3')
+        self.progress_interval = progress_interval
+        self._last_progress = {}
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS jobs ('
+                ' id INTEGER PRIMARY KEY AUTOINCREMENT,'
+                ' url TEXT NOT NULL,'
+                ' save_path TEXT NOT NULL,'
+                ' selected_height INTEGER,'
+                ' custom_title TEXT,'
+                ' priority INTEGER NOT NULL DEFAULT 0,'
+                ' state TEXT NOT NULL,'
+                ' phase TEXT,'
+                ' output_path TEXT,'
+                ' partial_path TEXT,'
+                ' partial_bytes INTEGER,'
+                ' message TEXT,'
+                ' created REAL NOT NULL,'
+                ' updated REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state)')
+            # Columns added after the first release
+            columns = {row[1] for row in conn.execute('PRAGMA table_info(jobs)')}
+            if 'codec_policy' not in columns:
+                conn.execute('ALTER TABLE jobs ADD COLUMN codec_policy TEXT')
+            if 'clip' not in columns:
+                conn.execute('ALTER TABLE jobs ADD COLUMN clip TEXT')
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=10)
+
+    def add(self, url, save_path, selected_height=None, custom_title=None, priority=0,
+            state='queued', codec_policy=None, clip=None):
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            cursor = conn.execute(
+                'INSERT INTO jobs (url, save_path, selected_height, custom_title, priority, state,'
+                ' codec_policy, clip, created, updated) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (url, save_path, selected_height, custom_title, priority, state, codec_policy,
+                 clip.spec() if clip else None, now, now))
+            return cursor.lastrowid
+
+    def _update(self, journal_id, **fields):
+        fields['updated'] = time.time()
+        assignments = ', '.join(f'{name} = ?' for name in fields)
+        with self._lock, self._connect() as conn:
+            conn.execute(f'UPDATE jobs SET {assignments} WHERE id = ?',
+                         (*fields.values(), journal_id))
+
+    def record_state(self, journal_id, state, message='', priority=None):
+        fields = {'state': state, 'message': message}
+        if priority is not None:
+            fields['priority'] = priority
+        self._update(journal_id, **fields)
+
+    def record_phase(self, journal_id, phase):
+        self._update(journal_id, phase=phase)
+
+    def record_progress(self, journal_id, partial_path, partial_bytes, force=False):
+        """Store the partial file and offset, at most once per ``progress_interval``"""
+        now = time.monotonic()
+        if not force and now - self._last_progress.get(journal_id, 0) < self.progress_interval:
+            return
+        self._last_progress[journal_id] = now
+        self._update(journal_id, partial_path=partial_path, partial_bytes=partial_bytes)
+
+    def record_output(self, journal_id, output_path):
+        self._last_progress.pop(journal_id, None)
+        self._update(journal_id, output_path=output_path, partial_path=None, partial_bytes=None)
+
+    def get(self, journal_id):
+        with self._lock, self._connect() as conn:
+            row = conn.execute(f'SELECT {self.COLUMNS} FROM jobs WHERE id = ?',
+                               (journal_id,)).fetchone()
+        return JournalEntry(row) if row else None
+
+    def unfinished(self):
+        placeholders = ', '.join('?' for _ in UNFINISHED_STATES)
+        with self._lock, self._connect() as conn:
+            rows = conn.execute(
+                f'SELECT {self.COLUMNS} FROM jobs WHERE state IN ({placeholders}) ORDER BY id',
+                UNFINISHED_STATES).fetchall()
+        return [JournalEntry(row) for row in rows]
+
+    def completed(self):
+        with self._lock, self._connect() as conn:
+            rows = conn.execute(
+                f"SELECT {self.COLUMNS} FROM jobs WHERE state = 'completed' ORDER BY id").fetchall()
+        return [JournalEntry(row) for row in rows]
+
+    def purge_finished(self, older_than=0):
+        placeholders = ', '.join('?' for _ in UNFINISHED_STATES)
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                f'DELETE FROM jobs WHERE state NOT IN ({placeholders}) AND updated < ?',
+                (*UNFINISHED_STATES, time.time() - older_than))
@@ -0,0 +1,83 @@
+import json
+import logging
+import time
+
+from src.core.metrics import get_metrics
+
+LOGGER_NAME = 'youtube_downloader'
+# Attributes every LogRecord has; anything else came in through ``extra``
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+def get_logger(name):
+    return logging.getLogger(f'{LOGGER_NAME}.{name}')
+
+
+def _extra_fields(record):
+    return {key: value for key, value in vars(record).items() if key not in _RECORD_ATTRS}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record with the ``extra`` fields as top-level keys"""
+
+    def format(self, record):
+        event = {
+            'time': round(record.created, 3),
+            'level': record.levelname.lower(),
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        event.update(_extra_fields(record))
+        if record.exc_info:
+            event['exception'] = self.formatException(record.exc_info)
+        return json.dumps(event, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """``12:00:01 WARNING engine: message key=value ...``"""
+
+    def format(self, record):
+        fields = ' '.join(f'{key}={value}' for key, value in _extra_fields(record).items())
+        line = (f"{time.strftime('%H:%M:%S', time.localtime(record.created))} "
+                f"{record.levelname} {record.name.rpartition('.')[2]}: {record.getMessage()}")
+        if fields:
+            line += ' ' + fields
+        if record.exc_info:
+            line += '\n' + self.formatException(record.exc_info)
+        return line
+
+
+def configure_logging(level='warning', json_format=False, stream=None):
+    """Send the app's log records to ``stream`` (stderr by default)"""
+    logger = logging.getLogger(LOGGER_NAME)
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(JsonFormatter() if json_format else TextFormatter())
+    logger.addHandler(handler)
+    logger.setLevel(level.upper() if isinstance(level, str) else level)
+    logger.propagate = False
+    return logger
+
+
+class YtDlpLogger:
+    """``logger`` for YoutubeDL: routes its output into logging and counts retries"""
+
+    def __init__(self, job_id=None):
+        self.log = get_logger('yt_dlp')
+        self.extra = {} if job_id is None else {'job': job_id}
+
+    def debug(self, message):
+        # With a logger set, yt-dlp sends its screen output here as well
+        self.log.debug(message, extra=self.extra)
+
+    def info(self, message):
+        self.log.info(message, extra=self.extra)
+
+    def warning(self, message):
+        if 'Retrying' in message:
+            get_metrics().inc('retries_total', source='yt-dlp')
+        self.log.warning(message, extra=self.extra)
+
+    def error(self, message):
+        self.log.error(message, extra=self.extra)
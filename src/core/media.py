@@ -0,0 +1,91 @@
+# Format fields kept from yt-dlp's info dict: what FormatIndex selects on and
+# what yt-dlp's downloaders read. Everything else (thumbnails, subtitles,
+# storyboards, per-format descriptions) is dropped.
+FORMAT_FIELDS = (
+    'format_id', 'format_note', 'url', 'manifest_url', 'ext', 'protocol', 'container',
+    'vcodec', 'acodec', 'width', 'height', 'fps', 'dynamic_range', 'tbr', 'vbr', 'abr',
+    'asr', 'audio_channels', 'language', 'filesize', 'filesize_approx', 'quality',
+    'preference', 'source_preference', 'has_drm', 'http_headers', 'downloader_options',
+    'fragment_base_url', 'fragments', 'is_from_start', 'available_at',
+)
+VIDEO_FIELDS = (
+    'id', 'title', 'duration', 'extractor', 'extractor_key', 'webpage_url', 'original_url',
+    'webpage_url_domain', 'live_status', 'is_live', 'was_live', 'stretched_ratio',
+    'http_headers',
+)
+# Never downloadable on their own
+SKIPPED_PROTOCOLS = ('mhtml',)
+
+
+class MediaFormat:
+    """One stream of a video with only the fields needed to select and download it.
+
+    ``get`` reads a field like ``dict.get`` so it can stand in for a yt-dlp
+    format dict, e.g. in FormatIndex.
+    """
+    __slots__ = FORMAT_FIELDS
+
+    def __init__(self, fields):
+        for name in FORMAT_FIELDS:
+            setattr(self, name, fields.get(name))
+
+    def get(self, name, default=None):
+        value = getattr(self, name, None)
+        return default if value is None else value
+
+    def as_dict(self):
+        """A fresh format dict for yt-dlp, which modifies the ones it is given"""
+        fmt = {name: getattr(self, name) for name in FORMAT_FIELDS
+               if getattr(self, name) is not None}
+        for name in ('http_headers', 'downloader_options'):
+            if name in fmt:
+                fmt[name] = dict(fmt[name])
+        if 'fragments' in fmt:
+            fmt['fragments'] = [dict(fragment) for fragment in fmt['fragments']]
+        return fmt
+
+
+class VideoInfo:
+    """Compact replacement for an extracted info dict, kept per queued job.
+
+    Holds the top-level fields yt-dlp needs to process the video again and
+    its downloadable formats as MediaFormats. Identical HTTP header dicts
+    are shared between formats instead of being stored once per format.
+    """
+    __slots__ = VIDEO_FIELDS + ('formats',)
+
+    def __init__(self, fields, formats):
+        for name in VIDEO_FIELDS:
+            setattr(self, name, fields.get(name))
+        self.formats = tuple(formats)
+
+    @classmethod
+    def from_info(cls, info):
+        if isinstance(info, cls):
+            return info
+        headers = {}
+        formats = []
+        for f in info.get('formats') or ():
+            if not f.get('url') or f.get('protocol') in SKIPPED_PROTOCOLS:
+                continue
+            fmt = MediaFormat(f)
+            if fmt.http_headers:
+                key = tuple(sorted(fmt.http_headers.items()))
+                fmt.http_headers = headers.setdefault(key, fmt.http_headers)
+            if fmt.fragments:
+                fmt.fragments = tuple(fmt.fragments)
+            formats.append(fmt)
+        return cls(info, formats)
+
+    def get(self, name, default=None):
+        value = getattr(self, name, None)
+        return default if value is None else value
+
+    def to_info(self):
+        """An info dict yt-dlp's ``process_ie_result`` can download from"""
+        info = {name: getattr(self, name) for name in VIDEO_FIELDS
+                if getattr(self, name) is not None}
+        if 'http_headers' in info:
+            info['http_headers'] = dict(info['http_headers'])
+        info['formats'] = [fmt.as_dict() for fmt in self.formats]
+        return info
@@ -0,0 +1,156 @@
+import os
+import subprocess
+import threading
+import time
+
+from src.core.formats import codec_family
+
+# Containers whose index -movflags +faststart moves to the front, as yt-dlp does
+FASTSTART_EXTENSIONS = ('.mp4', '.m4a', '.mov')
+
+
+class MergeRequest:
+    """The video and audio files of one download and the file ffmpeg should mux them into"""
+
+    def __init__(self, inputs, output, args):
+        self.inputs = list(inputs)
+        self.output = output
+        self.args = list(args)
+
+    @classmethod
+    def from_info(cls, info):
+        """Build the same stream-copy merge yt-dlp's FFmpegMergerPP would run"""
+        args = ['-c', 'copy']
+        audio_streams = 0
+        for i, fmt in enumerate(info['requested_formats']):
+            if fmt.get('acodec') != 'none':
+                args += ['-map', f'{i}:a:0']
+                if ((fmt.get('protocol') or '').startswith('m3u8') and
+                        codec_family(fmt.get('acodec')) == 'aac'):
+                    args += [f'-bsf:a:{audio_streams}', 'aac_adtstoasc']
+                audio_streams += 1
+            if fmt.get('vcodec') != 'none':
+                args += ['-map', f'{i}:v:0']
+        # The stretched-pixel fixup would otherwise need a second pass over the output
+        stretched_ratio = info.get('stretched_ratio')
+        if stretched_ratio not in (None, 1):
+            args += ['-aspect', f'{stretched_ratio:f}']
+        return cls(info['__files_to_merge'], info['filepath'], args)
+
+
+def _file_argument(path):
+    # 'file:' stops ffmpeg from reading ':' as a protocol or a leading '-' as an option
+    return 'file:' + path
+
+
+def run_merge(ffmpeg_location, request):
+    """Mux ``request`` with ffmpeg; runs in a MergePool worker process.
+
+    Returns the wall-clock and CPU seconds ffmpeg took. CPU time comes from
+    the child process accounting, which Windows doesn't provide (reported as 0).
+    """
+    base, ext = os.path.splitext(request.output)
+    temp_output = f'{base}.temp{ext}'
+    cmd = [ffmpeg_location, '-y', '-loglevel', 'error']
+    for path in request.inputs:
+        cmd += ['-i', _file_argument(path)]
+    cmd += request.args
+    if ext.lower() in FASTSTART_EXTENSIONS:
+        cmd += ['-movflags', '+faststart']
+    cmd.append(_file_argument(temp_output))
+
+    before = os.times()
+    started = time.monotonic()
+    result = subprocess.run(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                            stderr=subprocess.PIPE, text=True)
+    seconds = time.monotonic() - started
+    after = os.times()
+    if result.returncode != 0:
+        if os.path.exists(temp_output):
+            os.remove(temp_output)
+        lines = result.stderr.strip().splitlines()
+        raise RuntimeError(f"ffmpeg merge failed: {lines[-1] if lines else result.returncode}")
+
+    started = time.monotonic()
+    os.replace(temp_output, request.output)
+    rename_seconds = time.monotonic() - started
+    # Keep the inputs until the merged file is in place so a failed merge can be retried
+    for path in request.inputs:
+        if os.path.exists(path):
+            os.remove(path)
+    cpu_seconds = ((after.children_user - before.children_user) +
+                   (after.children_system - before.children_system))
+    return {'output': request.output, 'seconds': seconds, 'cpu_seconds': cpu_seconds,
+            'rename_seconds': rename_seconds}
+
+
+def run_merges(ffmpeg_location, requests):
+    """Run the merges of one job in order, adding up their timings"""
+    totals = {'output': None, 'seconds': 0.0, 'cpu_seconds': 0.0, 'rename_seconds': 0.0}
+    for request in requests:
+        result = run_merge(ffmpeg_location, request)
+        totals['output'] = result['output']
+        for key in ('seconds', 'cpu_seconds', 'rename_seconds'):
+            totals[key] += result[key]
+    return totals
+
+
+class MergePool:
+    """Bounded pool of worker processes running ffmpeg merges off the download workers.
+
+    At most ``max_pending`` merges may be queued or running; ``submit`` blocks
+    beyond that, which holds back further downloads when merging can't keep
+    up with the network. The worker processes are started on first use.
+    """
+
+    def __init__(self, max_workers=2, max_pending=None):
+        self.max_workers = max(1, max_workers)
+        self._slots = threading.BoundedSemaphore(max_pending or 2 * self.max_workers)
+        self._executor = None
+        self._futures = set()
+        self._lock = threading.Lock()
+
+    def submit(self, ffmpeg_location, requests):
+        """Queue a job's merges; returns a Future resolving to the dict from ``run_merges``"""
+        from concurrent.futures import ProcessPoolExecutor
+        from concurrent.futures.process import BrokenProcessPool
+
+        self._slots.acquire()
+        try:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(self.max_workers)
+                try:
+                    future = self._executor.submit(run_merges, ffmpeg_location, requests)
+                except BrokenProcessPool:
+                    # A worker died (e.g. killed by the OS); start over with fresh processes
+                    self._executor.shutdown(wait=False)
+                    self._executor = ProcessPoolExecutor(self.max_workers)
+                    future = self._executor.submit(run_merges, ffmpeg_location, requests)
+                self._futures.add(future)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(self._done)
+        return future
+
+    @property
+    def pending(self):
+        """Merges queued or running"""
+        with self._lock:
+            return len(self._futures)
+
+    def _done(self, future):
+        with self._lock:
+            self._futures.discard(future)
+        self._slots.release()
+
+    def shutdown(self, wait=True):
+        """Stop the workers; merges that haven't started yet are cancelled"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+            futures = list(self._futures)
+        for future in futures:
+            future.cancel()
+        if executor is not None:
+            executor.shutdown(wait=wait)
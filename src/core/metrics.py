@@ -0,0 +1,169 @@
+import contextlib
+import json
+import os
+import threading
+import time
+
+PREFIX = 'ytdl_'
+
+
+class Metrics:
+    """Counters, gauges and timing spans shared by everything in the process.
+
+    Counters and gauges take keyword labels, e.g. ``inc('job_failures_total',
+    cause='HTTPError')``. A gauge may be set to a callable, which is
+    evaluated on export. Spans aggregate the count, total and maximum of
+    their durations. ``snapshot`` returns everything as plain data for the
+    JSON file; ``prometheus_text`` renders the text exposition format.
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._counters = {}  # (name, labels) -> value
+        self._gauges = {}    # (name, labels) -> value or callable
+        self._spans = {}     # span name -> [count, total seconds, max seconds]
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_gauge(self, name, value, **labels):
+        with self._lock:
+            self._gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def observe(self, span, seconds):
+        with self._lock:
+            stats = self._spans.setdefault(span, [0, 0.0, 0.0])
+            stats[0] += 1
+            stats[1] += seconds
+            stats[2] = max(stats[2], seconds)
+
+    @contextlib.contextmanager
+    def span(self, name, job=None):
+        """Time the body; the duration is also added to ``job.spans[name]``"""
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            seconds = time.monotonic() - started
+            self.observe(name, seconds)
+            if job is not None:
+                job.spans[name] = job.spans.get(name, 0.0) + seconds
+
+    def snapshot(self):
+        with self._lock:
+            counters = list(self._counters.items())
+            gauges = list(self._gauges.items())
+            spans = {name: {'count': count, 'sum': total, 'max': longest}
+                     for name, (count, total, longest) in self._spans.items()}
+        return {
+            'started': self.started,
+            'time': time.time(),
+            'counters': [dict(name=name, labels=dict(labels), value=value)
+                         for (name, labels), value in counters],
+            'gauges': [dict(name=name, labels=dict(labels), value=_gauge_value(value))
+                       for (name, labels), value in gauges],
+            'spans': spans,
+        }
+
+    def write_json(self, path):
+        """Replace ``path`` with the current snapshot; readers never see a partial file"""
+        temp_path = f'{path}.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.snapshot(), f, indent=2, sort_keys=True)
+        os.replace(temp_path, path)
+
+    def prometheus_text(self):
+        snapshot = self.snapshot()
+        lines = []
+        for kind, samples in (('counter', snapshot['counters']), ('gauge', snapshot['gauges'])):
+            typed = set()
+            for sample in sorted(samples, key=lambda s: s['name']):
+                name = PREFIX + sample['name']
+                if name not in typed:
+                    lines.append(f'# TYPE {name} {kind}')
+                    typed.add(name)
+                if sample['value'] is not None:
+                    lines.append(f"{name}{_labels(sample['labels'])} {sample['value']}")
+        if snapshot['spans']:
+            name = PREFIX + 'span_seconds'
+            lines.append(f'# TYPE {name} summary')
+            for span, stats in sorted(snapshot['spans'].items()):
+                labels = _labels({'span': span})
+                lines.append(f"{name}_sum{labels} {stats['sum']:.6f}")
+                lines.append(f"{name}_count{labels} {stats['count']}")
+            lines.append(f'# TYPE {name}_max gauge')
+            for span, stats in sorted(snapshot['spans'].items()):
+                lines.append(f"{name}_max{_labels({'span': span})} {stats['max']:.6f}")
+        return '\n'.join(lines) + '\n'
+
+
+def _gauge_value(value):
+    if callable(value):
+        try:
+            return value()
+        except Exception:
+            return None
+    return value
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+               for value in labels.values())
+    return '{' + ','.join(f'{key}="{value}"' for key, value in zip(labels, escaped)) + '}'
+
+
+class MetricsServer:
+    """Serves ``/metrics`` (Prometheus text) and ``/metrics.json`` from a background thread"""
+
+    def __init__(self, metrics, port=9464, host='127.0.0.1'):
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                if self.path == '/metrics':
+                    body = metrics.prometheus_text().encode('utf-8')
+                    content_type = 'text/plain; version=0.0.4; charset=utf-8'
+                elif self.path == '/metrics.json':
+                    body = json.dumps(metrics.snapshot()).encode('utf-8')
+                    content_type = 'application/json'
+                else:
+                    return self.send_error(404)
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self._httpd = ThreadingHTTPServer((host, port), Handler)
+        self._httpd.daemon_threads = True
+        self.port = self._httpd.server_address[1]
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+_default_metrics = None
+_default_metrics_lock = threading.Lock()
+
+
+def get_metrics():
+    """Process-wide registry shared by the engine, the yt-dlp logger and the front ends"""
+    global _default_metrics
+    with _default_metrics_lock:
+        if _default_metrics is None:
+            _default_metrics = Metrics()
+        return _default_metrics
@@ -0,0 +1,35 @@
+import threading
+
+MIB = 1024 * 1024
+
+
+class ParallelOptions:
+    """Settings for the parallel download mode"""
+
+    def __init__(self, connections=4, max_connections=8, fragment_concurrency=4,
+                 min_size=16 * MIB, chunk_size=4 * MIB, adaptive=True, sample_interval=1.0,
+                 retries=3):
+        self.connections = connections
+        self.max_connections = max(connections, max_connections)
+        self.fragment_concurrency = fragment_concurrency
+        self.min_size = min_size
+        self.chunk_size = chunk_size
+        self.adaptive = adaptive
+        self.sample_interval = sample_interval
+        self.retries = retries
+
+
+class ConnectionTuner:
+    """Remembers the connection count that saturated each host last time"""
+
+    def __init__(self):
+        self._best = {}
+        self._lock = threading.Lock()
+
+    def suggest(self, host, default):
+        with self._lock:
+            return self._best.get(host, default)
+
+    def record(self, host, connections):
+        with self._lock:
+            self._best[host] = connections
@@ -0,0 +1,157 @@
+import re
+import threading
+from urllib.parse import parse_qs, urlparse
+
+from src.core.download_queue import JobState
+
+PLAYLIST_PATH_RE = re.compile(r'^/(playlist|channel/|c/|user/|@)')
+# Redirects and nested playlists (e.g. a channel's tabs) followed while expanding
+MAX_DEPTH = 3
+
+
+class PlaylistEntry:
+    """One video of a playlist as listed by flat extraction"""
+    __slots__ = ('url', 'video_id', 'title', 'index')
+
+    def __init__(self, url, video_id, title, index):
+        self.url = url
+        self.video_id = video_id
+        self.title = title
+        self.index = index
+
+
+def is_playlist_url(url):
+    """True for playlist, channel and user URLs, and for watch URLs with a list= parameter"""
+    parsed = urlparse(url)
+    if PLAYLIST_PATH_RE.match(parsed.path or ''):
+        return True
+    return 'list' in parse_qs(parsed.query)
+
+
+def playlist_url(url):
+    """The URL to expand: a watch URL with list= becomes the playlist itself"""
+    parsed = urlparse(url)
+    list_id = parse_qs(parsed.query).get('list')
+    if list_id and parsed.path == '/watch':
+        return f'https://www.youtube.com/playlist?list={list_id[0]}'
+    return url
+
+
+def iter_playlist(url, ydl_opts=None):
+    """Yield a PlaylistEntry per video of a playlist or channel as pages are listed.
+
+    Uses flat extraction without processing, so yt-dlp fetches one page of
+    the listing at a time as the generator is consumed and no per-video
+    info dict is built; memory use doesn't depend on the playlist size.
+    """
+    import yt_dlp
+    opts = {
+        'quiet': True,
+        'no_warnings': True,
+        'extract_flat': 'in_playlist',
+        'lazy_playlist': True,
+    }
+    opts.update(ydl_opts or {})
+    with yt_dlp.YoutubeDL(opts) as ydl:
+        index = 0
+        for entry in _expand(ydl, {'_type': 'url', 'url': playlist_url(url)}, 0):
+            index += 1
+            yield PlaylistEntry(entry.get('url') or entry.get('webpage_url'), entry.get('id'),
+                                entry.get('title'), index)
+
+
+def _expand(ydl, result, depth):
+    if depth > MAX_DEPTH:
+        return
+    result_type = result.get('_type', 'video')
+    if result_type in ('url', 'url_transparent'):
+        if depth and result.get('ie_key') not in (None, 'YoutubeTab'):
+            # A flat video entry: download it as is
+            yield result
+            return
+        resolved = ydl.extract_info(result['url'], download=False, process=False,
+                                    ie_key=result.get('ie_key'))
+        yield from _expand(ydl, resolved, depth + 1)
+    elif result_type == 'playlist':
+        for entry in result.get('entries') or ():
+            if entry:
+                yield from _expand(ydl, entry, depth + 1)
+    elif result.get('webpage_url') or result.get('url'):
+        yield result
+
+
+class PlaylistExpansion:
+    """Feeds the entries of a playlist into a DownloadEngine while they are listed.
+
+    Runs in its own thread. Listing stays at most ``max_pending`` entries
+    ahead of the downloads, so the first videos are transferring while
+    later pages are still being fetched and a playlist with thousands of
+    entries never has more than a handful of jobs waiting.
+    """
+
+    def __init__(self, engine, url, save_path, selected_height=None, codec_policy=None,
+                 max_pending=None, on_entry=None):
+        self.engine = engine
+        self.url = url
+        self.save_path = save_path
+        self.selected_height = selected_height
+        self.codec_policy = codec_policy
+        self.max_pending = max_pending or 2 * engine.queue.max_workers
+        self.on_entry = on_entry
+        self.count = 0
+        self.error = None
+        self._pending = set()
+        self._cond = threading.Condition()
+        self._cancelled = False
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def cancel(self):
+        """Stop listing; jobs already queued are left alone"""
+        with self._cond:
+            self._cancelled = True
+            self._cond.notify_all()
+
+    @property
+    def finished(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+    def job_updated(self, job, state):
+        if state == JobState.QUEUED:
+            return
+        with self._cond:
+            if job.id in self._pending:
+                self._pending.discard(job.id)
+                self._cond.notify_all()
+
+    def _run(self):
+        entries = iter_playlist(self.url)
+        try:
+            for entry in entries:
+                with self._cond:
+                    self._cond.wait_for(
+                        lambda: self._cancelled or len(self._pending) < self.max_pending)
+                    if self._cancelled:
+                        break
+                if not entry.url:
+                    continue
+                kwargs = {'codec_policy': self.codec_policy} if self.codec_policy else {}
+                job = self.engine.submit(entry.url, self.save_path, self.selected_height, **kwargs)
+                with self._cond:
+                    if job.state == JobState.QUEUED:
+                        self._pending.add(job.id)
+                self.count += 1
+                if self.on_entry:
+                    self.on_entry(self, job, entry)
+        except Exception as e:
+            self.error = e
+        finally:
+            entries.close()
+            self._done.set()
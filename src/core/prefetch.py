@@ -0,0 +1,135 @@
+import collections
+import re
+import threading
+import time
+from urllib.parse import urlparse
+
+from src.core.cache import DEFAULT_TTL
+from src.core.engine import check_ffmpeg, extract_video_info
+from src.core.log import get_logger
+from src.core.metrics import get_metrics
+from src.core.playlist import PLAYLIST_PATH_RE
+from src.core.utils import extract_video_id
+
+log = get_logger('prefetch')
+
+YOUTUBE_URL_RE = re.compile(
+    r'(?:https?://)?(?:[\w-]+\.)?(?:youtube\.com|youtube-nocookie\.com|youtu\.be)/\S+')
+DEFAULT_WORKERS = 2
+DEFAULT_KEEP = 32
+
+
+def find_video_urls(text):
+    """YouTube video URLs in pasted or copied text, in order and one per video"""
+    urls = {}
+    for match in YOUTUBE_URL_RE.finditer(text):
+        url = match.group(0)
+        if '://' not in url:
+            url = 'https://' + url
+        if PLAYLIST_PATH_RE.match(urlparse(url).path):
+            continue
+        video_id = extract_video_id(url)
+        if video_id and video_id not in urls:
+            urls[video_id] = url
+    return list(urls.values())
+
+
+def _extract(url):
+    return extract_video_info(url, check_ffmpeg())
+
+
+class MetadataPrefetcher:
+    """Extracts video info in the background before anyone asks for it.
+
+    ``prefetch`` queues a URL; up to ``max_workers`` threads extract queued
+    URLs through the metadata cache, urgent ones (the URL the user is
+    looking at) first. The last ``keep`` VideoInfos are held for
+    ``result`` and announced to ``on_ready(video_id)``; failures go to
+    ``on_failed(video_id, message)``. Both are called from worker threads.
+    """
+
+    def __init__(self, max_workers=DEFAULT_WORKERS, on_ready=None, on_failed=None,
+                 keep=DEFAULT_KEEP, extract=None):
+        self.max_workers = max_workers
+        self.on_ready = on_ready
+        self.on_failed = on_failed
+        self.keep = keep
+        self._extract = extract or _extract
+        self._lock = threading.Lock()
+        self._pending = collections.OrderedDict()  # video_id -> url, next first
+        self._running = set()
+        self._results = collections.OrderedDict()  # video_id -> (VideoInfo, extracted at)
+        self._workers = 0
+        self._closed = False
+        self.metrics = get_metrics()
+
+    def prefetch(self, url, urgent=True):
+        """Queue url unless it is already known; returns its video ID, or None without one"""
+        video_id = extract_video_id(url)
+        if not video_id:
+            return None
+        with self._lock:
+            if self._closed or video_id in self._running or self._fresh(video_id):
+                return video_id
+            self._pending[video_id] = url
+            self._pending.move_to_end(video_id, last=not urgent)
+            if self._workers < self.max_workers:
+                self._workers += 1
+                threading.Thread(target=self._worker, daemon=True).start()
+        return video_id
+
+    def _fresh(self, video_id):
+        entry = self._results.get(video_id)
+        if entry is None:
+            return False
+        # Stream URLs in the info expire, same as in the metadata cache
+        if time.monotonic() - entry[1] > DEFAULT_TTL:
+            del self._results[video_id]
+            return False
+        return True
+
+    def result(self, video_id):
+        """The prefetched VideoInfo, or None if it isn't (or is no longer) available"""
+        with self._lock:
+            if not self._fresh(video_id):
+                return None
+            self._results.move_to_end(video_id)
+            return self._results[video_id][0]
+
+    def is_pending(self, video_id):
+        with self._lock:
+            return video_id in self._pending or video_id in self._running
+
+    def _worker(self):
+        while True:
+            with self._lock:
+                if self._closed or not self._pending:
+                    self._workers -= 1
+                    return
+                video_id, url = self._pending.popitem(last=False)
+                self._running.add(video_id)
+            try:
+                with self.metrics.span('prefetch'):
+                    info = self._extract(url)
+            except Exception as e:
+                log.debug("prefetch failed", extra={'url': url, 'error': str(e)})
+                with self._lock:
+                    self._running.discard(video_id)
+                self.metrics.inc('prefetch_total', result='failed')
+                if self.on_failed:
+                    self.on_failed(video_id, f"Error: {str(e)}")
+                continue
+            with self._lock:
+                self._running.discard(video_id)
+                self._results[video_id] = (info, time.monotonic())
+                while len(self._results) > self.keep:
+                    self._results.popitem(last=False)
+            self.metrics.inc('prefetch_total', result='ready')
+            if self.on_ready:
+                self.on_ready(video_id)
+
+    def close(self):
+        """Drop queued URLs; extractions already running finish in the background"""
+        with self._lock:
+            self._closed = True
+            self._pending.clear()
@@ -0,0 +1,93 @@
+import time
+
+
+class Phase:
+    EXTRACTING = 'extracting'
+    DOWNLOADING = 'downloading'
+    PROCESSING = 'processing'
+    FINISHED = 'finished'
+
+
+class ProgressEvent:
+    """Structured progress of one job; built straight from yt-dlp's hook dict"""
+    __slots__ = ('job_id', 'phase', 'downloaded_bytes', 'total_bytes', 'speed', 'eta',
+                 'fragment_index', 'fragment_count', 'filename', 'timestamp')
+
+    def __init__(self, job_id, phase, downloaded_bytes=None, total_bytes=None, speed=None,
+                 eta=None, fragment_index=None, fragment_count=None, filename=None,
+                 timestamp=None):
+        self.job_id = job_id
+        self.phase = phase
+        self.downloaded_bytes = downloaded_bytes
+        self.total_bytes = total_bytes
+        self.speed = speed
+        self.eta = eta
+        self.fragment_index = fragment_index
+        self.fragment_count = fragment_count
+        self.filename = filename
+        self.timestamp = time.monotonic() if timestamp is None else timestamp
+
+    @classmethod
+    def from_hook(cls, job_id, d):
+        if d['status'] == 'downloading':
+            phase = Phase.DOWNLOADING
+        elif d['status'] == 'finished':
+            phase = Phase.PROCESSING
+        else:
+            phase = d['status']
+        return cls(job_id, phase,
+                   d.get('downloaded_bytes'),
+                   d.get('total_bytes') or d.get('total_bytes_estimate'),
+                   d.get('speed'),
+                   d.get('eta'),
+                   d.get('fragment_index'),
+                   d.get('fragment_count'),
+                   d.get('filename'))
+
+    @property
+    def fraction(self):
+        """Completed fraction in [0, 1], or None when the total is unknown"""
+        if self.downloaded_bytes is not None and self.total_bytes:
+            return min(self.downloaded_bytes / self.total_bytes, 1.0)
+        if self.fragment_index and self.fragment_count:
+            return min(self.fragment_index / self.fragment_count, 1.0)
+        return None
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__ if name != 'timestamp'}
+
+
+class ProgressCoalescer:
+    """Forwards at most ``max_rate`` events per second to ``callback``.
+
+    Events arriving faster are folded into the most recent one, which is
+    delivered by the next event after the interval, by a phase change or by
+    ``flush``. Phase changes are always delivered immediately. Not thread
+    safe: use one coalescer per job.
+    """
+
+    def __init__(self, callback, max_rate=4.0):
+        self.callback = callback
+        self.interval = 1.0 / max_rate if max_rate else 0.0
+        self._last_sent = None
+        self._pending = None
+
+    def push(self, event):
+        last = self._last_sent
+        if last is not None and event.phase == last.phase:
+            if event.timestamp - last.timestamp < self.interval:
+                self._pending = event
+                return
+        else:
+            # Let the final state of the previous phase (e.g. 100%) through first
+            self.flush()
+        self._send(event)
+
+    def flush(self):
+        if self._pending is not None:
+            self._send(self._pending)
+
+    def _send(self, event):
+        self._pending = None
+        self._last_sent = event
+        self.callback(event)
@@ -0,0 +1,298 @@
+import json
+import os
+import re
+import threading
+import time
+from urllib.parse import urlparse
+
+import yt_dlp
+from yt_dlp.networking import Request
+from yt_dlp.networking.exceptions import TransportError
+
+from src.core.log import get_logger
+from src.core.metrics import get_metrics
+from src.core.staging import preallocate
+from src.core.ydl import EngineYoutubeDL
+from src.core.parallel import ConnectionTuner, ParallelOptions
+
+CONTENT_RANGE_RE = re.compile(r'bytes\s+(\d+)-(\d+)/(\d+)')
+
+log = get_logger('ranged')
+
+
+class RangedDownload:
+    """Fetch one URL as byte ranges over several connections into a preallocated file.
+
+    Chunks are handed out from a shared list to worker threads, each of which
+    writes its data in place at the chunk's offset. With ``adaptive`` set a new
+    connection is added every sample interval for as long as the measured
+    throughput keeps improving by at least 10%. Finished chunks are recorded in
+    a ``<filename>.json`` map so an interrupted download resumes where it
+    stopped instead of starting from byte zero.
+    """
+
+    def __init__(self, ydl, url, filename, total_size, headers, options, progress=None,
+                 preallocate=False):
+        self.ydl = ydl
+        self.url = url
+        self.filename = filename
+        self.total_size = total_size
+        self.headers = dict(headers or {})
+        self.options = options
+        self.progress = progress
+        self.preallocate = preallocate
+        self.state_filename = filename + '.json'
+        self.downloaded = 0
+        self.connections = 0
+        self._chunks = [(start, min(start + options.chunk_size, total_size) - 1)
+                        for start in range(0, total_size, options.chunk_size)]
+        self._done = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._idle = threading.Event()
+        self._active = 0
+        self._error = None
+
+    def _load_state(self):
+        try:
+            with open(self.state_filename, encoding='utf-8') as f:
+                state = json.load(f)
+            if (state['total_size'] == self.total_size
+                    and state['chunk_size'] == self.options.chunk_size
+                    and os.path.getsize(self.filename) == self.total_size):
+                return set(state['done'])
+        except (OSError, ValueError, KeyError):
+            pass
+        return set()
+
+    def _save_state(self):
+        tmp = self.state_filename + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'total_size': self.total_size, 'chunk_size': self.options.chunk_size,
+                       'done': sorted(self._done)}, f)
+        os.replace(tmp, self.state_filename)
+
+    def discard(self):
+        """Remove the temp file and its chunk map"""
+        for path in (self.filename, self.state_filename):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def run(self, initial_connections=None):
+        self._done = self._load_state()
+        if self._done:
+            self._chunks = [c for c in self._chunks if c[0] not in self._done]
+            self.downloaded = self.total_size - sum(end - start + 1 for start, end in self._chunks)
+        else:
+            with open(self.filename, 'wb') as f:
+                if self.preallocate:
+                    preallocate(f, self.total_size)
+                else:
+                    f.truncate(self.total_size)
+            self._save_state()
+
+        started = time.monotonic()
+        # Idle until a worker starts; a resumed map may have no chunks left to fetch
+        self._idle.set()
+        for _ in range(min(initial_connections or self.options.connections, len(self._chunks))):
+            self._add_worker()
+
+        growing = self.options.adaptive
+        last_rate = None
+        last_bytes, last_time = 0, started
+        while not self._idle.wait(self.options.sample_interval):
+            now = time.monotonic()
+            with self._lock:
+                downloaded = self.downloaded
+            rate = (downloaded - last_bytes) / max(now - last_time, 1e-6)
+            last_bytes, last_time = downloaded, now
+            self._report(downloaded, rate, now - started)
+            if self._stop.is_set():
+                continue
+            if growing and self.connections < self.options.max_connections and self._chunks:
+                if last_rate is None or rate > last_rate * 1.1:
+                    self._add_worker()
+                    last_rate = rate
+                else:
+                    growing = False
+
+        if self._error is not None:
+            raise self._error
+        os.remove(self.state_filename)
+
+    def _add_worker(self):
+        with self._lock:
+            self._active += 1
+            self._idle.clear()
+        self.connections += 1
+        threading.Thread(target=self._worker, daemon=True).start()
+
+    def _next_chunk(self):
+        with self._lock:
+            if self._chunks and not self._stop.is_set():
+                return self._chunks.pop(0)
+        return None
+
+    def _worker(self):
+        try:
+            with open(self.filename, 'r+b') as f:
+                chunk = self._next_chunk()
+                while chunk is not None:
+                    reached = self._fetch(f, *chunk)
+                    if reached <= chunk[1]:
+                        # Interrupted: hand the chunk back, uncounting its partial bytes,
+                        # so the chunk map and progress stay accurate
+                        with self._lock:
+                            self._chunks.insert(0, chunk)
+                            self.downloaded -= reached - chunk[0]
+                        return
+                    f.flush()
+                    with self._lock:
+                        self._done.add(chunk[0])
+                        self._save_state()
+                    chunk = self._next_chunk()
+        except BaseException as e:
+            with self._lock:
+                if self._error is None:
+                    self._error = e
+            self._stop.set()
+        finally:
+            with self._lock:
+                self._active -= 1
+                if self._active == 0:
+                    self._idle.set()
+
+    def _fetch(self, f, start, end):
+        """Download [start, end] with retries; returns the offset reached, end + 1 once complete.
+
+        A retry continues from where the failed connection stopped, so no
+        byte is fetched or counted twice.
+        """
+        attempt = 0
+        while start <= end and not self._stop.is_set():
+            try:
+                response = self._open_range(start, end)
+            except TransportError as e:
+                attempt = self._retry(attempt, start, end, e)
+                continue
+            try:
+                f.seek(start)
+                while start <= end and not self._stop.is_set():
+                    data = response.read(min(end - start + 1, 256 * 1024))
+                    if not data:
+                        raise yt_dlp.utils.ContentTooShortError(start, end + 1)
+                    f.write(data)
+                    start += len(data)
+                    with self._lock:
+                        self.downloaded += len(data)
+            except (TransportError, yt_dlp.utils.ContentTooShortError) as e:
+                attempt = self._retry(attempt, start, end, e)
+            finally:
+                response.close()
+        return start
+
+    def _open_range(self, start, end):
+        headers = dict(self.headers, Range=f'bytes={start}-{end}')
+        response = self.ydl.urlopen(Request(self.url, headers=headers))
+        if response.status != 206:
+            response.close()
+            raise yt_dlp.utils.DownloadError(
+                f'Server ignored range request (HTTP {response.status})')
+        return response
+
+    def _retry(self, attempt, start, end, error):
+        attempt += 1
+        if attempt > self.options.retries:
+            raise error
+        get_metrics().inc('retries_total', source='range')
+        log.debug("retrying range", extra={'start': start, 'end': end, 'attempt': attempt,
+                                           'error': str(error)})
+        return attempt
+
+    def _report(self, downloaded, speed, elapsed):
+        if not self.progress:
+            return
+        eta = (self.total_size - downloaded) / speed if speed else None
+        status = {
+            'status': 'downloading',
+            'downloaded_bytes': downloaded,
+            'total_bytes': self.total_size,
+            'speed': speed,
+            'eta': eta,
+            'elapsed': elapsed,
+            'filename': self.filename,
+        }
+        try:
+            self.progress(status)
+        except BaseException:
+            # e.g. the job was cancelled from the hook: stop all connections
+            self._stop.set()
+            raise
+
+
+def probe_range_support(ydl, url, headers):
+    """Return the total size if the server honours byte ranges, else None"""
+    response = ydl.urlopen(Request(url, headers=dict(headers or {}, Range='bytes=0-0')))
+    try:
+        if response.status != 206:
+            return None
+        match = CONTENT_RANGE_RE.match(response.headers.get('Content-Range', ''))
+        return int(match.group(3)) if match else None
+    finally:
+        response.close()
+
+
+class ParallelYoutubeDL(EngineYoutubeDL):
+    """YoutubeDL that downloads large progressive http(s) streams over several connections.
+
+    Fragmented formats (DASH/HLS) use yt-dlp's own concurrent fragment
+    downloader, sized from ``ParallelOptions.fragment_concurrency``. With
+    ``preallocate`` the ranged file's blocks are allocated up front rather
+    than left sparse.
+    """
+
+    def __init__(self, params=None, parallel=None, tuner=None, preallocate=False, **kwargs):
+        self.parallel = parallel or ParallelOptions()
+        self.tuner = tuner or ConnectionTuner()
+        self.preallocate = preallocate
+        params = dict(params or {})
+        params.setdefault('concurrent_fragment_downloads', self.parallel.fragment_concurrency)
+        super().__init__(params, **kwargs)
+
+    def dl(self, name, info, subtitle=False, test=False):
+        if test or subtitle or name == '-' or info.get('protocol') not in ('http', 'https'):
+            return super().dl(name, info, subtitle, test)
+        if self.params.get('continuedl', True) and os.path.isfile(name):
+            self.report_file_already_downloaded(name)
+            return True, False
+
+        headers = info.get('http_headers')
+        size = info.get('filesize') or probe_range_support(self, info['url'], headers)
+        if not size or size < self.parallel.min_size:
+            return super().dl(name, info, subtitle, test)
+
+        host = urlparse(info['url']).hostname or ''
+        # Not ".part": yt-dlp would treat our preallocated file as a resumable prefix
+        tmpfilename = name + '.ranged.part'
+        hooks = list(self._progress_hooks)
+
+        def progress(status):
+            status['tmpfilename'] = tmpfilename
+            status['info_dict'] = info
+            if status['status'] == 'finished':
+                status['filename'] = name
+            for hook in hooks:
+                hook(status)
+
+        download = RangedDownload(self, info['url'], tmpfilename, size, headers,
+                                  self.parallel, progress, self.preallocate)
+        try:
+            download.run(self.tuner.suggest(host, self.parallel.connections))
+        except (yt_dlp.utils.DownloadError, TransportError, yt_dlp.utils.ContentTooShortError):
+            # Fall back to the regular single connection downloader
+            download.discard()
+            return super().dl(name, info, subtitle, test)
+        self.tuner.record(host, download.connections)
+        os.replace(tmpfilename, name)
+        progress({'status': 'finished', 'downloaded_bytes': size, 'total_bytes': size})
+        return True, True
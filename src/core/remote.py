@@ -0,0 +1,268 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+
+from src.core.clip import ClipRange
+from src.core.download_queue import JobState
+from src.core.log import get_logger
+from src.core.progress import ProgressEvent
+
+# Longer than the daemon's keep-alive interval, so a silent stream means a dead connection
+READ_TIMEOUT = 40.0
+RECONNECT_DELAY = 2.0
+
+log = get_logger('remote')
+
+
+class DaemonClient:
+    """Minimal JSON client for the daemon's HTTP API"""
+
+    def __init__(self, base_url, token=None):
+        self.base_url = base_url.rstrip('/')
+        self.token = token
+
+    def _request(self, method, path, body=None):
+        data = json.dumps(body).encode('utf-8') if body is not None else None
+        request = urllib.request.Request(self.base_url + path, data=data, method=method)
+        if data is not None:
+            request.add_header('Content-Type', 'application/json')
+        if self.token:
+            request.add_header('Authorization', f'Bearer {self.token}')
+        return request
+
+    def call(self, method, path, body=None):
+        try:
+            with urllib.request.urlopen(self._request(method, path, body), timeout=30) as response:
+                return json.loads(response.read() or b'null')
+        except urllib.error.HTTPError as e:
+            try:
+                message = json.loads(e.read()).get('error')
+            except ValueError:
+                message = None
+            raise RuntimeError(f"Daemon error: {message or e}") from None
+
+    def try_call(self, method, path, body=None):
+        """``call`` for fire-and-forget requests from GUI slots: failures are logged, not raised"""
+        try:
+            return self.call(method, path, body)
+        except (OSError, RuntimeError) as e:
+            log.warning("daemon request failed", extra={'path': path, 'error': str(e)})
+            return None
+
+    def events(self):
+        """Yield (event type, data) from the event stream until the connection drops"""
+        response = urllib.request.urlopen(self._request('GET', '/events'), timeout=READ_TIMEOUT)
+        with response:
+            event_type, data = None, []
+            for raw in response:
+                line = raw.decode('utf-8').rstrip('\r\n')
+                if not line:
+                    if event_type and data:
+                        yield event_type, json.loads('\n'.join(data))
+                    event_type, data = None, []
+                elif line.startswith(':'):
+                    continue
+                else:
+                    field, _, value = line.partition(':')
+                    value = value[1:] if value.startswith(' ') else value
+                    if field == 'event':
+                        event_type = value
+                    elif field == 'data':
+                        data.append(value)
+
+
+class RemoteJob:
+    """A daemon job as seen by a client; same attributes the GUI reads from a DownloadJob"""
+    __slots__ = ('id', 'url', 'title', 'state', 'message', 'priority', 'save_path',
+                 'selected_height', 'codec_policy', 'clip', 'output_path', 'progress', 'merge_seconds',
+                 'merge_cpu_seconds', 'spans')
+
+    def __init__(self, data):
+        self.progress = None
+        self.update(data)
+
+    def update(self, data):
+        self.id = data['id']
+        self.url = data['url']
+        self.title = data['title']
+        self.state = data['state']
+        self.message = data['message']
+        self.priority = data['priority']
+        self.save_path = data['save_path']
+        self.selected_height = data['height']
+        self.codec_policy = data['codec']
+        self.clip = ClipRange.parse(data['clip']) if data.get('clip') else None
+        self.output_path = data['output_path']
+        self.merge_seconds = data['merge_seconds']
+        self.merge_cpu_seconds = data['merge_cpu_seconds']
+        self.spans = data['spans']
+        if data.get('progress'):
+            self.progress = _progress_event(dict(data['progress']))
+
+
+def _progress_event(data):
+    return ProgressEvent(data.pop('job', None) or data.pop('job_id', None), **data)
+
+
+class RemoteQueue:
+    """The DownloadQueue methods the GUI calls, forwarded to the daemon"""
+
+    def __init__(self, client, jobs, lock):
+        self.client = client
+        self._jobs = jobs
+        self._lock = lock
+        self.max_workers = 3
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def jobs(self):
+        with self._lock:
+            return list(self._jobs.values())
+
+    def pause(self, job_id):
+        self.client.try_call('POST', f'/jobs/{job_id}/pause')
+
+    def resume(self, job_id):
+        self.client.try_call('POST', f'/jobs/{job_id}/resume')
+
+    def cancel(self, job_id):
+        self.client.try_call('POST', f'/jobs/{job_id}/cancel')
+
+    def set_priority(self, job_id, priority):
+        self.client.try_call('POST', f'/jobs/{job_id}/priority', {'priority': priority})
+
+    def set_max_workers(self, max_workers):
+        self.max_workers = max(1, max_workers)
+        self.client.try_call('PUT', '/settings', {'max_workers': self.max_workers})
+
+    def remove_finished(self):
+        self.client.try_call('POST', '/jobs/clear')
+        with self._lock:
+            for job_id in [j.id for j in self._jobs.values() if j.state in JobState.FINAL]:
+                del self._jobs[job_id]
+
+
+class RemoteBandwidth:
+    def __init__(self, client):
+        self.client = client
+
+    def set_limits(self, rate=None, windows=None):
+        settings = {'rate_limit': str(rate or 0)}
+        if windows is not None:
+            settings['windows'] = [str(window) for window in windows]
+        self.client.try_call('PUT', '/settings', settings)
+
+
+class RemoteEngine:
+    """Stands in for DownloadEngine in the GUI when the work is done by a running daemon.
+
+    Jobs are submitted and controlled over the API; an event stream thread
+    keeps a local copy of every job and calls ``on_update(job, state)`` and
+    ``on_progress(job, event)`` like the engine would, reconnecting (and
+    resynchronising) when the daemon restarts. Video info extracted by the
+    GUI isn't sent along; the daemon extracts again from its own cache.
+    """
+
+    def __init__(self, base_url, on_update=None, on_progress=None, token=None):
+        self.client = DaemonClient(base_url, token)
+        self.on_update = on_update
+        self.on_progress = on_progress
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self.queue = RemoteQueue(self.client, self._jobs, self._lock)
+        self.bandwidth = RemoteBandwidth(self.client)
+        self._archive = None
+        self._parallel = None
+        self._thread = threading.Thread(target=self._listen, daemon=True)
+        self._thread.start()
+
+    @property
+    def archive(self):
+        return self._archive
+
+    @archive.setter
+    def archive(self, archive):
+        # The daemon keeps its own archive; only whether to skip is forwarded
+        self._archive = archive
+        self.client.try_call('PUT', '/settings', {'skip_downloaded': archive is not None})
+
+    @property
+    def parallel(self):
+        return self._parallel
+
+    @parallel.setter
+    def parallel(self, options):
+        self._parallel = options
+        self.client.try_call('PUT', '/settings',
+                             {'connections': options.connections if options else 1})
+
+    def submit(self, url, save_path, selected_height=None, custom_title=None, priority=0,
+               info=None, codec_policy='compatible', weight=1.0, clip=None):
+        body = {'url': url, 'save_path': save_path, 'height': selected_height,
+                'title': custom_title, 'priority': priority, 'codec': codec_policy,
+                'weight': weight}
+        if clip is not None:
+            body.update(start=clip.start, end=clip.end, precise=clip.precise)
+        data = self.client.call('POST', '/jobs', body)
+        return self._store(data)
+
+    def submit_playlist(self, url, save_path, selected_height=None, codec_policy='compatible',
+                        on_entry=None):
+        # Entries show up as job events; the daemon doesn't report listing progress
+        self.client.call('POST', '/jobs', {'url': url, 'save_path': save_path,
+                                           'height': selected_height, 'codec': codec_policy,
+                                           'playlist': True})
+
+    def resume_unfinished(self):
+        # The daemon resumes its own journal when it starts
+        return []
+
+    def shutdown(self, cancel_running=True):
+        """Stop listening; downloads keep running in the daemon"""
+        self._closed.set()
+
+    def _store(self, data):
+        with self._lock:
+            job = self._jobs.get(data['id'])
+            if job is None:
+                job = self._jobs[data['id']] = RemoteJob(data)
+            else:
+                job.update(data)
+        return job
+
+    def _listen(self):
+        while not self._closed.is_set():
+            try:
+                # Jobs may have changed (or the daemon restarted) while we weren't connected
+                jobs = self.client.call('GET', '/jobs')
+                with self._lock:
+                    self._jobs.clear()
+                for data in jobs:
+                    self._job_event(data)
+                for event_type, data in self.client.events():
+                    if self._closed.is_set():
+                        return
+                    if event_type == 'job':
+                        self._job_event(data)
+                    elif event_type == 'progress':
+                        self._progress_event(data)
+            except (OSError, RuntimeError, ValueError) as e:
+                log.debug("event stream interrupted", extra={'error': str(e)})
+            self._closed.wait(RECONNECT_DELAY)
+
+    def _job_event(self, data):
+        job = self._store(data)
+        if self.on_update:
+            self.on_update(job, data['state'])
+
+    def _progress_event(self, data):
+        job = self.queue.get(data.get('job'))
+        if job is None:
+            return
+        job.progress = _progress_event(data)
+        if self.on_progress:
+            self.on_progress(job, job.progress)
@@ -0,0 +1,142 @@
+import errno
+import os
+import shutil
+import threading
+import time
+
+from src.core.log import get_logger
+from src.core.metrics import get_metrics
+from src.core.utils import get_app_dir
+
+log = get_logger('staging')
+
+DEFAULT_MAX_JOBS = 4
+# Kept free on the staging disk for everything else
+DEFAULT_RESERVE = 1024 ** 3
+# Directories of jobs without a journal entry can't be resumed; older ones are removed
+STALE_SECONDS = 2 * 24 * 3600
+
+
+def preallocate(f, size):
+    """Reserve ``size`` bytes on disk for an open file, or at least make it that long"""
+    if hasattr(os, 'posix_fallocate'):
+        try:
+            os.posix_fallocate(f.fileno(), 0, size)
+            return
+        except OSError as e:
+            if e.errno == errno.ENOSPC:
+                raise
+    # No allocation support (e.g. macOS, Windows or the file system): a sparse file
+    f.truncate(size)
+
+
+def move_file(source, destination):
+    """Move a finished file into place without the destination ever holding a partial file.
+
+    On the same file system this is a rename. Otherwise the file is copied
+    once, sequentially, next to the destination and renamed over it.
+    """
+    try:
+        os.replace(source, destination)
+        return
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+    temp = destination + '.part'
+    try:
+        shutil.copyfile(source, temp)
+        os.replace(temp, destination)
+    except BaseException:
+        if os.path.exists(temp):
+            os.remove(temp)
+        raise
+    os.remove(source)
+
+
+def _directory_size(path):
+    try:
+        return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+    except OSError:
+        return 0
+
+
+class StagingArea:
+    """Local directory where jobs download and merge before moving to their destination.
+
+    Fragment appends, range writes and the merge's read-write pass all hit
+    the staging disk instead of the (possibly network) destination, which
+    only ever receives finished files. Each job gets a subdirectory named by
+    ``key``; it survives pauses and shutdowns so the job resumes from its
+    partial files. At most ``max_jobs`` jobs are staged at once, and only
+    if the disk keeps ``reserve`` bytes free after the job's expected size
+    and what the other staged jobs still have to write. ``acquire`` returns
+    None for a job that doesn't fit, which then writes to its destination
+    directly.
+    """
+
+    def __init__(self, root=None, max_jobs=DEFAULT_MAX_JOBS, reserve=DEFAULT_RESERVE):
+        self.root = root or os.path.join(get_app_dir(), 'staging')
+        self.max_jobs = max(1, max_jobs)
+        self.reserve = reserve
+        self._jobs = {}  # key -> bytes expected
+        self._lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+        self._purge_stale()
+        self.metrics = get_metrics()
+        self.metrics.set_gauge('staged_jobs', lambda: len(self._jobs))
+
+    def _purge_stale(self):
+        cutoff = time.time() - STALE_SECONDS
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            try:
+                if name.startswith('job-') and os.path.getmtime(path) < cutoff:
+                    shutil.rmtree(path)
+            except OSError:
+                pass
+
+    def path(self, key):
+        return os.path.join(self.root, key)
+
+    def acquire(self, key, expected_bytes=None):
+        """The directory to stage job ``key`` in, or None to write straight to the destination"""
+        with self._lock:
+            if key not in self._jobs:
+                result = self._admit(expected_bytes or 0)
+                self.metrics.inc('staging_total', result=result)
+                if result != 'staged':
+                    log.info("not staging job", extra={'key': key, 'reason': result,
+                                                       'expected_bytes': expected_bytes})
+                    return None
+                self._jobs[key] = expected_bytes or 0
+        path = self.path(key)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def _admit(self, expected_bytes):
+        if len(self._jobs) >= self.max_jobs:
+            return 'quota'
+        # Partly written jobs have already taken some of their share of the disk
+        outstanding = sum(max(expected - _directory_size(self.path(key)), 0)
+                          for key, expected in self._jobs.items())
+        if shutil.disk_usage(self.root).free - outstanding - expected_bytes < self.reserve:
+            return 'no_space'
+        return 'staged'
+
+    def finish(self, key, destination, output_path=None):
+        """Move the job's finished files to ``destination``; returns output_path's new path"""
+        path = self.path(key)
+        os.makedirs(destination, exist_ok=True)
+        for name in os.listdir(path):
+            move_file(os.path.join(path, name), os.path.join(destination, name))
+        self.release(key)
+        if output_path is None:
+            return None
+        return os.path.join(destination, os.path.basename(output_path))
+
+    def release(self, key, discard=True):
+        """Give up the job's slot, removing its directory (with any partial files) by default"""
+        with self._lock:
+            self._jobs.pop(key, None)
+        if discard:
+            shutil.rmtree(self.path(key), ignore_errors=True)
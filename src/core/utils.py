@@ -1,8 +1,21 @@
+import functools
 import sys
 import os
+import re
 
+# watch?v=, youtu.be/, /shorts/, /embed/ and /live/ URLs; channel and playlist paths have no video ID
+VIDEO_ID_RE = re.compile(r'(?:[?&]v=|youtu\.be/|/shorts/|/embed/|/live/)([0-9A-Za-z_-]{11})(?![0-9A-Za-z_-])')
+
+
+@functools.lru_cache(maxsize=None)
 def get_ffmpeg_path():
-    """Get the path to bundled ffmpeg"""
+    """Get the path to bundled ffmpeg (computed once per process).
+
+    YOUTUBE_DOWNLOADER_FFMPEG overrides it, e.g. to use a system ffmpeg.
+    """
+    override = os.environ.get('YOUTUBE_DOWNLOADER_FFMPEG')
+    if override:
+        return override
     if getattr(sys, 'frozen', False):
         # Running in a bundle
         if sys.platform == 'darwin':
@@ -22,12 +35,28 @@ def get_ffmpeg_path():
     else:
         # Running in development
         ffmpeg_path = os.path.join(os.path.dirname(__file__), '..', '..', 'resources', 'ffmpeg')
-    
-    # Debug information
-    print(f"Executable path: {sys.executable}")
-    print(f"Bundle directory: {bundle_dir if getattr(sys, 'frozen', False) else 'Not bundled'}")
-    print(f"ffmpeg path: {ffmpeg_path}")
-    print(f"ffmpeg exists: {os.path.exists(ffmpeg_path)}")
-    print(f"ffmpeg is executable: {os.access(ffmpeg_path, os.X_OK) if os.path.exists(ffmpeg_path) else False}")
-    
-    return ffmpeg_path 
\ No newline at end of file
+
+    return ffmpeg_path
+
+
+def get_app_dir():
+    """Get (and create) the per-user directory for caches and state files"""
+    app_dir = os.path.join(os.path.expanduser('~'), '.youtube_downloader')
+    os.makedirs(app_dir, exist_ok=True)
+    return app_dir
+
+
+def extract_video_id(url):
+    """Return the 11-character YouTube video ID from a URL, or None"""
+    video_id_match = VIDEO_ID_RE.search(url)
+    if video_id_match:
+        return video_id_match.group(1)
+    return None
+
+
+def clean_youtube_url(url):
+    """Remove playlist parameters from YouTube URL"""
+    video_id = extract_video_id(url)
+    if video_id:
+        return f'https://www.youtube.com/watch?v={video_id}'
+    return url
@@ -0,0 +1,299 @@
+import contextlib
+import json
+import os
+import sqlite3
+import time
+import urllib.error
+import urllib.request
+
+from src.core.utils import get_app_dir
+
+DEFAULT_LEASE_SECONDS = 60.0
+DEFAULT_MAX_ATTEMPTS = 3
+
+
+class WorkState:
+    QUEUED = 'queued'
+    LEASED = 'leased'
+    COMPLETED = 'completed'
+    FAILED = 'failed'
+
+
+class WorkItem:
+    """One download in the shared queue, as handed to a worker"""
+    __slots__ = ('id', 'url', 'save_path', 'selected_height', 'custom_title', 'codec_policy',
+                 'priority', 'state', 'attempts', 'worker', 'lease_expires', 'output_path',
+                 'message', 'result')
+
+    COLUMNS = ('id, url, save_path, selected_height, custom_title, codec_policy, priority, state, '
+               'attempts, worker, lease_expires, output_path, message, result')
+
+    def __init__(self, *values):
+        for name, value in zip(self.__slots__, values):
+            setattr(self, name, value)
+        if isinstance(self.result, str):
+            # Stored as JSON text; see SharedQueue.complete
+            self.result = json.loads(self.result)
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(*(data.get(name) for name in cls.__slots__))
+
+
+class SharedQueue:
+    """SQLite work queue that several worker processes claim downloads from.
+
+    A worker leases jobs for ``lease_seconds`` and has to renew the lease
+    with ``heartbeat`` while it works on them; a job whose lease ran out
+    (the worker crashed, hung or lost its connection) goes back to the
+    queue on the next ``lease`` call by anyone, until it has been tried
+    ``max_attempts`` times. Completing, failing or releasing a job only
+    counts when the caller still holds its lease, so a worker that lost a
+    job can't overwrite the result of the worker that took it over.
+
+    Every change runs in an IMMEDIATE transaction, which SQLite serialises
+    across processes; the file works for any number of processes on one
+    machine. Workers on other machines go through ``python src/main.py
+    worker serve`` and a QueueClient instead, since SQLite locking isn't
+    reliable on network file systems.
+    """
+
+    def __init__(self, path=None, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        self.path = path or os.path.join(get_app_dir(), 'work_queue.sqlite3')
+        self.max_attempts = max_attempts
+        with self._transaction() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS work ('
+                ' id INTEGER PRIMARY KEY AUTOINCREMENT,'
+                ' url TEXT NOT NULL,'
+                ' save_path TEXT NOT NULL,'
+                ' selected_height INTEGER,'
+                ' custom_title TEXT,'
+                ' codec_policy TEXT,'
+                ' priority INTEGER NOT NULL DEFAULT 0,'
+                ' state TEXT NOT NULL,'
+                ' attempts INTEGER NOT NULL DEFAULT 0,'
+                ' worker TEXT,'
+                ' lease_expires REAL,'
+                ' output_path TEXT,'
+                ' message TEXT,'
+                ' result TEXT,'
+                ' created REAL NOT NULL,'
+                ' updated REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS work_pending ON work (state, priority, id)')
+
+    def _connect(self):
+        # Autocommit mode: transactions are started explicitly by _Transaction
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        return conn
+
+    def _transaction(self):
+        return _Transaction(self._connect())
+
+    def add(self, url, save_path, selected_height=None, custom_title=None, priority=0,
+            codec_policy=None):
+        now = time.time()
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                'INSERT INTO work (url, save_path, selected_height, custom_title, codec_policy,'
+                ' priority, state, created, updated) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (url, save_path, selected_height, custom_title, codec_policy, priority,
+                 WorkState.QUEUED, now, now))
+            return cursor.lastrowid
+
+    def lease(self, worker, limit=1, lease_seconds=DEFAULT_LEASE_SECONDS):
+        """Claim up to ``limit`` queued jobs, highest priority first"""
+        now = time.time()
+        with self._transaction() as conn:
+            self._expire(conn, now)
+            rows = conn.execute(
+                f'SELECT {WorkItem.COLUMNS} FROM work WHERE state = ?'
+                ' ORDER BY priority DESC, id LIMIT ?', (WorkState.QUEUED, limit)).fetchall()
+            items = [WorkItem(*row) for row in rows]
+            for item in items:
+                item.state, item.worker = WorkState.LEASED, worker
+                item.lease_expires, item.attempts = now + lease_seconds, item.attempts + 1
+                conn.execute(
+                    'UPDATE work SET state = ?, worker = ?, lease_expires = ?, attempts = ?,'
+                    ' updated = ? WHERE id = ?',
+                    (item.state, worker, item.lease_expires, item.attempts, now, item.id))
+        return items
+
+    def _expire(self, conn, now):
+        """Put jobs with a lapsed lease back in the queue, or fail them after too many attempts"""
+        conn.execute(
+            'UPDATE work SET state = ?, worker = NULL, lease_expires = NULL,'
+            " message = 'Lease expired; worker stopped responding', updated = ?"
+            ' WHERE state = ? AND lease_expires < ? AND attempts >= ?',
+            (WorkState.FAILED, now, WorkState.LEASED, now, self.max_attempts))
+        conn.execute(
+            'UPDATE work SET state = ?, worker = NULL, lease_expires = NULL, updated = ?'
+            ' WHERE state = ? AND lease_expires < ?',
+            (WorkState.QUEUED, now, WorkState.LEASED, now))
+
+    def heartbeat(self, worker, item_ids, lease_seconds=DEFAULT_LEASE_SECONDS):
+        """Extend the leases ``worker`` holds; returns the IDs it no longer holds"""
+        now = time.time()
+        lost = []
+        with self._transaction() as conn:
+            for item_id in item_ids:
+                cursor = conn.execute(
+                    'UPDATE work SET lease_expires = ?, updated = ?'
+                    ' WHERE id = ? AND worker = ? AND state = ? AND lease_expires >= ?',
+                    (now + lease_seconds, now, item_id, worker, WorkState.LEASED, now))
+                if cursor.rowcount == 0:
+                    lost.append(item_id)
+        return lost
+
+    def complete(self, item_id, worker, output_path=None, message='', result=None):
+        """Record a finished download; ``result`` is any JSON-able detail (timings, sizes)"""
+        return self._settle(item_id, worker, 'state = ?, output_path = ?, message = ?, result = ?',
+                            (WorkState.COMPLETED, output_path, message,
+                             json.dumps(result) if result is not None else None))
+
+    def fail(self, item_id, worker, message='', retry=True):
+        """Give a job back for another attempt, or mark it failed when out of attempts"""
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute('SELECT attempts FROM work WHERE id = ? AND worker = ? AND state = ?',
+                               (item_id, worker, WorkState.LEASED)).fetchone()
+            if row is None:
+                return False
+            state = WorkState.QUEUED if retry and row[0] < self.max_attempts else WorkState.FAILED
+            conn.execute(
+                'UPDATE work SET state = ?, worker = NULL, lease_expires = NULL, message = ?,'
+                ' updated = ? WHERE id = ?', (state, message, now, item_id))
+        return True
+
+    def release(self, item_id, worker):
+        """Hand a job back untried, e.g. when the worker shuts down"""
+        now = time.time()
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                'UPDATE work SET state = ?, worker = NULL, lease_expires = NULL,'
+                ' attempts = MAX(attempts - 1, 0), updated = ?'
+                ' WHERE id = ? AND worker = ? AND state = ?',
+                (WorkState.QUEUED, now, item_id, worker, WorkState.LEASED))
+            return cursor.rowcount > 0
+
+    def _settle(self, item_id, worker, assignments, values):
+        now = time.time()
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                f'UPDATE work SET {assignments}, worker = ?, lease_expires = NULL, updated = ?'
+                ' WHERE id = ? AND worker = ? AND state = ?',
+                (*values, worker, now, item_id, worker, WorkState.LEASED))
+            return cursor.rowcount > 0
+
+    def get(self, item_id):
+        with contextlib.closing(self._connect()) as conn:
+            row = conn.execute(f'SELECT {WorkItem.COLUMNS} FROM work WHERE id = ?',
+                               (item_id,)).fetchone()
+        return WorkItem(*row) if row else None
+
+    def items(self, state=None):
+        query = f'SELECT {WorkItem.COLUMNS} FROM work'
+        params = ()
+        if state:
+            query += ' WHERE state = ?'
+            params = (state,)
+        with contextlib.closing(self._connect()) as conn:
+            return [WorkItem(*row) for row in conn.execute(query + ' ORDER BY id', params)]
+
+    def counts(self):
+        """Number of jobs per state, with leases that ran out counted as queued"""
+        now = time.time()
+        counts = {state: 0 for state in (WorkState.QUEUED, WorkState.LEASED,
+                                         WorkState.COMPLETED, WorkState.FAILED)}
+        with contextlib.closing(self._connect()) as conn:
+            rows = conn.execute('SELECT state, lease_expires < ?, COUNT(*) FROM work'
+                                ' GROUP BY 1, 2', (now,)).fetchall()
+        for state, expired, count in rows:
+            counts[WorkState.QUEUED if state == WorkState.LEASED and expired else state] += count
+        return counts
+
+
+class _Transaction:
+    """``BEGIN IMMEDIATE`` ... ``COMMIT``, rolled back on error"""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute('BEGIN IMMEDIATE')
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self.conn.execute('ROLLBACK' if exc_type else 'COMMIT')
+        finally:
+            self.conn.close()
+
+
+class QueueClient:
+    """SharedQueue interface for workers on other machines, talking to ``worker serve``"""
+
+    def __init__(self, base_url, token=None):
+        self.base_url = base_url.rstrip('/')
+        self.token = token
+
+    def _call(self, path, body):
+        request = urllib.request.Request(self.base_url + path, json.dumps(body).encode('utf-8'),
+                                         {'Content-Type': 'application/json'}, method='POST')
+        if self.token:
+            request.add_header('Authorization', f'Bearer {self.token}')
+        try:
+            with urllib.request.urlopen(request, timeout=30) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            try:
+                message = json.loads(e.read()).get('error')
+            except ValueError:
+                message = None
+            raise RuntimeError(f"Coordinator error: {message or e}") from None
+
+    def add(self, url, save_path, selected_height=None, custom_title=None, priority=0,
+            codec_policy=None):
+        return self._call('/add', {'url': url, 'save_path': save_path,
+                                   'selected_height': selected_height,
+                                   'custom_title': custom_title, 'priority': priority,
+                                   'codec_policy': codec_policy})['id']
+
+    def lease(self, worker, limit=1, lease_seconds=DEFAULT_LEASE_SECONDS):
+        items = self._call('/lease', {'worker': worker, 'limit': limit,
+                                      'lease_seconds': lease_seconds})['items']
+        return [WorkItem.from_dict(item) for item in items]
+
+    def heartbeat(self, worker, item_ids, lease_seconds=DEFAULT_LEASE_SECONDS):
+        return self._call('/heartbeat', {'worker': worker, 'ids': list(item_ids),
+                                         'lease_seconds': lease_seconds})['lost']
+
+    def complete(self, item_id, worker, output_path=None, message='', result=None):
+        return self._call('/complete', {'id': item_id, 'worker': worker,
+                                        'output_path': output_path, 'message': message,
+                                        'result': result})['ok']
+
+    def fail(self, item_id, worker, message='', retry=True):
+        return self._call('/fail', {'id': item_id, 'worker': worker, 'message': message,
+                                    'retry': retry})['ok']
+
+    def release(self, item_id, worker):
+        return self._call('/release', {'id': item_id, 'worker': worker})['ok']
+
+    def items(self, state=None):
+        return [WorkItem.from_dict(item) for item in self._call('/items', {'state': state})['items']]
+
+    def counts(self):
+        return self._call('/counts', {})
+
+
+def open_queue(location, token=None):
+    """A SharedQueue for a file path, or a QueueClient for an http(s) URL"""
+    if location and location.startswith(('http://', 'https://')):
+        return QueueClient(location, token)
+    return SharedQueue(location or None)
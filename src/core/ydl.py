@@ -0,0 +1,168 @@
+import contextlib
+import threading
+
+import yt_dlp
+from yt_dlp.postprocessor import FFmpegFixupStretchedPP, FFmpegMergerPP
+
+from src.core.merge import MergeRequest
+from src.core.metrics import get_metrics
+
+# Options that differ from job to job. A pooled instance takes them from
+# each lease; the remaining options decide which instances can be shared.
+JOB_OPTIONS = ('format', 'outtmpl', 'merge_output_format', 'progress_hooks', 'logger',
+               'download_ranges', 'force_keyframes_at_cuts')
+
+
+class EngineYoutubeDL(yt_dlp.YoutubeDL):
+    """YoutubeDL with the hooks the download engine needs around yt-dlp's own work.
+
+    ``deferred_merges``: each video+audio merge yt-dlp would have run is
+    appended to this list as a MergeRequest and the separately downloaded
+    streams are left in place, so the worker is free for the next transfer
+    while a MergePool muxes them.
+
+    ``throttle``: called with the size of every block read from an HTTP
+    response (media data, fragments and byte ranges alike) and may block to
+    hold the transfer to a bandwidth limit.
+
+    Without either it behaves like a plain YoutubeDL.
+    """
+
+    def __init__(self, params=None, deferred_merges=None, throttle=None, **kwargs):
+        self.deferred_merges = deferred_merges
+        self.throttle = throttle
+        super().__init__(params, **kwargs)
+
+    def prepare_job(self, opts, **attrs):
+        """Apply one job's options (and attributes such as ``throttle``) to a pooled instance"""
+        self.params.update(opts)
+        self._parse_outtmpl()
+        self.format_selector = self._build_format_selector()
+        self._progress_hooks = list(opts.get('progress_hooks') or ())
+        for name, value in attrs.items():
+            setattr(self, name, value)
+
+    def _build_format_selector(self):
+        # YoutubeDL compiles 'format' once in __init__; pooled instances change it per job
+        fmt = self.params.get('format')
+        return fmt if fmt in (None, '-') or callable(fmt) else self.build_format_selector(fmt)
+
+    def reset_job(self):
+        """Forget the last job; extractors, cookies and open connections are kept"""
+        for name in JOB_OPTIONS:
+            self.params.pop(name, None)
+        self.format_selector = None
+        self._progress_hooks = []
+        self._postprocessor_hooks = []
+        self._download_retcode = 0
+        self._num_downloads = 0
+        self._printed_messages.clear()
+        self._playlist_level = 0
+        self._playlist_urls.clear()
+        self.deferred_merges = None
+        self.throttle = None
+
+    def urlopen(self, req):
+        response = super().urlopen(req)
+        if self.throttle is not None:
+            read, throttle = response.read, self.throttle
+
+            def throttled_read(amt=None):
+                data = read(amt)
+                if data:
+                    throttle(len(data))
+                return data
+
+            response.read = throttled_read
+        return response
+
+    def run_pp(self, pp, infodict):
+        if self.deferred_merges is not None and infodict.get('__files_to_merge'):
+            if isinstance(pp, FFmpegMergerPP):
+                self.deferred_merges.append(MergeRequest.from_info(infodict))
+                return infodict
+            if isinstance(pp, FFmpegFixupStretchedPP):
+                # Folded into the merge; the merged file doesn't exist yet
+                return infodict
+        return super().run_pp(pp, infodict)
+
+
+class YoutubeDLPool:
+    """Long-lived YoutubeDL instances shared by jobs with the same options.
+
+    Building a YoutubeDL sets up its extractors and request handlers, and
+    a fresh one starts without cookies, open connections or the player
+    code the YouTube extractor caches per instance. ``lease`` hands out an
+    idle instance whose options (apart from JOB_OPTIONS) match, or builds
+    one, and takes it back when the job is done. An instance is only used
+    by one job at a time. One that raised is closed instead of reused,
+    because its state after an aborted transfer isn't known.
+
+    Connections are kept alive between jobs when yt-dlp uses its
+    ``requests`` handler (installed with the ``requests`` package); its
+    urllib fallback opens a new connection per request.
+    """
+
+    def __init__(self, max_idle=4):
+        self.max_idle = max_idle
+        self._idle = {}
+        self._lock = threading.Lock()
+        self.metrics = get_metrics()
+
+    @staticmethod
+    def _key(cls, opts):
+        return cls, repr(sorted((name, value) for name, value in opts.items()
+                                if name not in JOB_OPTIONS))
+
+    @contextlib.contextmanager
+    def lease(self, opts, cls=EngineYoutubeDL, **attrs):
+        key = self._key(cls, opts)
+        with self._lock:
+            idle = self._idle.get(key)
+            ydl = idle.pop() if idle else None
+        if ydl is None:
+            ydl = cls(dict(opts))
+            self.metrics.inc('ydl_instances_total', result='created')
+        else:
+            self.metrics.inc('ydl_instances_total', result='reused')
+        ydl.prepare_job(opts, **attrs)
+        try:
+            yield ydl
+        except BaseException:
+            self.metrics.inc('ydl_instances_total', result='discarded')
+            ydl.close()
+            raise
+        ydl.reset_job()
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_idle:
+                idle.append(ydl)
+                ydl = None
+        if ydl is not None:
+            ydl.close()
+
+    def warm(self, opts, cls=EngineYoutubeDL, extractors=('Youtube',)):
+        """Build an instance ahead of the first job, with ``extractors`` initialised"""
+        with self.lease(opts, cls) as ydl:
+            for name in extractors:
+                ydl.get_info_extractor(name)
+
+    def close(self):
+        with self._lock:
+            instances = [ydl for idle in self._idle.values() for ydl in idle]
+            self._idle.clear()
+        for ydl in instances:
+            ydl.close()
+
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+
+def get_ydl_pool():
+    """Process-wide pool used for extraction and downloads"""
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            _default_pool = YoutubeDLPool()
+        return _default_pool
@@ -0,0 +1,484 @@
+"""Long-running download service with a local HTTP/JSON API.
+
+Keeps one warm DownloadEngine (yt_dlp loaded, metadata cache, connection
+tuning) and lets any number of clients queue and control downloads:
+
+    POST /jobs                  {"url", "height", "title", "save_path", "codec",
+                                 "priority", "weight", "playlist",
+                                 "start", "end", "precise"}  (start/end: clip times)
+    GET  /jobs[?state=running]  all jobs; GET /jobs/<id> for one
+    POST /jobs/<id>/pause|resume|cancel, POST /jobs/<id>/priority {"priority"}
+    POST /jobs/clear            forget finished jobs
+    GET  /events[?job=<id>]     server-sent events: "job" on state changes,
+                                "progress" with ProgressEvent fields
+    GET|PUT /settings           rate_limit, windows, max_workers, connections, skip_downloaded
+    GET  /metrics, /metrics.json
+
+Binds to 127.0.0.1 unless told otherwise; with --token every request needs
+``Authorization: Bearer <token>``. Never imports Qt.
+"""
+import argparse
+import collections
+import json
+import os
+import signal
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from src.core.archive import DownloadArchive
+from src.core.bandwidth import BandwidthScheduler, TimeWindow, parse_rate
+from src.core.clip import ClipRange, parse_timestamp
+from src.core.engine import DownloadEngine, preload_yt_dlp
+from src.core.formats import CodecPolicy
+from src.core.journal import JobJournal
+from src.core.log import configure_logging, get_logger
+from src.core.metrics import get_metrics
+from src.core.parallel import ParallelOptions
+from src.core.playlist import is_playlist_url
+from src.core.staging import DEFAULT_MAX_JOBS, StagingArea
+from src.core.utils import clean_youtube_url, extract_video_id
+
+DEFAULT_PORT = 8765
+# Seconds between keep-alive comments on idle event streams
+KEEPALIVE_INTERVAL = 15.0
+
+log = get_logger('daemon')
+
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def job_to_dict(job):
+    return {
+        'id': job.id,
+        'url': job.url,
+        'title': job.title,
+        'state': job.state,
+        'message': job.message,
+        'priority': job.priority,
+        'save_path': job.save_path,
+        'height': job.selected_height,
+        'codec': job.codec_policy,
+        'clip': job.clip.spec() if job.clip else None,
+        'output_path': job.output_path,
+        'progress': job.progress.as_dict() if job.progress else None,
+        'merge_seconds': job.merge_seconds,
+        'merge_cpu_seconds': job.merge_cpu_seconds,
+        'spans': dict(job.spans),
+    }
+
+
+class EventHub:
+    """Fans engine events out to every connected event stream.
+
+    Each subscriber has its own bounded backlog; a client that stops
+    reading loses its oldest events rather than holding up the engine, and
+    can resynchronise with GET /jobs.
+    """
+
+    def __init__(self, backlog=10000):
+        self.backlog = backlog
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._seq = 0
+
+    def subscribe(self, job_id=None):
+        subscriber = _Subscriber(job_id, self.backlog)
+        with self._lock:
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def publish(self, event_type, job_id, data):
+        with self._lock:
+            self._seq += 1
+            event = (self._seq, event_type, json.dumps(data))
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            if subscriber.job_id is None or subscriber.job_id == job_id:
+                subscriber.put(event)
+
+    def close(self):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            subscriber.close()
+
+
+class _Subscriber:
+    def __init__(self, job_id, backlog):
+        self.job_id = job_id
+        self.closed = False
+        self._events = collections.deque(maxlen=backlog)
+        self._cond = threading.Condition()
+
+    def put(self, event):
+        with self._cond:
+            self._events.append(event)
+            self._cond.notify()
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify()
+
+    def get(self, timeout):
+        """Events queued so far, waiting up to ``timeout`` for the first one"""
+        with self._cond:
+            self._cond.wait_for(lambda: self._events or self.closed, timeout)
+            events = list(self._events)
+            self._events.clear()
+        return events
+
+
+class DownloadDaemon:
+    """The engine, its settings and the API operations the HTTP handler calls"""
+
+    def __init__(self, engine, output, archive=None, token=None):
+        self.engine = engine
+        self.output = os.path.abspath(output)
+        self.archive = archive
+        self.token = token
+        self.hub = EventHub()
+        self.connections = 1
+        self.closing = threading.Event()
+
+    def job_updated(self, job, state):
+        data = job_to_dict(job)
+        data['state'] = state
+        self.hub.publish('job', job.id, data)
+
+    def job_progress(self, job, event):
+        data = event.as_dict()
+        data['job'] = data.pop('job_id')
+        self.hub.publish('progress', job.id, data)
+
+    def resolve_save_path(self, save_path):
+        """Relative paths are under the output directory; absolute ones must stay inside it"""
+        path = os.path.abspath(os.path.join(self.output, save_path or ''))
+        if path != self.output and not path.startswith(self.output + os.sep):
+            raise ApiError(400, f"save_path must be inside {self.output}")
+        return path
+
+    def submit(self, body):
+        url = (body.get('url') or '').strip()
+        if not url:
+            raise ApiError(400, "url is required")
+        save_path = self.resolve_save_path(body.get('save_path'))
+        height = body.get('height')
+        if height is not None and not isinstance(height, int):
+            raise ApiError(400, "height must be an integer")
+        codec = body.get('codec') or CodecPolicy.COMPATIBLE
+        if codec not in CodecPolicy.LABELS:
+            raise ApiError(400, f"codec must be one of {', '.join(sorted(CodecPolicy.LABELS))}")
+        title = body.get('title')
+        if title and ('/' in title or os.sep in title):
+            raise ApiError(400, "title must be a file name, not a path")
+        clip = None
+        if body.get('start') is not None or body.get('end') is not None:
+            if body.get('start') is None or body.get('end') is None:
+                raise ApiError(400, "a clip needs both start and end")
+            try:
+                clip = ClipRange(parse_timestamp(body['start']), parse_timestamp(body['end']),
+                                 bool(body.get('precise')))
+            except ValueError as e:
+                raise ApiError(400, str(e))
+        os.makedirs(save_path, exist_ok=True)
+        if is_playlist_url(url) and (body.get('playlist') or not extract_video_id(url)):
+            self.engine.submit_playlist(url, save_path, height, codec_policy=codec)
+            return 202, {'playlist': url}
+        job = self.engine.submit(clean_youtube_url(url), save_path, height, title,
+                                 int(body.get('priority') or 0), codec_policy=codec,
+                                 weight=float(body.get('weight') or 1.0), clip=clip)
+        return 201, job_to_dict(job)
+
+    def job(self, job_id):
+        job = self.engine.queue.get(job_id)
+        if job is None:
+            raise ApiError(404, f"no job {job_id}")
+        return job
+
+    def job_action(self, job_id, action, body):
+        job = self.job(job_id)
+        queue = self.engine.queue
+        if action == 'pause':
+            queue.pause(job.id)
+        elif action == 'resume':
+            queue.resume(job.id)
+        elif action == 'cancel':
+            queue.cancel(job.id)
+        elif action == 'priority':
+            queue.set_priority(job.id, int(body.get('priority') or 0))
+        else:
+            raise ApiError(404, f"unknown action {action!r}")
+        return job_to_dict(job)
+
+    def settings(self):
+        return {
+            'rate_limit': self.engine.bandwidth.rate,
+            'windows': [str(window) for window in self.engine.bandwidth.windows],
+            'max_workers': self.engine.queue.max_workers,
+            'connections': self.connections,
+            'skip_downloaded': self.engine.archive is not None,
+        }
+
+    def update_settings(self, body):
+        if 'rate_limit' in body or 'windows' in body:
+            bandwidth = self.engine.bandwidth
+            try:
+                rate = parse_rate(body['rate_limit']) if 'rate_limit' in body else bandwidth.rate
+                windows = ([TimeWindow.parse(text) for text in body['windows']]
+                           if 'windows' in body else None)
+            except (TypeError, ValueError) as e:
+                raise ApiError(400, str(e))
+            bandwidth.set_limits(rate, windows)
+        if 'max_workers' in body:
+            self.engine.queue.set_max_workers(int(body['max_workers']))
+        if 'connections' in body:
+            self.connections = max(1, int(body['connections']))
+            # Applies to jobs that start after the change
+            self.engine.parallel = (ParallelOptions(connections=self.connections,
+                                                    fragment_concurrency=self.connections)
+                                    if self.connections > 1 else None)
+        if 'skip_downloaded' in body:
+            if body['skip_downloaded'] and self.archive is None:
+                self.archive = DownloadArchive()
+            self.engine.archive = self.archive if body['skip_downloaded'] else None
+        return self.settings()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        log.debug(format % args, extra={'client': self.client_address[0]})
+
+    @property
+    def daemon(self):
+        return self.server.download_daemon
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def do_PUT(self):
+        self._dispatch('PUT')
+
+    def _dispatch(self, method):
+        try:
+            if self.daemon.token and (self.headers.get('Authorization') !=
+                                      f'Bearer {self.daemon.token}'):
+                raise ApiError(401, "missing or wrong token")
+            parsed = urlparse(self.path)
+            parts = [part for part in parsed.path.split('/') if part]
+            query = {key: values[-1] for key, values in parse_qs(parsed.query).items()}
+            body = self._read_body() if method in ('POST', 'PUT') else {}
+            self._route(method, parts, query, body)
+        except ApiError as e:
+            self._send_json(e.status, {'error': str(e)})
+        except (TypeError, ValueError) as e:
+            # e.g. a priority that isn't a number
+            self._send_json(400, {'error': str(e)})
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        except Exception as e:
+            log.exception("request failed", extra={'path': self.path})
+            self._send_json(500, {'error': str(e)})
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if not length:
+            return {}
+        try:
+            body = json.loads(self.rfile.read(length))
+        except ValueError:
+            raise ApiError(400, "body must be JSON")
+        if not isinstance(body, dict):
+            raise ApiError(400, "body must be a JSON object")
+        return body
+
+    def _route(self, method, parts, query, body):
+        daemon = self.daemon
+        if parts == ['jobs'] and method == 'GET':
+            jobs = daemon.engine.queue.jobs()
+            if query.get('state'):
+                jobs = [job for job in jobs if job.state == query['state']]
+            return self._send_json(200, [job_to_dict(job) for job in jobs])
+        if parts == ['jobs'] and method == 'POST':
+            return self._send_json(*daemon.submit(body))
+        if parts == ['jobs', 'clear'] and method == 'POST':
+            daemon.engine.queue.remove_finished()
+            return self._send_json(200, {})
+        if len(parts) in (2, 3) and parts[0] == 'jobs' and parts[1].isdigit():
+            job_id = int(parts[1])
+            if len(parts) == 2 and method == 'GET':
+                return self._send_json(200, job_to_dict(daemon.job(job_id)))
+            if len(parts) == 3 and method == 'POST':
+                return self._send_json(200, daemon.job_action(job_id, parts[2], body))
+        if parts == ['events'] and method == 'GET':
+            job_id = query.get('job')
+            return self._stream_events(int(job_id) if job_id and job_id.isdigit() else None)
+        if parts == ['settings']:
+            if method == 'GET':
+                return self._send_json(200, daemon.settings())
+            if method == 'PUT':
+                return self._send_json(200, daemon.update_settings(body))
+        if parts == ['metrics'] and method == 'GET':
+            return self._send(200, get_metrics().prometheus_text().encode('utf-8'),
+                              'text/plain; version=0.0.4; charset=utf-8')
+        if parts == ['metrics.json'] and method == 'GET':
+            return self._send_json(200, get_metrics().snapshot())
+        raise ApiError(404, f"no route for {method} {self.path}")
+
+    def _send(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status, data):
+        self._send(status, json.dumps(data).encode('utf-8'), 'application/json')
+
+    def _stream_events(self, job_id):
+        daemon = self.daemon
+        subscriber = daemon.hub.subscribe(job_id)
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+        try:
+            while not subscriber.closed and not daemon.closing.is_set():
+                events = subscriber.get(KEEPALIVE_INTERVAL)
+                if not events:
+                    self.wfile.write(b': keepalive\n\n')
+                for seq, event_type, data in events:
+                    self.wfile.write(f'id: {seq}\nevent: {event_type}\ndata: {data}\n\n'
+                                     .encode('utf-8'))
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            daemon.hub.unsubscribe(subscriber)
+
+
+class DaemonServer:
+    """HTTP front end of a DownloadDaemon running in a background thread"""
+
+    def __init__(self, download_daemon, host='127.0.0.1', port=DEFAULT_PORT):
+        self.download_daemon = download_daemon
+        self._httpd = ThreadingHTTPServer((host, port), _Handler)
+        self._httpd.daemon_threads = True
+        self._httpd.download_daemon = download_daemon
+        self.port = self._httpd.server_address[1]
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return f'http://{self._httpd.server_address[0]}:{self.port}'
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.download_daemon.closing.set()
+        self.download_daemon.hub.close()
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='youtube-downloader daemon',
+        description='Run the downloader as a service controlled over a local HTTP/JSON API.')
+    parser.add_argument('--host', default='127.0.0.1',
+                        help='address to listen on (only this machine by default)')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--token', default=os.environ.get('YOUTUBE_DOWNLOADER_TOKEN'),
+                        help='require "Authorization: Bearer TOKEN" on every request '
+                             '(default: $YOUTUBE_DOWNLOADER_TOKEN)')
+    parser.add_argument('-o', '--output', default=os.getcwd(),
+                        help='download directory; clients may only save below it')
+    parser.add_argument('-j', '--jobs', type=int, default=3, help='parallel downloads')
+    parser.add_argument('--per-host', type=int, default=2,
+                        help='maximum parallel downloads from the same host')
+    parser.add_argument('--merge-workers', type=int, default=2,
+                        help='processes merging video and audio (0 merges in the download worker)')
+    parser.add_argument('-r', '--limit-rate', type=parse_rate,
+                        help='total bandwidth for all downloads, e.g. 500K or 2M')
+    parser.add_argument('--rate-window', type=TimeWindow.parse, action='append', default=[],
+                        metavar='HH:MM-HH:MM=RATE', help='different limit during a daily time window')
+    parser.add_argument('--archive', nargs='?', const='', metavar='FILE',
+                        help='skip videos already downloaded in the same format')
+    parser.add_argument('--staging-dir', nargs='?', const='', metavar='DIR',
+                        help='download and merge on local disk, then move finished files to their '
+                             'destination (default DIR: ~/.youtube_downloader/staging)')
+    parser.add_argument('--staging-jobs', type=int, default=DEFAULT_MAX_JOBS,
+                        help='jobs staged at once; further jobs write to their destination directly')
+    parser.add_argument('--journal', help='job journal file (default: ~/.youtube_downloader/jobs.sqlite3)')
+    parser.add_argument('--no-journal', action='store_true', help="don't record jobs in the journal")
+    parser.add_argument('--progress-rate', type=float, default=2.0,
+                        help='maximum progress events per second per download')
+    parser.add_argument('--log-level', default='info', choices=['debug', 'info', 'warning', 'error'])
+    parser.add_argument('--log-json', action='store_true', help='write log messages as JSON lines')
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    configure_logging(args.log_level, args.log_json)
+    os.makedirs(args.output, exist_ok=True)
+
+    archive = DownloadArchive(args.archive or None) if args.archive is not None else None
+    staging = (StagingArea(args.staging_dir or None, args.staging_jobs)
+               if args.staging_dir is not None else None)
+    download_daemon = DownloadDaemon(None, args.output, archive, args.token)
+    engine = DownloadEngine(max_workers=max(1, args.jobs), per_host_limit=max(1, args.per_host),
+                            on_update=download_daemon.job_updated,
+                            on_progress=download_daemon.job_progress,
+                            progress_rate=args.progress_rate,
+                            merge_workers=max(0, args.merge_workers),
+                            bandwidth=BandwidthScheduler(args.limit_rate, args.rate_window),
+                            archive=archive, staging=staging,
+                            journal=None if args.no_journal else JobJournal(args.journal))
+    download_daemon.engine = engine
+    try:
+        server = DaemonServer(download_daemon, args.host, args.port).start()
+    except OSError as e:
+        print(f"error: can't listen on {args.host}:{args.port}: {e}", file=sys.stderr)
+        return 1
+    # Pay for yt_dlp now rather than on the first request
+    preload_yt_dlp()
+    engine.resume_unfinished()
+    log.info("listening", extra={'url': server.url, 'output': download_daemon.output})
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    try:
+        while not stop.wait(1.0):
+            pass
+    except KeyboardInterrupt:
+        pass
+    log.info("shutting down")
+    server.stop()
+    # Interrupted jobs are resumed from the journal on the next start
+    engine.shutdown()
+    engine.wait(timeout=10)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
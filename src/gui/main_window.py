@@ -1,28 +1,117 @@
 import os
 from PyQt6.QtWidgets import (QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
                             QLineEdit, QPushButton, QLabel, QProgressBar,
-                            QFileDialog, QMessageBox, QComboBox)
-from PyQt6.QtCore import Qt
+                            QFileDialog, QMessageBox, QComboBox, QTableWidget,
+                            QTableWidgetItem, QHeaderView, QAbstractItemView,
+                            QSpinBox, QDoubleSpinBox, QCheckBox, QApplication)
+from PyQt6.QtCore import Qt, QObject, QTimer, pyqtSignal
+from src.core.archive import DownloadArchive
+from src.core.clip import ClipRange, parse_timestamp
+from src.core.download_queue import JobState
 from src.core.downloader import DownloaderThread
-import re
+from src.core.engine import DownloadEngine
+from src.core.formats import CodecPolicy, FormatIndex
+from src.core.journal import JobJournal
+from src.core.parallel import MIB, ParallelOptions
+from src.core.progress import Phase
+from src.core.staging import StagingArea
+from src.core.cache import get_metadata_cache
+from src.core.playlist import is_playlist_url
+from src.core.prefetch import MetadataPrefetcher, find_video_urls
+from src.core.utils import clean_youtube_url, extract_video_id, get_app_dir
+
+
+def format_bytes(num):
+    for unit in ('B', 'KiB', 'MiB', 'GiB'):
+        if abs(num) < 1024:
+            return f"{num:.1f} {unit}"
+        num /= 1024
+    return f"{num:.1f} TiB"
+
+
+def progress_text(event):
+    """Render a ProgressEvent as a status line"""
+    if event.phase == Phase.EXTRACTING:
+        return "Fetching video information..."
+    if event.phase == Phase.PROCESSING:
+        return "Processing downloaded file..."
+    if event.phase == Phase.FINISHED:
+        return "Finished"
+    parts = []
+    if event.fraction is not None:
+        parts.append(f"{event.fraction * 100:.1f}%")
+    if event.speed:
+        parts.append(f"{format_bytes(event.speed)}/s")
+    if event.eta is not None:
+        minutes, seconds = divmod(int(event.eta), 60)
+        parts.append(f"ETA {minutes}:{seconds:02d}")
+    return "Downloading: " + ", ".join(parts) if parts else "Downloading..."
+
+
+# Typing pauses this long before the URL in the input box is prefetched
+PREFETCH_DELAY_MS = 400
+
+# Offered in playlist mode; each video gets the closest height it has at or below the choice
+PLAYLIST_HEIGHTS = [2160, 1440, 1080, 720, 480, 360]
+
+
+class QueueSignals(QObject):
+    """Carries queue updates from worker threads to the GUI thread"""
+    job_updated = pyqtSignal(int)
+    playlist_entry = pyqtSignal(int)
+
+
+class PrefetchSignals(QObject):
+    """Carries prefetch results (by video ID) from prefetch threads to the GUI thread"""
+    ready = pyqtSignal(str)
+    failed = pyqtSignal(str, str)
+
 
 class MainWindow(QMainWindow):
-    def __init__(self):
+    def __init__(self, resume=True):
         super().__init__()
         self.setWindowTitle("YouTube Video Downloader")
         self.setMinimumWidth(600)
         self.available_heights = []
         self.video_info = None
+        self.format_index = None
+        self.job_rows = {}
+        self.queue_signals = QueueSignals()
+        self.queue_signals.job_updated.connect(self.update_job_row)
+        self.queue_signals.playlist_entry.connect(self.show_playlist_progress)
+        on_update = lambda job, state: self.queue_signals.job_updated.emit(job.id)
+        on_progress = lambda job, event: self.queue_signals.job_updated.emit(job.id)
+        daemon_url = os.environ.get('YOUTUBE_DOWNLOADER_DAEMON')
+        self.daemon_url = daemon_url
+        if daemon_url:
+            # Just another client of a running daemon, which does the downloading
+            from src.core.remote import RemoteEngine
+            self.engine = RemoteEngine(daemon_url, on_update, on_progress,
+                                       token=os.environ.get('YOUTUBE_DOWNLOADER_TOKEN'))
+        else:
+            # Not the command line's journal: its jobs only resume with --resume
+            self.engine = DownloadEngine(on_update=on_update, on_progress=on_progress,
+                                         journal=JobJournal(os.path.join(get_app_dir(),
+                                                                         'gui_jobs.sqlite3')))
+        self.archive = DownloadArchive()
+        self.engine.archive = self.archive
+        self.staging = None  # StagingArea, created when first turned on
+        self.download_queue = self.engine.queue
+        # Video ID being checked with "Check Available Formats" through the prefetcher
+        self.checking_video_id = None
+        self.prefetch_signals = PrefetchSignals()
+        self.prefetch_signals.ready.connect(self.prefetch_ready)
+        self.prefetch_signals.failed.connect(self.prefetch_failed)
+        self.prefetcher = MetadataPrefetcher(on_ready=self.prefetch_signals.ready.emit,
+                                             on_failed=self.prefetch_signals.failed.emit)
         self.setup_ui()
+        # Pick up downloads that were still running when the app was last closed
+        if resume:
+            self.engine.resume_unfinished()
 
     def clean_youtube_url(self, url):
         """Remove playlist parameters from YouTube URL"""
-        # Extract video ID
-        video_id_match = re.search(r'(?:v=|/)([0-9A-Za-z_-]{11}).*', url)
-        if video_id_match:
-            video_id = video_id_match.group(1)
-            return f'https://www.youtube.com/watch?v={video_id}'
-        return url
+        return clean_youtube_url(url)
 
     def setup_ui(self):
         central_widget = QWidget()
@@ -41,13 +130,55 @@ class MainWindow(QMainWindow):
         self.check_formats_button = QPushButton("Check Available Formats")
         self.check_formats_button.clicked.connect(self.check_formats)
         url_layout.addWidget(self.check_formats_button)
+        self.playlist_checkbox = QCheckBox("Entire playlist/channel")
+        self.playlist_checkbox.setToolTip("Queue every video; downloads start while the "
+                                          "playlist is still being listed")
+        self.playlist_checkbox.toggled.connect(self.playlist_mode_changed)
+        url_layout.addWidget(self.playlist_checkbox)
+        self.url_input.textChanged.connect(
+            lambda text: self.playlist_checkbox.setChecked(
+                is_playlist_url(text.strip()) and not extract_video_id(text)))
+        # Extraction starts as soon as typing or pasting pauses, not on "Check"
+        self.prefetch_timer = QTimer(self)
+        self.prefetch_timer.setSingleShot(True)
+        self.prefetch_timer.setInterval(PREFETCH_DELAY_MS)
+        self.prefetch_timer.timeout.connect(self.prefetch_input)
+        self.url_input.textChanged.connect(self.prefetch_timer.start)
+        self.prefetch_clipboard_checkbox = QCheckBox("Prefetch copied links")
+        self.prefetch_clipboard_checkbox.setToolTip("Fetch video information for YouTube links "
+                                                    "copied to the clipboard before they are pasted")
+        self.prefetch_clipboard_checkbox.setChecked(True)
+        url_layout.addWidget(self.prefetch_clipboard_checkbox)
+        QApplication.clipboard().dataChanged.connect(self.prefetch_clipboard)
         
         # Quality selection
         quality_layout = QHBoxLayout()
         self.quality_combo = QComboBox()
         self.quality_combo.setEnabled(False)
+        self.quality_combo.currentIndexChanged.connect(self.update_selection_info)
         quality_layout.addWidget(QLabel("Select Resolution:"))
         quality_layout.addWidget(self.quality_combo)
+        self.codec_combo = QComboBox()
+        for policy, label in CodecPolicy.LABELS.items():
+            self.codec_combo.addItem(label, policy)
+        self.codec_combo.currentIndexChanged.connect(self.codec_policy_changed)
+        quality_layout.addWidget(QLabel("Codecs:"))
+        quality_layout.addWidget(self.codec_combo)
+        # Optional section of the video; empty downloads all of it
+        quality_layout.addWidget(QLabel("Clip:"))
+        self.clip_start_input = QLineEdit()
+        self.clip_start_input.setPlaceholderText("start")
+        self.clip_end_input = QLineEdit()
+        self.clip_end_input.setPlaceholderText("end")
+        for field in (self.clip_start_input, self.clip_end_input):
+            field.setToolTip("Download only this part of the video, e.g. 1:02:00 to 1:02:30")
+            field.setMaximumWidth(80)
+            field.textChanged.connect(self.update_selection_info)
+            quality_layout.addWidget(field)
+        self.precise_cuts_checkbox = QCheckBox("Precise cuts")
+        self.precise_cuts_checkbox.setToolTip("Re-encode the clip to cut exactly at the given "
+                                              "times instead of on the nearest keyframes")
+        quality_layout.addWidget(self.precise_cuts_checkbox)
         
         # Title input section
         title_layout = QHBoxLayout()
@@ -65,9 +196,18 @@ class MainWindow(QMainWindow):
         self.browse_button.clicked.connect(self.browse_location)
         location_layout.addWidget(self.location_input)
         location_layout.addWidget(self.browse_button)
+        self.staging_checkbox = QCheckBox("Download to local disk first")
+        self.staging_checkbox.setToolTip("Download and merge in a local folder and move only the "
+                                         "finished file here; faster for network drives")
+        self.staging_checkbox.toggled.connect(self.set_staging)
+        if self.daemon_url:
+            # Staging happens where the downloads run, i.e. in the daemon
+            self.staging_checkbox.setEnabled(False)
+            self.staging_checkbox.setToolTip("Set on the daemon with its --staging-dir option")
+        location_layout.addWidget(self.staging_checkbox)
 
         # Download button
-        self.download_button = QPushButton("Download")
+        self.download_button = QPushButton("Add to Queue")
         self.download_button.setFixedHeight(40)
         self.download_button.clicked.connect(self.start_download)
         self.download_button.setEnabled(False)
@@ -82,6 +222,56 @@ class MainWindow(QMainWindow):
         self.progress_bar.setAlignment(Qt.AlignmentFlag.AlignCenter)
         self.progress_label = QLabel()
 
+        # Download queue
+        self.queue_table = QTableWidget(0, 3)
+        self.queue_table.setHorizontalHeaderLabels(["File name", "Status", "Progress"])
+        self.queue_table.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
+        self.queue_table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.queue_table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.queue_table.verticalHeader().setVisible(False)
+
+        queue_buttons_layout = QHBoxLayout()
+        for label, handler in (("Pause", self.pause_selected),
+                               ("Resume", self.resume_selected),
+                               ("Cancel", self.cancel_selected),
+                               ("Move Up", lambda: self.change_selected_priority(1)),
+                               ("Move Down", lambda: self.change_selected_priority(-1)),
+                               ("Clear Finished", self.clear_finished)):
+            button = QPushButton(label)
+            button.clicked.connect(handler)
+            queue_buttons_layout.addWidget(button)
+        queue_buttons_layout.addStretch()
+        queue_buttons_layout.addWidget(QLabel("Parallel downloads:"))
+        self.workers_spin = QSpinBox()
+        self.workers_spin.setRange(1, 16)
+        self.workers_spin.setValue(self.download_queue.max_workers)
+        self.workers_spin.valueChanged.connect(self.download_queue.set_max_workers)
+        queue_buttons_layout.addWidget(self.workers_spin)
+        queue_buttons_layout.addWidget(QLabel("Connections per download:"))
+        self.connections_spin = QSpinBox()
+        self.connections_spin.setRange(1, 16)
+        self.connections_spin.setToolTip("1 downloads over a single connection; more split large "
+                                         "files into ranges and fetch fragments concurrently")
+        self.connections_spin.valueChanged.connect(self.set_connections)
+        self.connections_spin.setValue(4)
+        queue_buttons_layout.addWidget(self.connections_spin)
+        queue_buttons_layout.addWidget(QLabel("Speed limit:"))
+        self.rate_spin = QDoubleSpinBox()
+        self.rate_spin.setRange(0, 1000)
+        self.rate_spin.setDecimals(1)
+        self.rate_spin.setSuffix(" MiB/s")
+        self.rate_spin.setSpecialValueText("Unlimited")
+        self.rate_spin.setToolTip("Total bandwidth shared by all downloads")
+        self.rate_spin.valueChanged.connect(self.set_rate_limit)
+        queue_buttons_layout.addWidget(self.rate_spin)
+        self.skip_downloaded_checkbox = QCheckBox("Skip already downloaded")
+        self.skip_downloaded_checkbox.setToolTip("Don't download a video again in a format it was "
+                                                 "already downloaded in")
+        self.skip_downloaded_checkbox.setChecked(True)
+        self.skip_downloaded_checkbox.toggled.connect(
+            lambda enabled: setattr(self.engine, 'archive', self.archive if enabled else None))
+        queue_buttons_layout.addWidget(self.skip_downloaded_checkbox)
+
         # Add widgets to layout
         layout.addLayout(url_layout)
         layout.addLayout(quality_layout)
@@ -92,9 +282,9 @@ class MainWindow(QMainWindow):
         layout.addWidget(self.size_label)
         layout.addWidget(self.progress_bar)
         layout.addWidget(self.progress_label)
-
-        # Add stretcher at the bottom
-        layout.addStretch()
+        layout.addWidget(QLabel("Download queue:"))
+        layout.addWidget(self.queue_table)
+        layout.addLayout(queue_buttons_layout)
 
     def check_formats(self):
         url = self.clean_youtube_url(self.url_input.text().strip())
@@ -123,20 +313,144 @@ class MainWindow(QMainWindow):
         self.progress_bar.setValue(0)
         self.progress_label.setText("Fetching video information...")
 
-        # Create and start info thread
+        video_id = self.prefetcher.prefetch(url)
+        if video_id:
+            info = self.prefetcher.result(video_id)
+            if info is not None:
+                self.show_prefetched(info)
+            else:
+                # Already extracting (or queued first); prefetch_ready finishes the check
+                self.checking_video_id = video_id
+            return
+
+        # No video ID to prefetch by; extract in an info thread
         self.thread = DownloaderThread(url, save_path)
+        self.thread.codec_policy = self.codec_combo.currentData()
         self.thread.progress.connect(self.update_progress)
         self.thread.finished.connect(self.check_formats_finished)
         self.thread.info_retrieved.connect(self.show_video_info)
         self.thread.formats_retrieved.connect(self.update_formats)
         self.thread.start()
 
+    def prefetch_input(self):
+        """Prefetch the URL in the input box; several pasted links are all prefetched"""
+        urls = find_video_urls(self.url_input.text())
+        if len(urls) > 1:
+            # Keep the first to check now; the rest will be ready when they are pasted
+            for url in urls[1:]:
+                self.prefetcher.prefetch(url, urgent=False)
+            self.statusBar().showMessage(f"Prefetching {len(urls) - 1} more videos")
+            self.url_input.setText(urls[0])
+        if self.playlist_checkbox.isChecked() or not self.url_input.isEnabled():
+            return
+        url = self.clean_youtube_url(self.url_input.text().strip())
+        video_id = extract_video_id(url)
+        if not video_id or (self.video_info is not None and self.video_info.id == video_id):
+            return
+        if self.video_info is not None:
+            # The formats shown belong to the previous URL
+            self.clear_video_info()
+        self.prefetcher.prefetch(url)
+        info = self.prefetcher.result(video_id)
+        if info is not None:
+            self.show_prefetched(info)
+
+    def prefetch_clipboard(self):
+        if not self.prefetch_clipboard_checkbox.isChecked():
+            return
+        urls = find_video_urls(QApplication.clipboard().text())
+        for url in urls:
+            self.prefetcher.prefetch(url, urgent=False)
+        if urls:
+            self.statusBar().showMessage(f"Prefetching {len(urls)} copied videos")
+
+    def prefetch_ready(self, video_id):
+        if video_id == self.checking_video_id or (
+                self.video_info is None and self.url_input.isEnabled()
+                and not self.playlist_checkbox.isChecked()
+                and extract_video_id(self.url_input.text()) == video_id):
+            info = self.prefetcher.result(video_id)
+            if info is not None:
+                self.show_prefetched(info)
+
+    def prefetch_failed(self, video_id, message):
+        if video_id == self.checking_video_id:
+            self.checking_video_id = None
+            self.check_formats_finished(False, message)
+        elif extract_video_id(self.url_input.text()) == video_id:
+            # Not asked for yet: "Check Available Formats" retries and reports it
+            self.statusBar().showMessage(message)
+
+    def show_prefetched(self, info):
+        """Fill the form from prefetched info as if "Check Available Formats" had run"""
+        self.checking_video_id = None
+        self.set_video_info(info)
+        self.update_formats(self.format_index.heights(self.codec_combo.currentData()))
+        self.check_formats_finished(True, "Video information retrieved successfully")
+
     def update_formats(self, heights):
         self.available_heights = heights
         self.quality_combo.clear()
         
         for height in heights:
             self.quality_combo.addItem(f"{height}p", height)
+        self.update_selection_info()
+
+    def codec_policy_changed(self):
+        if self.format_index is None:
+            return
+        selected_height = self.quality_combo.currentData()
+        self.update_formats(self.format_index.heights(self.codec_combo.currentData()))
+        index = self.quality_combo.findData(selected_height)
+        if index >= 0:
+            self.quality_combo.setCurrentIndex(index)
+
+    def update_selection_info(self):
+        """Show the formats that would be downloaded with their projected cost"""
+        selected_height = self.quality_combo.currentData()
+        try:
+            clip = self.clip_range()
+        except ValueError:
+            clip = None
+        selection = None
+        if self.format_index is not None and selected_height:
+            # Clips are cut from seekable formats only, as download_video picks them
+            index = FormatIndex(self.video_info, seekable=True) if clip else self.format_index
+            selection = index.select(selected_height, self.codec_combo.currentData())
+            if selection is None and clip:
+                self.resolution_label.setText("No format at this resolution can be clipped")
+                self.size_label.setText("")
+                return
+        if selection is None:
+            self.resolution_label.setText("")
+            self.size_label.setText("")
+            return
+        self.resolution_label.setText(f"Formats: {selection.describe()}")
+        total_bytes = selection.total_bytes
+        if clip is not None and total_bytes and self.video_info.duration:
+            # Only the clip's share of the streams is fetched
+            total_bytes *= min(clip.duration / self.video_info.duration, 1.0)
+        size = format_bytes(total_bytes) if total_bytes else "unknown"
+        if selection.needs_merge:
+            merge = f"stream copy merge, ~{selection.merge_seconds:.1f}s"
+        else:
+            merge = "no merge needed"
+        self.size_label.setText(f"Estimated size: {size} ({merge})")
+
+    def clip_range(self):
+        """The section entered next to the resolution, or None for the whole video"""
+        start = self.clip_start_input.text().strip()
+        end = self.clip_end_input.text().strip()
+        if not start and not end:
+            return None
+        duration = self.video_info.duration if self.video_info else None
+        if not end and not duration:
+            raise ValueError("Please enter the end of the clip")
+        clip = ClipRange(parse_timestamp(start or 0),
+                         parse_timestamp(end) if end else duration,
+                         self.precise_cuts_checkbox.isChecked())
+        clip.check(duration)
+        return clip
 
     def check_formats_finished(self, success, message):
         # Re-enable UI
@@ -152,13 +466,13 @@ class MainWindow(QMainWindow):
             # Reset progress only on success
             self.progress_bar.setValue(0)
             self.progress_label.setText("Ready to download")
+            stats = get_metadata_cache().stats()
+            self.statusBar().showMessage(
+                f"Metadata cache: {stats['hits']} hits, {stats['misses']} misses, "
+                f"{stats['saved_seconds']:.1f}s saved")
         else:
             # Reset all UI elements on error
-            self.quality_combo.setEnabled(False)
-            self.download_button.setEnabled(False)
-            self.title_input.setEnabled(False)
-            self.quality_combo.clear()
-            self.title_input.clear()
+            self.clear_video_info()
             self.progress_bar.setValue(0)
             self.progress_label.setText("")
             QMessageBox.warning(self, "Error", message)
@@ -168,7 +482,48 @@ class MainWindow(QMainWindow):
         if folder:
             self.location_input.setText(folder)
 
+    def playlist_mode_changed(self, enabled):
+        """Playlist entries are resolved one by one, so offer the usual heights up front"""
+        self.check_formats_button.setEnabled(not enabled)
+        self.title_input.setEnabled(False)
+        self.title_input.clear()
+        self.video_info = None
+        self.format_index = None
+        self.quality_combo.clear()
+        if enabled:
+            for height in PLAYLIST_HEIGHTS:
+                self.quality_combo.addItem(f"{height}p", height)
+            self.quality_combo.setCurrentIndex(PLAYLIST_HEIGHTS.index(1080))
+        self.quality_combo.setEnabled(enabled)
+        self.download_button.setEnabled(enabled)
+        # Clips are cut from single videos
+        for widget in (self.clip_start_input, self.clip_end_input, self.precise_cuts_checkbox):
+            widget.setEnabled(not enabled)
+
+    def start_playlist(self):
+        url = self.url_input.text().strip()
+        save_path = self.location_input.text().strip()
+        if not url or not save_path:
+            QMessageBox.warning(self, "Error", "Please enter a playlist URL and download location")
+            return
+        try:
+            self.engine.submit_playlist(
+                url, save_path, self.quality_combo.currentData(), self.codec_combo.currentData(),
+                on_entry=lambda expansion, job, entry: self.queue_signals.playlist_entry.emit(
+                    expansion.count))
+        except (OSError, RuntimeError) as e:
+            QMessageBox.warning(self, "Error", str(e))
+            return
+        self.statusBar().showMessage("Listing playlist...")
+        self.url_input.clear()
+
+    def show_playlist_progress(self, count):
+        self.statusBar().showMessage(f"Playlist: {count} videos queued")
+
     def start_download(self):
+        if self.playlist_checkbox.isChecked():
+            self.start_playlist()
+            return
         url = self.clean_youtube_url(self.url_input.text().strip())
         save_path = self.location_input.text().strip()
         selected_height = self.quality_combo.currentData()
@@ -186,65 +541,115 @@ class MainWindow(QMainWindow):
             QMessageBox.warning(self, "Error", "Please enter a file name")
             return
 
-        # Disable input while downloading
-        self.url_input.setEnabled(False)
-        self.check_formats_button.setEnabled(False)
-        self.location_input.setEnabled(False)
-        self.browse_button.setEnabled(False)
-        self.download_button.setEnabled(False)
+        try:
+            clip = self.clip_range()
+        except ValueError as e:
+            QMessageBox.warning(self, "Error", f"Invalid clip: {e}")
+            return
+
+        try:
+            self.engine.submit(url, save_path, selected_height, custom_title, info=self.video_info,
+                               codec_policy=self.codec_combo.currentData(), clip=clip)
+        except (OSError, RuntimeError) as e:
+            QMessageBox.warning(self, "Error", str(e))
+            return
+
+        # Clear the form so the next URL can be checked while this one downloads
+        self.url_input.clear()
+        self.clip_start_input.clear()
+        self.clip_end_input.clear()
+        self.clear_video_info()
+        self.progress_bar.setValue(0)
+        self.progress_label.setText("")
+
+    def clear_video_info(self):
+        self.quality_combo.clear()
+        self.title_input.clear()
         self.quality_combo.setEnabled(False)
+        self.download_button.setEnabled(False)
         self.title_input.setEnabled(False)
+        self.video_info = None
+        self.format_index = None
+        self.update_selection_info()
 
-        # Reset progress
-        self.progress_bar.setValue(0)
-        self.progress_label.setText("Starting download...")
+    def set_staging(self, enabled):
+        # Applies to jobs that start after the change; staged jobs still move when done
+        if enabled and self.staging is None:
+            self.staging = StagingArea()
+        self.engine.staging = self.staging if enabled else None
 
-        # Create and start download thread
-        self.thread = DownloaderThread(url, save_path, selected_height)
-        self.thread.info = self.video_info
-        self.thread.custom_title = custom_title
-        self.thread.progress.connect(self.update_progress)
-        self.thread.finished.connect(self.download_finished)
-        self.thread.start()
+    def set_rate_limit(self, mib_per_second):
+        # Takes effect immediately, including for running downloads
+        self.engine.bandwidth.set_limits(int(mib_per_second * MIB) if mib_per_second else None)
 
-    def show_video_info(self, info):
+    def set_connections(self, connections):
+        # Applies to jobs that start after the change
+        self.engine.parallel = ParallelOptions(connections=connections,
+                                               fragment_concurrency=connections) if connections > 1 else None
+
+    def update_job_row(self, job_id):
+        job = self.download_queue.get(job_id)
+        if job is None:
+            return
+        row = self.job_rows.get(job_id)
+        if row is None:
+            row = self.queue_table.rowCount()
+            self.queue_table.insertRow(row)
+            self.job_rows[job_id] = row
+            item = QTableWidgetItem(job.title)
+            item.setData(Qt.ItemDataRole.UserRole, job_id)
+            self.queue_table.setItem(row, 0, item)
+        self.queue_table.setItem(row, 1, QTableWidgetItem(job.state.capitalize()))
+        text = job.message or (progress_text(job.progress) if job.progress else '')
+        if job.state == JobState.COMPLETED and job.merge_seconds is not None:
+            text += f" (merged in {job.merge_seconds:.1f}s, {job.merge_cpu_seconds:.1f}s CPU)"
+        self.queue_table.setItem(row, 2, QTableWidgetItem(text))
+
+    def selected_job_ids(self):
+        rows = {index.row() for index in self.queue_table.selectedIndexes()}
+        return [self.queue_table.item(row, 0).data(Qt.ItemDataRole.UserRole) for row in rows]
+
+    def pause_selected(self):
+        for job_id in self.selected_job_ids():
+            self.download_queue.pause(job_id)
+
+    def resume_selected(self):
+        for job_id in self.selected_job_ids():
+            self.download_queue.resume(job_id)
+
+    def cancel_selected(self):
+        for job_id in self.selected_job_ids():
+            self.download_queue.cancel(job_id)
+
+    def change_selected_priority(self, delta):
+        for job_id in self.selected_job_ids():
+            job = self.download_queue.get(job_id)
+            if job:
+                self.download_queue.set_priority(job_id, job.priority + delta)
+
+    def clear_finished(self):
+        self.download_queue.remove_finished()
+        self.queue_table.setRowCount(0)
+        self.job_rows = {}
+        for job in self.download_queue.jobs():
+            self.update_job_row(job.id)
+
+    def closeEvent(self, event):
+        self.prefetcher.close()
+        self.engine.shutdown()
+        super().closeEvent(event)
+
+    def show_video_info(self, video_id):
+        # Kept by reference; only the ID crossed the thread boundary
+        self.set_video_info(self.thread.info)
+
+    def set_video_info(self, info):
         self.video_info = info
+        self.format_index = FormatIndex(info)
         # Set default title in the input field
-        self.title_input.setText(info['title'])
-
-    def update_progress(self, progress_text):
-        if "Downloading:" in progress_text and "%" in progress_text:
-            try:
-                percentage = float(progress_text.split('%')[0].split(':')[1].strip())
-                self.progress_bar.setValue(int(percentage))
-            except:
-                pass
-        self.progress_label.setText(progress_text)
-
-    def download_finished(self, success, message):
-        # Re-enable input
-        self.url_input.setEnabled(True)
-        self.check_formats_button.setEnabled(True)
-        self.location_input.setEnabled(True)
-        self.browse_button.setEnabled(True)
-        self.download_button.setEnabled(True)
-        self.quality_combo.setEnabled(True)
-        self.title_input.setEnabled(True)
+        self.title_input.setText(info.title or '')
 
-        if success:
-            QMessageBox.information(self, "Success", message)
-            self.url_input.clear()
-            self.quality_combo.clear()
-            self.title_input.clear()
-            self.quality_combo.setEnabled(False)
-            self.download_button.setEnabled(False)
-            self.title_input.setEnabled(False)
-            self.video_info = None
-        else:
-            QMessageBox.warning(self, "Error", message)
-
-        # Reset progress
-        self.progress_bar.setValue(0)
-        self.progress_label.setText("")
-        self.resolution_label.setText("")
-        self.size_label.setText("") 
\ No newline at end of file
+    def update_progress(self, event):
+        if event.fraction is not None:
+            self.progress_bar.setValue(int(event.fraction * 100))
+        self.progress_label.setText(progress_text(event))
@@ -1,36 +1,45 @@
 import sys
 import os
-from PyQt6.QtWidgets import QApplication
 
-# Add debug information
-print(f"Python executable: {sys.executable}")
-print(f"Current working directory: {os.getcwd()}")
-print(f"sys.path: {sys.path}")
-print("Attempting to import MainWindow...")
+# Allow running as `python src/main.py` as well as through run.py
+if __package__ in (None, ''):
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-try:
+
+def run_gui():
+    from PyQt6.QtCore import QTimer
+    from PyQt6.QtWidgets import QApplication
     from src.gui.main_window import MainWindow
-    print("MainWindow imported successfully")
-except Exception as e:
-    print(f"Error importing MainWindow: {str(e)}")
-    print(f"Exception type: {type(e)}")
-    import traceback
-    traceback.print_exc()
+    from src.core.engine import preload_yt_dlp
+
+    app = QApplication(sys.argv)
+    window = MainWindow()
+    window.show()
+    # yt_dlp is only needed once the user checks a URL; load it after the first paint
+    QTimer.singleShot(0, preload_yt_dlp)
+    sys.exit(app.exec())
+
 
 def main():
-    try:
-        print("Creating QApplication...")
-        app = QApplication(sys.argv)
-        print("Creating MainWindow...")
-        window = MainWindow()
-        print("Showing window...")
-        window.show()
-        print("Starting event loop...")
-        sys.exit(app.exec())
-    except Exception as e:
-        print(f"Error in main: {str(e)}")
-        import traceback
-        traceback.print_exc()
+    # YOUTUBE_DOWNLOADER_LOG=debug (or info, ...) turns on logging to stderr for the GUI too
+    from src.core.log import configure_logging
+    configure_logging(os.environ.get('YOUTUBE_DOWNLOADER_LOG', 'warning'))
+    # Merges run in worker processes, which frozen builds start by re-running this executable
+    import multiprocessing
+    multiprocessing.freeze_support()
+    # Any command line arguments select the headless batch mode, which never imports Qt
+    # (macOS Finder may pass a -psn_* process serial number to the app bundle)
+    if sys.argv[1:2] == ['daemon']:
+        from src.daemon import main as daemon_main
+        sys.exit(daemon_main(sys.argv[2:]))
+    if sys.argv[1:2] == ['worker']:
+        from src.worker import main as worker_main
+        sys.exit(worker_main(sys.argv[2:]))
+    if [arg for arg in sys.argv[1:] if not arg.startswith('-psn')]:
+        from src.cli import main as cli_main
+        sys.exit(cli_main())
+    run_gui()
+
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
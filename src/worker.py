@@ -0,0 +1,418 @@
+"""Worker mode: download jobs claimed from a shared queue.
+
+Any number of worker processes, on this machine or others, lease jobs from
+one SharedQueue, keep their leases alive with heartbeats while they work
+and report each finished output (path, host, timings) back to it. Jobs of
+a worker that dies are handed to another one once their lease runs out.
+
+    worker add URL... [-o DIR]     queue downloads
+    worker run [-p PROCESSES]      download until stopped
+    worker status [--items]        counts per state, or every job as JSON lines
+    worker serve [--port PORT]     coordinator API for workers on other machines
+
+``--queue`` is the queue's SQLite file (default:
+~/.youtube_downloader/work_queue.sqlite3), or for ``run``, ``add`` and
+``status`` the URL of a coordinator started with ``serve``. Each worker
+process has its own engine, so extraction, transfers and its merge pool
+are spread over all the processes and machines taking part. Never imports
+Qt.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from src.core.download_queue import JobState
+from src.core.engine import DownloadEngine, preload_yt_dlp
+from src.core.formats import CodecPolicy
+from src.core.log import configure_logging, get_logger
+from src.core.staging import DEFAULT_MAX_JOBS, StagingArea
+from src.core.utils import clean_youtube_url
+from src.core.work_queue import DEFAULT_LEASE_SECONDS, SharedQueue, open_queue
+
+DEFAULT_PORT = 8766
+
+log = get_logger('worker')
+
+
+class Worker:
+    """Keeps up to ``slots`` leased jobs running in a DownloadEngine.
+
+    Leases are renewed every third of ``lease_seconds``. A job whose lease
+    was lost (the queue gave it to someone else after a stall) is cancelled
+    here; on shutdown unfinished jobs are released so other workers can
+    take them straight away, continuing from the partial files if they
+    share the download directory.
+    """
+
+    def __init__(self, queue, engine=None, worker_id=None, slots=2,
+                 lease_seconds=DEFAULT_LEASE_SECONDS, poll_interval=2.0, exit_when_idle=False):
+        self.queue = queue
+        self.engine = engine
+        self.worker_id = worker_id or f'{socket.gethostname()}:{os.getpid()}'
+        self.slots = max(1, slots)
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.exit_when_idle = exit_when_idle
+        self.stopping = threading.Event()
+        self._items = {}  # engine job id -> WorkItem
+        self._lost = set()
+        self._lock = threading.RLock()
+        self._wake = threading.Event()
+
+    def job_updated(self, job, state):
+        if state not in JobState.FINAL:
+            return
+        with self._lock:
+            item = self._items.get(job.id)
+            lost = job.id in self._lost
+        if item is not None and not lost:
+            self._report(job, state, item)
+        # Only free the slot once the queue knows, so a retry can be leased again
+        with self._lock:
+            self._items.pop(job.id, None)
+            self._lost.discard(job.id)
+        self._wake.set()
+
+    def _report(self, job, state, item):
+        try:
+            if state in (JobState.COMPLETED, JobState.SKIPPED):
+                self.queue.complete(item.id, self.worker_id, job.output_path, job.message,
+                                    self._result(job))
+            elif state == JobState.FAILED:
+                self.queue.fail(item.id, self.worker_id, job.message)
+            else:
+                self.queue.release(item.id, self.worker_id)
+        except (OSError, RuntimeError) as e:
+            # The lease runs out and the job is tried again elsewhere
+            log.warning("couldn't report job", extra={'item': item.id, 'state': state,
+                                                      'error': str(e)})
+        log.info("job %s", state, extra={'item': item.id, 'url': item.url})
+
+    def _result(self, job):
+        result = {'host': socket.gethostname(),
+                  'spans': {name: round(seconds, 3) for name, seconds in job.spans.items()}}
+        if job.output_path and os.path.exists(job.output_path):
+            result['size'] = os.path.getsize(job.output_path)
+        if job.merge_seconds is not None:
+            result['merge_seconds'] = round(job.merge_seconds, 3)
+            result['merge_cpu_seconds'] = round(job.merge_cpu_seconds, 3)
+        return result
+
+    def run(self):
+        """Work until stopped; True if it ended because the queue ran dry (``exit_when_idle``)"""
+        idle = False
+        heartbeat = threading.Thread(target=self._heartbeat, daemon=True)
+        heartbeat.start()
+        try:
+            while not self.stopping.is_set():
+                self._wake.clear()
+                leased = self._lease()
+                with self._lock:
+                    busy = bool(self._items)
+                if self.exit_when_idle and not leased and not busy:
+                    idle = True
+                    break
+                self.engine.queue.remove_finished()
+                self._wake.wait(self.poll_interval)
+        finally:
+            self.stopping.set()
+            self._shutdown()
+        return idle
+
+    def stop(self):
+        self.stopping.set()
+        self._wake.set()
+
+    def _lease(self):
+        with self._lock:
+            free = self.slots - len(self._items)
+        if free <= 0:
+            return 0
+        try:
+            items = self.queue.lease(self.worker_id, free, self.lease_seconds)
+        except (OSError, RuntimeError) as e:
+            log.warning("couldn't lease jobs", extra={'error': str(e)})
+            return 0
+        for item in items:
+            # Held across submit so a job that fails at once still finds its item
+            with self._lock:
+                job = self.engine.submit(item.url, item.save_path, item.selected_height,
+                                         item.custom_title, item.priority,
+                                         codec_policy=item.codec_policy or CodecPolicy.COMPATIBLE)
+                self._items[job.id] = item
+            log.info("job leased", extra={'item': item.id, 'job': job.id, 'url': item.url,
+                                          'attempt': item.attempts})
+        return len(items)
+
+    def _heartbeat(self):
+        while not self.stopping.wait(self.lease_seconds / 3):
+            with self._lock:
+                held = {item.id: job_id for job_id, item in self._items.items()
+                        if job_id not in self._lost}
+            if not held:
+                continue
+            try:
+                lost = self.queue.heartbeat(self.worker_id, list(held), self.lease_seconds)
+            except (OSError, RuntimeError) as e:
+                log.warning("heartbeat failed", extra={'error': str(e)})
+                continue
+            for item_id in lost:
+                log.warning("lease lost, cancelling", extra={'item': item_id})
+                with self._lock:
+                    self._lost.add(held[item_id])
+                self.engine.queue.cancel(held[item_id])
+
+    def _shutdown(self):
+        self.engine.shutdown()
+        self.engine.wait(timeout=10)
+        with self._lock:
+            items, self._items = list(self._items.values()), {}
+        for item in items:
+            try:
+                self.queue.release(item.id, self.worker_id)
+            except (OSError, RuntimeError) as e:
+                log.warning("couldn't release job", extra={'item': item.id, 'error': str(e)})
+
+
+class _CoordinatorHandler(BaseHTTPRequestHandler):
+    """POST /add, /lease, /heartbeat, /complete, /fail, /release, /counts, /items"""
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        log.debug(format % args, extra={'client': self.client_address[0]})
+
+    def do_POST(self):
+        queue, token = self.server.queue, self.server.token
+        try:
+            if token and self.headers.get('Authorization') != f'Bearer {token}':
+                return self._send_json(401, {'error': "missing or wrong token"})
+            length = int(self.headers.get('Content-Length') or 0)
+            body = json.loads(self.rfile.read(length)) if length else {}
+            if not isinstance(body, dict):
+                raise ValueError("body must be a JSON object")
+            data = self._route(queue, self.path.rstrip('/'), body)
+        except (KeyError, TypeError, ValueError) as e:
+            return self._send_json(400, {'error': f"bad request: {e}"})
+        except Exception as e:
+            log.exception("request failed", extra={'path': self.path})
+            return self._send_json(500, {'error': str(e)})
+        if data is None:
+            return self._send_json(404, {'error': f"no route for POST {self.path}"})
+        self._send_json(200, data)
+
+    def _route(self, queue, path, body):
+        if path == '/add':
+            return {'id': queue.add(body['url'], body['save_path'], body.get('selected_height'),
+                                    body.get('custom_title'), int(body.get('priority') or 0),
+                                    body.get('codec_policy'))}
+        if path == '/lease':
+            items = queue.lease(body['worker'], int(body.get('limit') or 1),
+                                float(body.get('lease_seconds') or DEFAULT_LEASE_SECONDS))
+            return {'items': [item.as_dict() for item in items]}
+        if path == '/heartbeat':
+            return {'lost': queue.heartbeat(body['worker'], [int(i) for i in body['ids']],
+                                            float(body.get('lease_seconds') or
+                                                  DEFAULT_LEASE_SECONDS))}
+        if path == '/complete':
+            return {'ok': queue.complete(int(body['id']), body['worker'], body.get('output_path'),
+                                         body.get('message') or '', body.get('result'))}
+        if path == '/fail':
+            return {'ok': queue.fail(int(body['id']), body['worker'], body.get('message') or '',
+                                     body.get('retry', True))}
+        if path == '/release':
+            return {'ok': queue.release(int(body['id']), body['worker'])}
+        if path == '/counts':
+            return queue.counts()
+        if path == '/items':
+            return {'items': [item.as_dict() for item in queue.items(body.get('state'))]}
+        return None
+
+    def _send_json(self, status, data):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class CoordinatorServer:
+    """Serves a SharedQueue to workers on other machines (see QueueClient)"""
+
+    def __init__(self, queue, host='127.0.0.1', port=DEFAULT_PORT, token=None):
+        self._httpd = ThreadingHTTPServer((host, port), _CoordinatorHandler)
+        self._httpd.daemon_threads = True
+        self._httpd.queue = queue
+        self._httpd.token = token
+        self.port = self._httpd.server_address[1]
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return f'http://{self._httpd.server_address[0]}:{self.port}'
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='youtube-downloader worker',
+        description='Share downloads between worker processes and machines through a leased queue.')
+    parser.add_argument('--queue', metavar='FILE_OR_URL',
+                        help='queue file (default: ~/.youtube_downloader/work_queue.sqlite3) '
+                             'or the URL of a coordinator started with "worker serve"')
+    parser.add_argument('--token', default=os.environ.get('YOUTUBE_DOWNLOADER_TOKEN'),
+                        help='coordinator token (default: $YOUTUBE_DOWNLOADER_TOKEN)')
+    parser.add_argument('--log-level', default='info', choices=['debug', 'info', 'warning', 'error'])
+    parser.add_argument('--log-json', action='store_true', help='write log messages as JSON lines')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    add = commands.add_parser('add', help='queue downloads')
+    add.add_argument('urls', nargs='+')
+    add.add_argument('-o', '--output', default=os.getcwd(),
+                     help='download directory, as seen by the workers')
+    add.add_argument('--height', type=int, help='video height to download, e.g. 1080')
+    add.add_argument('--codec', choices=sorted(CodecPolicy.LABELS), default=CodecPolicy.COMPATIBLE)
+    add.add_argument('--priority', type=int, default=0)
+
+    run = commands.add_parser('run', help='download jobs from the queue until stopped')
+    run.add_argument('-p', '--processes', type=int, default=1,
+                     help='worker processes to start on this machine')
+    run.add_argument('-j', '--jobs', type=int, default=2, help='parallel downloads per process')
+    run.add_argument('--per-host', type=int, default=2,
+                     help='maximum parallel downloads from the same host per process')
+    run.add_argument('--merge-workers', type=int, default=1,
+                     help='merge processes per worker process (0 merges in the download worker)')
+    run.add_argument('--staging-dir', nargs='?', const='', metavar='DIR',
+                     help='download and merge on local disk, then move finished files to their '
+                          'destination (default DIR: ~/.youtube_downloader/staging)')
+    run.add_argument('--staging-jobs', type=int, default=DEFAULT_MAX_JOBS,
+                     help='jobs staged at once per process; further jobs write to their '
+                          'destination directly')
+    run.add_argument('--lease', type=float, default=DEFAULT_LEASE_SECONDS,
+                     help='seconds a job stays claimed without a heartbeat')
+    run.add_argument('--poll', type=float, default=2.0,
+                     help='seconds between checks for new jobs while the queue is empty')
+    run.add_argument('--exit-when-idle', action='store_true',
+                     help='stop once the queue has nothing left for this worker')
+
+    status = commands.add_parser('status', help='show how many jobs are in each state')
+    status.add_argument('--items', action='store_true',
+                        help='print every job with its output as JSON lines instead')
+
+    serve = commands.add_parser('serve', help='serve the queue file to workers on other machines')
+    serve.add_argument('--host', default='127.0.0.1',
+                       help='address to listen on (e.g. 0.0.0.0 to accept other machines)')
+    serve.add_argument('--port', type=int, default=DEFAULT_PORT)
+    return parser
+
+
+def run_worker(args):
+    """Body of one worker process; returns Worker.run's result"""
+    configure_logging(args.log_level, args.log_json)
+    queue = open_queue(args.queue, args.token)
+    worker = Worker(queue, slots=args.jobs, lease_seconds=args.lease, poll_interval=args.poll,
+                    exit_when_idle=args.exit_when_idle)
+    staging = (StagingArea(args.staging_dir or None, args.staging_jobs)
+               if args.staging_dir is not None else None)
+    worker.engine = DownloadEngine(max_workers=worker.slots, per_host_limit=max(1, args.per_host),
+                                   on_update=worker.job_updated,
+                                   merge_workers=max(0, args.merge_workers), staging=staging)
+    # Finish up cleanly: running jobs are released for other workers
+    signal.signal(signal.SIGTERM, lambda *_: worker.stop())
+    preload_yt_dlp()
+    log.info("worker started", extra={'worker': worker.worker_id, 'slots': worker.slots})
+    try:
+        return worker.run()
+    except KeyboardInterrupt:
+        worker.stop()
+        return False
+
+
+def _worker_process(args):
+    # Ctrl+C reaches the whole process group; the parent stops its children with SIGTERM
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    run_worker(args)
+
+
+def run_workers(args):
+    if args.processes <= 1:
+        run_worker(args)
+        return 0
+    processes = [multiprocessing.Process(target=_worker_process, args=(args,))
+                 for _ in range(args.processes - 1)]
+    for process in processes:
+        process.start()
+    try:
+        if run_worker(args):
+            # The others finish what they are working on, then find the queue empty too
+            for process in processes:
+                process.join()
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+        for process in processes:
+            process.join()
+    return 0
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    configure_logging(args.log_level, args.log_json)
+    if args.command == 'run':
+        return run_workers(args)
+    if args.command == 'serve':
+        if args.queue and args.queue.startswith(('http://', 'https://')):
+            print("error: serve needs a queue file, not a URL", file=sys.stderr)
+            return 2
+        queue = SharedQueue(args.queue)
+        try:
+            server = CoordinatorServer(queue, args.host, args.port, args.token).start()
+        except OSError as e:
+            print(f"error: can't listen on {args.host}:{args.port}: {e}", file=sys.stderr)
+            return 1
+        log.info("coordinator listening", extra={'url': server.url, 'queue': queue.path})
+        stop = threading.Event()
+        signal.signal(signal.SIGTERM, lambda *_: stop.set())
+        try:
+            while not stop.wait(1.0):
+                pass
+        except KeyboardInterrupt:
+            pass
+        server.stop()
+        return 0
+
+    queue = open_queue(args.queue, args.token)
+    try:
+        if args.command == 'add':
+            output = os.path.abspath(args.output)
+            for url in args.urls:
+                item_id = queue.add(clean_youtube_url(url), output, args.height,
+                                    priority=args.priority, codec_policy=args.codec)
+                print(json.dumps({'event': 'queued', 'id': item_id, 'url': url}))
+        elif args.items:
+            for item in queue.items():
+                print(json.dumps(item.as_dict(), ensure_ascii=False))
+        else:
+            print(json.dumps(queue.counts()))
+    except (OSError, RuntimeError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())